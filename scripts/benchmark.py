@@ -0,0 +1,397 @@
+"""
+Benchmarks Strutil chunking and post-processing on synthetic documents, and
+how long textaur takes to import.
+
+Generates screenplays and generic texts of the given sizes (with scene
+headings, transitions, page numbers and OCR noise), then times and measures
+the peak memory of chunk_screenplay_text, chunk_generic_text,
+chunk_strs_by_char_count and remove_consecutive_blank_lines on them. Imports
+are timed in a fresh interpreter each time, since that's what every call of
+the textaur command pays before doing anything.
+
+    python scripts/benchmark.py --sizes 1,10,100 --save baseline.json
+    python scripts/benchmark.py --sizes 1,10,100 --baseline baseline.json
+    python scripts/benchmark.py --imports-only --baseline baseline.json
+
+Results can be saved to json and compared against a saved baseline. Any
+benchmark that got slower or used more memory than the baseline by more than
+the threshold is flagged, and the script exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src"))
+sys.path.insert(0, SRC_DIR)
+from textaur.core.strutil import Strutil, SCENE_HEADING_KEYWORDS, SCENE_TRANSITION_KEYWORDS
+
+# document sizes to benchmark by default, in MB (up to 500 can be given)
+DEFAULT_SIZES_MB = [1, 10, 100]
+
+# times each benchmark is timed; the fastest run is kept
+DEFAULT_REPEATS = 3
+
+# fraction a benchmark can be slower (or use more memory) than the baseline
+# before it's flagged as a regression
+DEFAULT_THRESHOLD = 0.2
+
+# differences in time smaller than this many seconds are never flagged, since
+# the smallest benchmarks are that noisy from run to run
+MIN_SECONDS_DELTA = 0.01
+
+# modules whose import time is benchmarked
+IMPORT_MODULES = ["textaur.cli.main", "textaur.core.pipeline"]
+
+# least number of times each import is timed; an import takes a fraction of a
+# second, so it takes more runs than chunking for the fastest to settle
+MIN_IMPORT_REPEATS = 10
+
+# run in a fresh interpreter to time an import: prints the seconds it took and,
+# when asked to trace, the peak memory it allocated in bytes
+IMPORT_SCRIPT = """
+import importlib, sys, time, tracemalloc
+if sys.argv[2] == "trace":
+    tracemalloc.start()
+start = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(time.perf_counter() - start, tracemalloc.get_traced_memory()[1])
+"""
+
+# number of distinct pages generated per document; pages are then repeated in
+# random order up to the document size, so big documents are quick to build
+PAGE_POOL_SIZE = 200
+
+# lines per page in generated documents
+LINES_PER_PAGE = 55
+
+# chance of a generated line getting OCR noise
+OCR_NOISE_RATE = 0.05
+
+WORDS = (
+    "the a of and to in is was he she they it that with for on as at by from "
+    "his her but not what all were when we there can an your which their said "
+    "if do will each about how up out them then many some so these would other "
+    "into has more two like him see time could no make than first been its who "
+    "now people my made over did down only way find use may water long little "
+    "very after words called just where most know get through back much before "
+    "go good new write our used me man too any day same right look think also "
+    "around another came come work three word must because does part even place"
+).split()
+
+NAMES = ["SARAH", "MIKE", "DETECTIVE REYES", "ANNA", "THE DOCTOR", "JONAS", "MOM"]
+
+PLACES = ["KITCHEN", "POLICE STATION", "CAR - MOVING", "HOSPITAL ROOM",
+          "ROOFTOP", "DINER", "FOREST", "APARTMENT HALLWAY"]
+
+TIMES = ["DAY", "NIGHT", "CONTINUOUS", "LATER", "MORNING"]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    """
+    Returns a sentence of random words.
+
+    :param rng
+    Random number generator.
+
+    :param words
+    Number of words in the sentence.
+    """
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return f"{text[0].upper()}{text[1:]}."
+
+
+def add_ocr_noise(rng: random.Random, line: str) -> str:
+    """
+    Returns the line with the kind of damage OCR does: misread characters,
+    stray spaces, broken words and specks read as punctuation.
+
+    :param rng
+    Random number generator.
+
+    :param line
+    Line to add noise to.
+    """
+    match rng.randrange(5):
+        case 0:
+            return line.replace("l", "1").replace("O", "0").replace("m", "rn")
+        case 1:
+            return f"{' ' * rng.randrange(1, 12)}{line}{' ' * rng.randrange(3)}"
+        case 2:
+            cut = rng.randrange(len(line) + 1)
+            return f"{line[:cut]}-\n{line[cut:]}"
+        case 3:
+            return f"{rng.choice(['.', ',', '_', '~', ''])}\n{line}"
+        case _:
+            return f"{line}\n{' ' * rng.randrange(4)}\n\n"
+
+
+def screenplay_page(rng: random.Random, number: int) -> str:
+    """
+    Returns a page of a screenplay, ending in its page number.
+
+    :param rng
+    Random number generator.
+
+    :param number
+    Page number.
+    """
+    lines = []
+    while len(lines) < LINES_PER_PAGE:
+        match rng.randrange(10):
+            case 0:
+                prefix = rng.choice(SCENE_HEADING_KEYWORDS).strip()
+                lines += ["", f"{prefix} {rng.choice(PLACES)} - {rng.choice(TIMES)}", ""]
+            case 1:
+                lines += ["", f"{' ' * 40}{rng.choice(SCENE_TRANSITION_KEYWORDS)}", ""]
+            case 2 | 3 | 4:
+                lines += [sentence(rng, rng.randrange(8, 16)) for _ in range(rng.randrange(1, 4))]
+                lines.append("")
+            case _:
+                lines.append(f"{' ' * 20}{rng.choice(NAMES)}")
+                lines += [f"{' ' * 10}{sentence(rng, rng.randrange(4, 9))}"
+                          for _ in range(rng.randrange(1, 4))]
+                lines.append("")
+    lines = [add_ocr_noise(rng, l) if l and rng.random() < OCR_NOISE_RATE else l
+             for l in lines]
+    return "\n".join(lines) + f"\n\n{' ' * 60}{number}.\n"
+
+
+def generic_page(rng: random.Random, number: int) -> str:
+    """
+    Returns a page of prose paragraphs, ending in its page number.
+
+    :param rng
+    Random number generator.
+
+    :param number
+    Page number.
+    """
+    lines = []
+    while len(lines) < LINES_PER_PAGE:
+        lines += [sentence(rng, rng.randrange(10, 18)) for _ in range(rng.randrange(2, 8))]
+        lines += [""] * rng.choice([1, 1, 1, 2, 3])
+    lines = [add_ocr_noise(rng, l) if l and rng.random() < OCR_NOISE_RATE else l
+             for l in lines]
+    return "\n".join(lines) + f"\n{number}\n"
+
+
+def generate(kind: str, size: int, seed: int = 0) -> str:
+    """
+    Returns a synthetic document of about size characters. The same kind, size
+    and seed always give the same document.
+
+    :param kind
+    "screenplay" or "generic".
+
+    :param size
+    Number of characters to generate.
+
+    :param seed
+    Seed for the random number generator.
+    """
+    rng = random.Random(f"{kind}-{seed}")
+    page_fn = screenplay_page if kind == "screenplay" else generic_page
+    pool = [page_fn(rng, number + 1) for number in range(PAGE_POOL_SIZE)]
+    average = sum(len(page) for page in pool) / len(pool)
+    pages = rng.choices(pool, k=max(1, round(size / average)))
+    return "".join(pages)
+
+
+def measure(fn, repeats: int) -> dict:
+    """
+    Runs fn repeats times and returns the fastest time in seconds, then runs
+    it once more with tracemalloc on and returns the peak memory it allocated
+    in MB (tracemalloc slows things down, so it's kept out of the timings).
+
+    :param fn
+    Function to benchmark.
+
+    :param repeats
+    Number of timed runs.
+    """
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_mb": peak / (1024 * 1024)}
+
+
+def measure_import(module: str, repeats: int) -> dict:
+    """
+    Imports the module in a fresh interpreter repeats times and returns the
+    fastest time in seconds, then once more with tracemalloc on and returns
+    the peak memory the import allocated in MB.
+
+    :param module
+    Name of the module to import.
+
+    :param repeats
+    Number of timed imports.
+    """
+    def import_once(mode: str) -> tuple[float, int]:
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, module, mode],
+            env={**os.environ, "PYTHONPATH": SRC_DIR},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        return float(out[0]), int(out[1])
+
+    seconds = min(import_once("time")[0] for _ in range(repeats))
+    _, peak = import_once("trace")
+    return {"seconds": seconds, "peak_mb": peak / (1024 * 1024)}
+
+
+def run_imports(repeats: int, log=print) -> dict:
+    """
+    Times the import of every module in IMPORT_MODULES and returns the
+    results keyed by "import/<module>".
+
+    :param repeats
+    Number of timed imports of each module (at least MIN_IMPORT_REPEATS).
+
+    :param log
+    Function to use for logging.
+    """
+    results = {}
+    for module in IMPORT_MODULES:
+        key = f"import/{module}"
+        results[key] = measure_import(module, max(repeats, MIN_IMPORT_REPEATS))
+        log(f"{key:<45}{results[key]['seconds']:>9.3f}s{results[key]['peak_mb']:>10.1f}MB")
+    return results
+
+
+def run(sizes_mb: list[float], repeats: int, log=print) -> dict:
+    """
+    Runs every benchmark at every size and returns the results keyed by
+    "<benchmark>/<size>MB".
+
+    :param sizes_mb
+    Document sizes to benchmark, in MB.
+
+    :param repeats
+    Number of timed runs of each benchmark.
+
+    :param log
+    Function to use for logging.
+    """
+    strutil = Strutil(log=lambda msg: None)
+    results = {}
+    for size_mb in sizes_mb:
+        size = int(size_mb * 1024 * 1024)
+        screenplay = generate("screenplay", size)
+        generic = generate("generic", size)
+        paragraphs = generic.split("\n\n")
+        benchmarks = {
+            "chunk_screenplay_text": lambda: strutil.chunk_screenplay_text(screenplay),
+            "chunk_generic_text": lambda: strutil.chunk_generic_text(generic),
+            "chunk_strs_by_char_count": lambda: strutil.chunk_strs_by_char_count(paragraphs),
+            "remove_consecutive_blank_lines": lambda: strutil.remove_consecutive_blank_lines(generic),
+        }
+        for name, fn in benchmarks.items():
+            key = f"{name}/{size_mb:g}MB"
+            results[key] = measure(fn, repeats)
+            log(f"{key:<45}{results[key]['seconds']:>9.3f}s{results[key]['peak_mb']:>10.1f}MB")
+        del screenplay, generic, paragraphs
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Returns a description of every benchmark that's slower or uses more memory
+    than in the baseline by more than the threshold. Benchmarks missing from
+    either side are skipped.
+
+    :param results
+    Results of this run.
+
+    :param baseline
+    Results of the baseline run.
+
+    :param threshold
+    Fraction a measurement can grow by before it's flagged.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            before, after = baseline[key][metric], result[metric]
+            if metric == "seconds" and after - before < MIN_SECONDS_DELTA:
+                continue
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append(
+                    f"{key} {metric}: {before:.3f} -> {after:.3f} (+{after / before - 1:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES_MB),
+        help="Comma separated document sizes in MB (default: %(default)s)")
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=DEFAULT_REPEATS,
+        help="Timed runs of each benchmark; the fastest is kept (default: %(default)s)")
+    parser.add_argument(
+        "--save",
+        help="Save the results to this json file")
+    parser.add_argument(
+        "--baseline",
+        help="Compare the results against this json file saved with --save")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Fraction slower or bigger than the baseline to flag as a regression (default: %(default)s)")
+    parser.add_argument(
+        "--imports-only",
+        action="store_true",
+        help="Only benchmark import times, not chunking")
+    args = parser.parse_args()
+
+    results = run_imports(max(1, args.repeats))
+    if not args.imports_only:
+        sizes_mb = [float(size) for size in args.sizes.split(",")]
+        results.update(run(sizes_mb, max(1, args.repeats)))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+        print(f"Saved results to: {args.save}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%} of {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Load tests the linting pipeline against a simulated LLM.
+
+Starts a local LLMSimulator, runs a synthetic document (see benchmark.py)
+through Pipeline.run against it and reports throughput and chunk latency:
+
+    python scripts/load_test.py --size 5 --latency 2 --rate-limit-rate 0.05
+
+Chunk latency is measured from the moment a chunk is handed to the linter
+until it comes back linted, so it includes waiting for a request slot and
+retries. No API key, network or money needed, and runs with the same seed
+send the same responses.
+
+With --serve, just runs the simulator until stopped, to point
+textaur --base-url at.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from textaur.core.context import Context
+from textaur.core.pipeline import Pipeline
+from textaur.core.simulator import (
+    LLMSimulator,
+    LATENCY_DISTRIBUTIONS,
+    DEFAULT_LATENCY,
+    DEFAULT_LATENCY_SPREAD,
+)
+from textaur.core.ai_linter import (
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_STALL_TIMEOUT,
+)
+from textaur.core.metrics import Metrics, percentile
+from benchmark import generate
+
+
+def make_simulator(args) -> LLMSimulator:
+    return LLMSimulator(
+        latency=args.latency,
+        latency_distribution=args.distribution,
+        latency_spread=args.spread,
+        seconds_per_output_token=args.seconds_per_token,
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        requests_per_minute=args.server_rpm,
+        tokens_per_minute=args.server_tpm,
+        output_ratio=args.output_ratio,
+        stall_rate=args.stall_rate,
+        truncation_rate=args.truncation_rate,
+        max_output_tokens=args.max_output_tokens,
+        seed=args.seed,
+    )
+
+
+async def load_test(args) -> None:
+    simulator = make_simulator(args)
+    async with simulator:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_file = Path(tmp) / f"load_test_{args.mode}.txt"
+            input_file.write_text(generate(args.mode, int(args.size * 1024 * 1024), args.seed))
+            context = Context(
+                input_file=input_file,
+                output_path=None,
+                extracted_text_path=None,
+                use_ocr=False,
+                no_lint=False,
+                mode="sp" if args.mode == "screenplay" else "t",
+                custom_prompt_path=None,
+                progress_fn=lambda msg: None,
+                log=lambda msg: None,
+                confirm=lambda msg: True,
+            )
+            # the simulator doesn't check keys, but the linter wants one
+            os.environ.setdefault("OPENAI_API_KEY", "simulated")
+            metrics = Metrics()
+            pipeline = Pipeline(
+                log=lambda msg: None,
+                progress_fn=lambda msg: None,
+                max_concurrent_requests=args.max_requests,
+                tokens_per_minute=args.tokens_per_minute,
+                max_retries=args.max_retries,
+                use_cache=False,
+                base_url=simulator.base_url,
+                stream_responses=args.stream_responses,
+                stall_timeout=args.stall_timeout,
+                metrics=metrics,
+            )
+            latencies = []
+            lint_text = pipeline.ai.lint_text
+
+            async def timed_lint_text(text, linting_prompt):
+                start = time.perf_counter()
+                linted = await lint_text(text, linting_prompt)
+                latencies.append(time.perf_counter() - start)
+                return linted
+
+            pipeline.ai.lint_text = timed_lint_text
+            start = time.perf_counter()
+            summary = await pipeline.run(context)
+            seconds = time.perf_counter() - start
+
+    print(f"chunks:          {summary.chunk_count} ({summary.failed_count} failed)")
+    print(f"wall time:       {seconds:.2f}s")
+    print(f"throughput:      {len(latencies) / seconds:.2f} chunks/sec")
+    if latencies:
+        latencies.sort()
+        print(f"chunk latency:   p50 {percentile(latencies, 50):.3f}s  "
+              f"p95 {percentile(latencies, 95):.3f}s  "
+              f"p99 {percentile(latencies, 99):.3f}s  "
+              f"mean {statistics.fmean(latencies):.3f}s")
+    first_tokens = sorted(metrics.timings.get("lint.time_to_first_token", []))
+    if first_tokens:
+        print(f"first token:     p50 {percentile(first_tokens, 50):.3f}s  "
+              f"p95 {percentile(first_tokens, 95):.3f}s  "
+              f"p99 {percentile(first_tokens, 99):.3f}s  "
+              f"({metrics.counts['lint.stalls']} stalled)")
+    if metrics.counts["lint.truncated"]:
+        print(f"truncated:       {metrics.counts['lint.truncated']} responses, "
+              f"{metrics.counts['lint.truncation_splits']} splits")
+    responses = ", ".join(f"{status}: {count}" for status, count in sorted(simulator.responses.items()))
+    print(f"responses:       {responses}")
+    print(f"max in flight:   {simulator.max_in_flight}")
+
+
+async def serve(args) -> None:
+    simulator = make_simulator(args)
+    await simulator.start(port=args.port)
+    print(f"Simulating an LLM at {simulator.base_url} (Ctrl-C to stop)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--size", type=float, default=1,
+        help="Size of the synthetic document in MB (default: %(default)s)")
+    parser.add_argument("--mode", choices=["generic", "screenplay"], default="generic",
+        help="Kind of synthetic document (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+        help="Seed for the document and the simulator (default: %(default)s)")
+    simulated = parser.add_argument_group("simulated LLM")
+    simulated.add_argument("--latency", type=float, default=DEFAULT_LATENCY,
+        help="Mean seconds per response (default: %(default)s)")
+    simulated.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal",
+        help="Latency distribution (default: %(default)s)")
+    simulated.add_argument("--spread", type=float, default=DEFAULT_LATENCY_SPREAD,
+        help="Latency spread: lognormal sigma, or fraction either side of the mean for uniform (default: %(default)s)")
+    simulated.add_argument("--seconds-per-token", type=float, default=0.0,
+        help="Extra seconds per output token (default: %(default)s)")
+    simulated.add_argument("--rate-limit-rate", type=float, default=0.0,
+        help="Chance of a random 429 (default: %(default)s)")
+    simulated.add_argument("--server-error-rate", type=float, default=0.0,
+        help="Chance of a random 5xx (default: %(default)s)")
+    simulated.add_argument("--server-rpm", type=int,
+        help="Requests per minute the simulator allows before answering 429")
+    simulated.add_argument("--server-tpm", type=int,
+        help="Tokens per minute the simulator allows before answering 429")
+    simulated.add_argument("--output-ratio", type=float, default=1.0,
+        help="Output length relative to input (default: %(default)s)")
+    simulated.add_argument("--truncation-rate", type=float, default=0.0,
+        help="Chance of cutting a response in half with finish_reason length (default: %(default)s)")
+    simulated.add_argument("--max-output-tokens", type=int,
+        help="Output limit; longer responses are cut off with finish_reason length")
+    simulated.add_argument("--stall-rate", type=float, default=0.0,
+        help="Chance of a streamed response stalling halfway (default: %(default)s)")
+    client = parser.add_argument_group("linter")
+    client.add_argument("--max-requests", type=int, default=DEFAULT_MAX_CONCURRENT_REQUESTS,
+        help="Maximum requests in flight (default: %(default)s)")
+    client.add_argument("--tokens-per-minute", type=int,
+        help="Tokens per minute the linter holds itself to")
+    client.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+        help="Retries per chunk (default: %(default)s)")
+    client.add_argument("--stream-responses", action="store_true",
+        help="Stream responses, and report time to first token")
+    client.add_argument("--stall-timeout", type=float, default=DEFAULT_STALL_TIMEOUT,
+        help="Seconds without output before a streamed response is retried (default: %(default)s)")
+    parser.add_argument("--serve", action="store_true",
+        help="Only run the simulator, until stopped")
+    parser.add_argument("--port", type=int, default=8000,
+        help="Port for --serve (default: %(default)s)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args) if args.serve else load_test(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
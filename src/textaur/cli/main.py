@@ -3,25 +3,89 @@ CLI entrypoint for textaur.
 """
 
 import click
-from ..core.context import Context, modes
+from ..core.context import (
+    Context,
+    modes,
+    DEFAULT_LINTED_SUFFIX,
+    DEFAULT_EXTRACTED_SUFFIX,
+    DEFAULT_FAILED_CHUNKS_SUFFIX,
+    DEFAULT_JOURNAL_SUFFIX,
+    DEFAULT_STATS_SUFFIX,
+)
 from ..core.pipeline import Pipeline
+from ..core.textifier import DEFAULT_OCR_WINDOW
+from ..core.cache import DEFAULT_CACHE_MAX_BYTES
+from ..core.ai_linter import (
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_STALL_TIMEOUT,
+)
+from ..core.writer import PARTIAL_SUFFIX
+from ..core.metrics import Metrics
+from pathlib import Path
+from typing import Optional
 import asyncio
+import glob
+import os
+
+# suffixes of files picked up from directories given as input
+INPUT_SUFFIXES = {".pdf", ".txt", ".fountain"}
+
+# endings of files textaur writes, skipped when picking up files from directories
+OUTPUT_ENDINGS = (
+    DEFAULT_LINTED_SUFFIX,
+    DEFAULT_EXTRACTED_SUFFIX,
+    DEFAULT_FAILED_CHUNKS_SUFFIX,
+    DEFAULT_JOURNAL_SUFFIX,
+    DEFAULT_STATS_SUFFIX,
+    PARTIAL_SUFFIX,
+)
+
+# file stats of a batch of input files are written to by default
+DEFAULT_BATCH_STATS_FILE = "textaur_stats.json"
 
 
 @click.command()
-@click.argument("input_file", type=click.Path(exists=True, readable=True))
+@click.argument("input_files", nargs=-1, required=True)
 @click.option(
     "-o", "--output",
     type=click.Path(),
-    help="Save linted output to this file instead of default")
+    help="Save linted output to this file instead of default (single input file only)")
 @click.option(
     "--extracted-text",
     type=click.Path(),
-    help="Save extracted unlinted text to this file instead of default")
+    help="Save extracted unlinted text to this file instead of default (single input file only)")
 @click.option(
     "--ocr",
     is_flag=True,
     help="Use optical character recognition to extract text from pdf instead of direct text extraction")
+@click.option(
+    "--auto-ocr",
+    is_flag=True,
+    help="Extract text from pdf directly and use optical character recognition only for pages without a usable text layer")
+@click.option(
+    "--ocr-workers",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="Number of processes to spread OCR across")
+@click.option(
+    "--ocr-window",
+    type=click.IntRange(min=1),
+    default=DEFAULT_OCR_WINDOW,
+    show_default=True,
+    help="Maximum number of rendered pages to hold in memory at once during OCR (about 25MB each); lower it if OCR runs out of memory")
+@click.option(
+    "--extract-workers",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="Number of processes to spread direct pdf text extraction (without --ocr) across")
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Start linting pdf pages as soon as they are extracted instead of waiting for the whole document")
 @click.option(
     "--no-lint",
     is_flag=True,
@@ -34,33 +98,256 @@ import asyncio
     "--prompt",
     type=click.Path(exists=True, readable=True),
     help="File to use as custom ai linting prompt")
-def main(input_file, output, extracted_text, ocr, no_lint, mode, prompt):
-    """textaur cli: ai-powered linting for pdf and text files"""
+@click.option(
+    "--chunk-tokens",
+    type=click.IntRange(min=1),
+    help="Maximum number of tokens per piece sent for linting, counted with the linting model's tokenizer (defaults to a character-based size)")
+@click.option(
+    "--adaptive-chunks",
+    is_flag=True,
+    help="Learn the size of the pieces sent for linting from the latency, output length and failures of earlier runs, per model and mode (ignored with --chunk-tokens)")
+@click.option(
+    "--base-url",
+    help="Send linting requests to this OpenAI-compatible API instead of OpenAI's (eg a local server)")
+@click.option(
+    "--max-requests",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_CONCURRENT_REQUESTS,
+    show_default=True,
+    help="Maximum number of linting requests in flight at the same time")
+@click.option(
+    "--tokens-per-minute",
+    type=click.IntRange(min=1),
+    help="Maximum number of tokens to send to the linting model per minute (match your account's rate limit)")
+@click.option(
+    "--max-connections",
+    type=click.IntRange(min=1),
+    help="Maximum number of pooled connections to the linting API (defaults to --max-requests)")
+@click.option(
+    "--request-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_REQUEST_TIMEOUT,
+    show_default=True,
+    help="Seconds to wait for a single linting request")
+@click.option(
+    "--max-retries",
+    type=click.IntRange(min=0),
+    default=DEFAULT_MAX_RETRIES,
+    show_default=True,
+    help="Times to retry a chunk after a rate limit, server error or timeout")
+@click.option(
+    "--stream-responses",
+    is_flag=True,
+    help="Stream linting responses as they're generated, to report time to first token and retry responses that stall early")
+@click.option(
+    "--stall-timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    default=DEFAULT_STALL_TIMEOUT,
+    show_default=True,
+    help="Seconds a streamed response can go without new output before it's retried")
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Don't reuse cached lint results or extracted pages from earlier runs")
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    help="Directory to keep cached results in instead of the user cache directory")
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+    show_default=True,
+    help="Maximum size in MB of each cache (lint results and extracted pages)")
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Pick up an interrupted or partially failed run, linting only the pieces that aren't done yet")
+@click.option(
+    "--batch-api",
+    is_flag=True,
+    help="Lint each document as one job with the OpenAI Batch API: cheaper and free of per-minute rate limits, but can take up to 24 hours")
+@click.option(
+    "--batch-id",
+    help="Collect the results of a batch submitted by an earlier, interrupted --batch-api run instead of submitting again (single input file only)")
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="Print where the run spent its time and tokens, and save it as json next to the output")
+@click.option(
+    "--stats-file",
+    type=click.Path(dir_okay=False),
+    help="Save run stats as json to this file (implies --stats)")
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="CPU profile and trace the memory of each stage, and save pstats files and top allocations next to the output")
+@click.option(
+    "-y", "--yes",
+    is_flag=True,
+    help="Overwrite existing output files without asking")
+def main(input_files, output, extracted_text, ocr, auto_ocr, ocr_workers,
+         ocr_window, extract_workers, stream, no_lint, mode, prompt,
+         chunk_tokens, adaptive_chunks, base_url, max_requests, tokens_per_minute,
+         max_connections, request_timeout, max_retries, stream_responses,
+         stall_timeout, no_cache, cache_dir, cache_size, resume, batch_api,
+         batch_id, stats, stats_file, profile, yes):
+    """textaur cli: ai-powered linting for pdf and text files
+
+    INPUT_FILES are files, directories or glob patterns. Directories are
+    searched recursively for pdf, txt and fountain files."""
+    try:
+        input_paths = expand_input_paths(input_files)
+    except click.BadParameter as e:
+        e.param_hint = "INPUT_FILES"
+        raise
+    if len(input_paths) > 1 and (output or extracted_text or batch_id):
+        raise click.UsageError(
+            "--output, --extracted-text and --batch-id can only be used with a single input file")
     try:
-        context = Context(
-            input_file=input_file,
-            output_path=output,
-            extracted_text_path=extracted_text,
-            use_ocr=ocr,
-            no_lint=no_lint,
-            mode=mode,
-            custom_prompt_path=prompt,
-            log=click.echo,
-            confirm=click.confirm,
-            progress_fn=lambda msg: click.echo(msg, nl=False),
-        )
-        asyncio.run(main_async(context))
+        contexts = [
+            Context(
+                input_file=input_path,
+                output_path=output,
+                extracted_text_path=extracted_text,
+                use_ocr=ocr,
+                no_lint=no_lint,
+                mode=mode,
+                custom_prompt_path=prompt,
+                log=click.echo,
+                confirm=(lambda msg: True) if yes else click.confirm,
+                progress_fn=lambda msg: click.echo(msg, nl=False),
+                resume=resume,
+                auto_ocr=auto_ocr,
+            )
+            for input_path in input_paths
+        ]
+        asyncio.run(main_async(
+            contexts,
+            stats_file=stats_file,
+            stats=stats or bool(stats_file),
+            max_concurrent_requests=max_requests,
+            tokens_per_minute=tokens_per_minute,
+            max_connections=max_connections,
+            request_timeout=request_timeout,
+            max_retries=max_retries,
+            stream_responses=stream_responses,
+            stall_timeout=stall_timeout,
+            use_cache=not no_cache,
+            cache_dir=cache_dir,
+            cache_max_bytes=cache_size * 1024 * 1024,
+            ocr_workers=ocr_workers,
+            ocr_window=ocr_window,
+            stream=stream,
+            extract_workers=extract_workers,
+            max_chunk_tokens=chunk_tokens,
+            adaptive_chunks=adaptive_chunks,
+            batch_api=batch_api,
+            batch_id=batch_id,
+            base_url=base_url,
+            profile=profile,
+        ))
+    except KeyboardInterrupt:
+        click.echo("Stopped.")
     except Exception as e:
         click.echo(f"Encountered an unexpected error:\n{e}")
 
 
-async def main_async(context: Context) -> None:
-    if not context.is_valid_context():
+async def main_async(
+    contexts: list[Context],
+    stats: bool = False,
+    stats_file: Optional[str] = None,
+    **pipeline_options,
+) -> None:
+    if len(contexts) == 1 and not contexts[0].is_valid_context():
         click.echo("Setup is invalid! Aborting.")
         return
+    metrics = Metrics() if stats else None
     pipeline = Pipeline(
         log=click.echo,
         progress_fn=lambda msg: click.echo(msg, nl=False),
+        metrics=metrics,
+        **pipeline_options,
     )
-    await pipeline.run(context)
+    try:
+        if len(contexts) == 1:
+            await pipeline.run(contexts[0])
+        else:
+            await pipeline.run_batch(contexts)
+    finally:
+        if metrics:
+            save_stats(metrics, contexts, stats_file)
+
+
+def save_stats(
+    metrics: Metrics,
+    contexts: list[Context],
+    stats_file: Optional[str],
+) -> None:
+    """
+    Prints the run stats and saves them as json, to stats_file when given,
+    otherwise next to the output file (or to DEFAULT_BATCH_STATS_FILE for a
+    batch of input files).
+
+    :param metrics
+    Metrics of the run.
+
+    :param contexts
+    Contexts of the input files.
+
+    :param stats_file
+    Optional path to save the stats to.
+    """
+    click.echo("\nStats:")
+    for line in metrics.report():
+        click.echo(f"  {line}")
+    if stats_file:
+        path = Path(stats_file)
+    elif len(contexts) == 1:
+        path = contexts[0].stats_file
+    else:
+        path = Path(DEFAULT_BATCH_STATS_FILE)
+    if path:
+        metrics.save(path)
+        click.echo(f"Saved stats to: {path}")
+
+
+def expand_input_paths(inputs: tuple[str, ...]) -> list[Path]:
+    """
+    Returns the input files named by the command line arguments, in order and
+    without duplicates. Directories are searched recursively for files with
+    one of INPUT_SUFFIXES (skipping textaur's own output files), and glob
+    patterns are expanded (for shells that don't, or when quoted).
+
+    :param inputs
+    Files, directories and glob patterns.
+    """
+    paths = {}
+    for arg in inputs:
+        if Path(arg).exists():
+            matches = [arg]
+        else:
+            matches = sorted(glob.glob(arg, recursive=True))
+            if not matches:
+                raise click.BadParameter(f"No such file, directory or match: {arg}")
+        for match in matches:
+            path = Path(match)
+            if path.is_dir():
+                for child in sorted(path.rglob("*")):
+                    if (child.is_file() and child.suffix.lower() in INPUT_SUFFIXES
+                        and not child.name.endswith(OUTPUT_ENDINGS)):
+                        paths.setdefault(child.resolve(), child)
+            elif path.is_file():
+                paths.setdefault(path.resolve(), path)
+    if not paths:
+        raise click.BadParameter("No input files found")
+    # output files are named after the input file without its suffix, so eg
+    # script.pdf and script.txt would overwrite each other's output
+    outputs = {}
+    for path in paths.values():
+        other = outputs.setdefault(path.with_suffix(""), path)
+        if other is not path:
+            raise click.BadParameter(
+                f"{other} and {path} would be saved to the same output files")
+    return list(paths.values())
 
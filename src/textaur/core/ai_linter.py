@@ -2,26 +2,367 @@
 
 Uses OpenAI to lint text. Can be initialized with an API key or will look for
 one in the environment.
+
+openai (and httpx and dotenv with it) is only imported once a linter is
+created, so importing this module, and running without linting, stays fast.
 """
 
-from dotenv import load_dotenv
-import openai
 import os
 import asyncio
-from typing import Optional
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from collections.abc import AsyncIterable
+from typing import TYPE_CHECKING, Callable, Optional
+from .cache import DiskCache
+from .tokenizer import Tokenizer
+from .metrics import Metrics, NullMetrics
+from .strutil import Strutil
+
+if TYPE_CHECKING:
+    import openai
 
 # OPEN AI VARIABLES
 OPENAI_API_KEY_NAME="OPENAI_API_KEY"
 LINTING_MODEL="gpt-5-mini"
 
+# default number of requests allowed in flight at the same time
+DEFAULT_MAX_CONCURRENT_REQUESTS = 16
+
+# seconds to wait for a single linting request before giving up on it
+DEFAULT_REQUEST_TIMEOUT = 600.0
+
+# seconds to wait when opening a new connection to the API
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+# seconds to keep an idle pooled connection open for reuse
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+
+# default number of times to retry a chunk after a rate limit, server error or
+# timeout before giving up on it
+DEFAULT_MAX_RETRIES = 5
+
+# seconds to wait before the first retry, doubled for every retry after that
+RETRY_BASE_DELAY = 1.0
+
+# maximum seconds to wait between retries, unless the server asks for longer
+RETRY_MAX_DELAY = 60.0
+
+# longest wait the server can ask for (Retry-After) that's still waited out; a
+# request asked to wait longer (eg after hitting a daily limit) fails right away
+MAX_RETRY_AFTER = 600.0
+
+# seconds a streamed response can go without new output, once it has started,
+# before it's considered stalled and retried
+DEFAULT_STALL_TIMEOUT = 30.0
+
+# times a text whose output is cut short by the output limit is split in two
+# and linted again, so a text can end up in up to 2 ** this many pieces
+MAX_TRUNCATION_SPLITS = 3
+
+
+class StreamStalledError(Exception):
+    """
+    Raised when a streamed response stops sending output partway through.
+    Retried like a timeout.
+    """
+
+
+class TruncatedResponseError(Exception):
+    """
+    Raised when a response is cut short by the model's output limit
+    (finish_reason "length"). Not retried as is, since the same text would be
+    cut short again; the text is split and linted in pieces instead.
+    """
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Returns true if a failed request is worth retrying: rate limits, server
+    errors, timeouts and dropped connections.
+
+    :param error
+    Exception raised by the request.
+    """
+    import openai
+    if isinstance(error, StreamStalledError):
+        return True
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """
+    Returns the number of seconds the server asked to wait before retrying, or
+    None if it didn't say. Reads the retry-after-ms and retry-after headers;
+    retry-after can be a number of seconds or an HTTP date.
+
+    :param error
+    Exception raised by the request.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                retry_at = parsedate_to_datetime(value)
+                return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Returns the number of seconds to wait before retrying a failed request.
+    Honors the server's Retry-After when given, however long (see
+    MAX_RETRY_AFTER), otherwise uses exponential backoff with full jitter so
+    parallel retries don't all land at once.
+
+    :param error
+    Exception raised by the request.
+
+    :param attempt
+    Number of the attempt that failed, starting at 0.
+    """
+    requested = retry_after_seconds(error)
+    if requested is not None:
+        return requested
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class RequestScheduler:
+    """
+    Limits the number of requests in flight and the number of tokens sent per
+    minute. Requests wait for a slot and release it when they finish, so
+    throughput stays near the rate limit instead of bursting and failing.
+    """
+    def __init__(
+        self,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        tokens_per_minute: Optional[int] = None,
+        clock=time.monotonic,
+    ) -> None:
+        """
+        :param max_concurrent_requests
+        Maximum number of requests in flight at the same time.
+
+        :param tokens_per_minute
+        Maximum number of tokens (prompt and completion) to use per minute. No
+        token limit when None.
+
+        :param clock
+        Function returning the current time in seconds.
+        """
+        if max_concurrent_requests < 1:
+            raise ValueError("max_concurrent_requests must be at least 1")
+        if tokens_per_minute is not None and tokens_per_minute < 1:
+            raise ValueError("tokens_per_minute must be at least 1")
+        self.max_concurrent_requests = max_concurrent_requests
+        self.tokens_per_minute = tokens_per_minute
+        self.clock = clock
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._token_lock = asyncio.Lock()
+        self._available_tokens = float(tokens_per_minute or 0)
+        self._last_refill = clock()
+
+
+    @asynccontextmanager
+    async def slot(self, tokens: int):
+        """
+        Waits until there is a free request slot and enough token budget for
+        the request, then holds the slot until the block exits. Waiters are
+        released in the order they arrived.
+
+        :param tokens
+        Estimated number of tokens the request will use.
+        """
+        async with self._semaphore:
+            await self._reserve_tokens(tokens)
+            yield
+
+
+    def settle(self, reserved: int, used: int) -> None:
+        """
+        Corrects the token budget once the actual usage of a request is known.
+
+        :param reserved
+        Number of tokens reserved for the request before it was sent.
+
+        :param used
+        Number of tokens the request actually used.
+        """
+        if not self.tokens_per_minute:
+            return
+        self._refill()
+        self._available_tokens = min(
+            float(self.tokens_per_minute),
+            self._available_tokens + self._clamp(reserved) - used,
+        )
+
+
+    async def _reserve_tokens(self, tokens: int) -> None:
+        """
+        Waits until the token budget can cover the request, then takes the
+        tokens out of the budget.
+
+        :param tokens
+        Number of tokens to reserve.
+        """
+        if not self.tokens_per_minute:
+            return
+        tokens = self._clamp(tokens)
+        async with self._token_lock:
+            self._refill()
+            while self._available_tokens < tokens:
+                missing = tokens - self._available_tokens
+                await asyncio.sleep(missing / self._tokens_per_second)
+                self._refill()
+            self._available_tokens -= tokens
+
+
+    def _refill(self) -> None:
+        """
+        Adds the tokens earned since the last refill back to the budget.
+        """
+        now = self.clock()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._available_tokens = min(
+            float(self.tokens_per_minute),
+            self._available_tokens + elapsed * self._tokens_per_second,
+        )
+
+
+    def _clamp(self, tokens: int) -> int:
+        """
+        A request bigger than the whole budget could never be sent, so treat it
+        as using the whole budget.
+
+        :param tokens
+        Number of tokens to clamp.
+        """
+        return min(tokens, self.tokens_per_minute)
+
+
+    @property
+    def _tokens_per_second(self) -> float:
+        return self.tokens_per_minute / 60
+
+
 class AILinter:
     """AI Linter class for linting text using OpenAI"""
-    def __init__(self, api_key: Optional[str]=None):
-        """Initialize the AI Linter with an optional API key"""
+    def __init__(
+        self,
+        api_key: Optional[str]=None,
+        max_concurrent_requests: int=DEFAULT_MAX_CONCURRENT_REQUESTS,
+        tokens_per_minute: Optional[int]=None,
+        max_connections: Optional[int]=None,
+        request_timeout: float=DEFAULT_REQUEST_TIMEOUT,
+        max_retries: int=DEFAULT_MAX_RETRIES,
+        cache: Optional[DiskCache]=None,
+        tokenizer: Optional[Tokenizer]=None,
+        base_url: Optional[str]=None,
+        metrics: Optional[Metrics]=None,
+        stream_responses: bool=False,
+        stall_timeout: float=DEFAULT_STALL_TIMEOUT,
+        split_text: Optional[Callable[[str], list[str]]]=None,
+        request_observer: Optional[Callable[[int, int, float, str], None]]=None,
+    ):
+        """
+        Initialize the AI Linter with an optional API key.
+
+        :param api_key
+        OpenAI API key. Looked up in the environment when not provided.
+
+        :param max_concurrent_requests
+        Maximum number of requests in flight at the same time.
+
+        :param tokens_per_minute
+        Maximum number of tokens to use per minute. No limit when None.
+
+        :param max_connections
+        Maximum number of pooled connections to the API. Defaults to
+        max_concurrent_requests.
+
+        :param request_timeout
+        Seconds to wait for a single request before giving up on it.
+
+        :param max_retries
+        Number of times to retry a request after a rate limit, server error or
+        timeout.
+
+        :param cache
+        Optional cache of lint results. Texts already linted with the same
+        model and prompt are returned from the cache without a request.
+
+        :param tokenizer
+        Tokenizer used to count how much of the tokens-per-minute budget a
+        request will use. Defaults to one for LINTING_MODEL.
+
+        :param base_url
+        Base url of the API to send requests to, eg a local OpenAI-compatible
+        server. Defaults to OpenAI's (or OPENAI_BASE_URL when set).
+
+        :param metrics
+        Metrics to report queue wait, request latency, retries and token usage
+        into. Reports nothing when None.
+
+        :param stream_responses
+        When true, responses are streamed and read as they're generated, so
+        time to first token is reported and a response that stops partway is
+        caught early (see stall_timeout).
+
+        :param stall_timeout
+        Seconds a streamed response can go without new output, once output
+        has started, before it's abandoned and retried.
+
+        :param split_text
+        Function that splits a text whose output was cut short by the output
+        limit into pieces to lint separately. Defaults to
+        Strutil.split_in_two.
+
+        :param request_observer
+        Function called after every request with the length of the text sent,
+        the length of the output, the seconds the request took and how it
+        went: "ok", "truncated" or "error" (rate limits aside). See
+        ChunkSizer.record.
+        """
+        self.cache = cache
+        self.tokenizer = tokenizer or Tokenizer(LINTING_MODEL)
+        self.scheduler = RequestScheduler(
+            max_concurrent_requests=max_concurrent_requests,
+            tokens_per_minute=tokens_per_minute,
+        )
+        self.max_connections = max_connections or max_concurrent_requests
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.base_url = base_url
+        self.metrics = metrics or NullMetrics()
+        self.stream_responses = stream_responses
+        self.stall_timeout = stall_timeout
+        self.split_text = split_text or Strutil(log=lambda msg: None).split_in_two
+        self.request_observer = request_observer
+        self._client = None
+        # token counts of the prompts sent, by prompt text
+        self._prompt_tokens = {}
+        import openai
         if not openai.api_key:
             if api_key:
                 key = api_key
             else:
+                from dotenv import load_dotenv
                 load_dotenv()
                 key = os.getenv(OPENAI_API_KEY_NAME)
             if not key:
@@ -29,6 +370,55 @@ class AILinter:
             openai.api_key = key
 
 
+    @property
+    def client(self) -> "openai.AsyncOpenAI":
+        """
+        Long-lived client shared by every request, so connections are pooled
+        and kept alive between chunks instead of being opened per request.
+        Created on first use and again after close().
+        """
+        if self._client is None:
+            import httpx
+            import openai
+            timeout = httpx.Timeout(
+                self.request_timeout,
+                connect=DEFAULT_CONNECT_TIMEOUT,
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=openai.api_key,
+                base_url=self.base_url,
+                timeout=timeout,
+                # retries are handled per chunk by make_request
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    timeout=timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+                    ),
+                ),
+            )
+        return self._client
+
+
+    async def close(self) -> None:
+        """
+        Closes the shared client and its connection pool.
+        """
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
     def remove_backticks(self, text: str) -> str:
         """
         Removes leading and trailing triple backticks from the text. If the text
@@ -65,27 +455,233 @@ class AILinter:
         }
 
 
-    async def make_request(self, model: str, messages: list) -> str:
+    async def make_request(
+        self,
+        model: str,
+        messages: list,
+        on_delta: Optional[Callable[[str, int], None]] = None,
+    ) -> str:
+        """
+        Makes a request to the OpenAI chat completion API, retrying rate
+        limits, server errors, timeouts and stalled streams up to max_retries
+        times.
+
+        :param model
+        Model to use for the request.
+
+        :param messages
+        List of messages to send to the API.
+
+        :param on_delta
+        Function called with each piece of output as it arrives and the
+        number of the attempt it belongs to (starting at 0), when streaming
+        responses. A retried request starts its output over, so pieces from
+        an earlier attempt should be dropped.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self._make_single_request(model, messages, on_delta, attempt)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = retry_delay(e, attempt)
+                if delay > MAX_RETRY_AFTER:
+                    # not worth holding the run for; retry later with --resume
+                    raise
+                self.metrics.count("lint.retries")
+                # sleep outside the scheduler slot so other chunks can use it
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+    async def _make_single_request(
+        self,
+        model: str,
+        messages: list,
+        on_delta: Optional[Callable[[str, int], None]] = None,
+        attempt: int = 0,
+    ) -> str:
+        """
+        Makes a single request to the OpenAI chat completion API.
+
+        :param model
+        Model to use for the request.
+
+        :param messages
+        List of messages to send to the API.
+
+        :param on_delta
+        Function called with each piece of output as it arrives, when
+        streaming responses. See make_request.
+
+        :param attempt
+        Number of the attempt, passed on to on_delta.
+        """
+        def deliver(delta: str) -> None:
+            if on_delta:
+                on_delta(delta, attempt)
+
+        reserved = self._reserved_tokens(messages)
+        queued = time.perf_counter()
+        input_chars = len(messages[-1]["content"])
+        async with self.scheduler.slot(reserved):
+            self.metrics.observe("lint.queue_wait", time.perf_counter() - queued)
+            started = time.perf_counter()
+            try:
+                with self.metrics.time("lint.request_latency"):
+                    if self.stream_responses:
+                        res, finish_reason, usage = await self._stream_completion(
+                            model, messages, deliver)
+                    else:
+                        completion = await self.client.chat.completions.create(
+                            model=model,
+                            messages=messages
+                        )
+                        usage = completion.usage
+                        obj = completion.choices[0]
+                        res, finish_reason = obj.message.content, obj.finish_reason
+            except Exception as e:
+                # a rate limit says nothing about the request itself
+                if getattr(e, "status_code", None) != 429:
+                    self._observe_request(input_chars, 0, started, "error")
+                raise
+        self.metrics.count("lint.requests")
+        if usage:
+            self.scheduler.settle(reserved, usage.total_tokens)
+            self._count_usage(usage)
+        if finish_reason == "length":
+            self.metrics.count("lint.truncated")
+            self._observe_request(input_chars, len(res or ""), started, "truncated")
+            raise TruncatedResponseError("Response cut short by the output limit")
+        self._observe_request(input_chars, len(res or ""), started, "ok")
+        return self.remove_backticks(res)
+
+
+    def _reserved_tokens(self, messages: list) -> int:
+        """
+        Returns the number of tokens to reserve from the tokens-per-minute
+        budget for a request, or 0 when there's no budget. Assumes the output
+        is about as long as the input. The prompt is the same for every chunk,
+        so its token count is only worked out once.
+
+        :param messages
+        List of messages to send to the API; the last one is the text to lint.
+        """
+        if not self.scheduler.tokens_per_minute:
+            return 0
+        tokens = self.tokenizer.count(messages[-1]["content"])
+        for message in messages[:-1]:
+            content = message["content"]
+            if content not in self._prompt_tokens:
+                self._prompt_tokens[content] = self.tokenizer.count(content)
+            tokens += self._prompt_tokens[content]
+        return 2 * tokens
+
+
+    def _observe_request(self, input_chars: int, output_chars: int, started: float, outcome: str) -> None:
         """
-        Makes a request to the OpenAI chat completion API.
+        Reports a finished request to the request observer, if there is one.
+
+        :param input_chars
+        Length of the text sent.
+
+        :param output_chars
+        Length of the output received.
+
+        :param started
+        perf_counter time the request was sent.
+
+        :param outcome
+        "ok", "truncated" or "error".
+        """
+        if self.request_observer:
+            self.request_observer(input_chars, output_chars, time.perf_counter() - started, outcome)
+
+
+    async def _stream_completion(
+        self,
+        model: str,
+        messages: list,
+        on_delta: Callable[[str], None],
+    ) -> tuple[str, Optional[str], Optional["openai.types.CompletionUsage"]]:
+        """
+        Makes a streamed request to the OpenAI chat completion API and returns
+        the output, the finish reason and the usage once the stream ends.
+        Raises StreamStalledError if the output stops for stall_timeout
+        seconds after it has started. Until the first output, only the
+        request timeout applies, since reasoning models can think for a long
+        time before writing anything.
 
         :param model
         Model to use for the request.
 
         :param messages
         List of messages to send to the API.
+
+        :param on_delta
+        Function called with each piece of output as it arrives.
         """
-        client = openai.AsyncOpenAI()
-        completion = await client.chat.completions.create(
+        started = time.perf_counter()
+        stream = await self.client.chat.completions.create(
             model=model,
-            messages=messages
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
         )
-        obj = completion.choices[0]
-        res = obj.message.content
-        return self.remove_backticks(res)
+        parts, finish_reason, usage = [], None, None
+        events = aiter(stream)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        anext(events), self.stall_timeout if parts else None)
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    self.metrics.count("lint.stalls")
+                    raise StreamStalledError(
+                        f"Response stalled: no output for {self.stall_timeout}s") from None
+                if chunk.usage:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta = choice.delta.content if choice.delta else None
+                if not delta:
+                    continue
+                if not parts:
+                    self.metrics.observe("lint.time_to_first_token", time.perf_counter() - started)
+                parts.append(delta)
+                on_delta(delta)
+        finally:
+            await stream.close()
+        return "".join(parts), finish_reason, usage
+
+
+    def _count_usage(self, usage) -> None:
+        """
+        Reports the token usage of a completion to the metrics.
+
+        :param usage
+        Usage of the completion.
+        """
+        if not self.metrics.enabled:
+            return
+        self.metrics.count("tokens.prompt", usage.prompt_tokens or 0)
+        self.metrics.count("tokens.completion", usage.completion_tokens or 0)
+        details = getattr(usage, "completion_tokens_details", None)
+        reasoning = getattr(details, "reasoning_tokens", None) if details else None
+        self.metrics.count("tokens.reasoning", reasoning or 0)
 
 
-    async def lint_text(self, text: str, linting_prompt: str) -> str:
+    async def lint_text(
+        self,
+        text: str,
+        linting_prompt: str,
+        on_delta: Optional[Callable[[str, int], None]] = None,
+    ) -> str:
         """
         Lints the given text using the OpenAI chat completion API.
 
@@ -94,28 +690,251 @@ class AILinter:
 
         :param linting_prompt
         Prompt to use for linting (ie, the system message).
+
+        :param on_delta
+        Function called with each piece of the linted text as it arrives,
+        when streaming responses. Not called for cached texts, or for the
+        pieces of a text that had to be split. See make_request.
         """
-        return await self.make_request(
-            LINTING_MODEL,
-            [
-                self.get_message("system", linting_prompt),
-                self.get_message("user", f"Please clean up the following text: \n\n{text}"),
-            ]
-        )
+        return await self._lint_text(text, linting_prompt, on_delta, MAX_TRUNCATION_SPLITS)
+
+
+    async def _lint_text(
+        self,
+        text: str,
+        linting_prompt: str,
+        on_delta: Optional[Callable[[str, int], None]],
+        splits_left: int,
+    ) -> str:
+        """
+        Lints the given text, splitting it and linting the pieces if its output
+        is cut short by the output limit. See lint_text.
+
+        :param text
+        Text to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+
+        :param on_delta
+        Function called with each piece of the linted text as it arrives.
+
+        :param splits_left
+        Number of times the text can still be split.
+        """
+        messages = self.get_lint_messages(text, linting_prompt)
+        key = None
+        if self.cache:
+            key = self.cache_key(messages)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.metrics.count("lint.cache_hits")
+                return cached
+        try:
+            linted = await self.make_request(LINTING_MODEL, messages, on_delta)
+        except TruncatedResponseError:
+            linted = await self.lint_split_text(text, linting_prompt, splits_left)
+        if key:
+            self.cache.set(key, linted)
+        return linted
+
+
+    async def lint_split_text(
+        self,
+        text: str,
+        linting_prompt: str,
+        splits_left: int = MAX_TRUNCATION_SPLITS,
+    ) -> str:
+        """
+        Lints a text whose output was cut short by the output limit: splits it
+        with split_text, lints the pieces concurrently and joins their output
+        in order. Pieces cut short as well are split again, up to splits_left
+        times in all. Raises TruncatedResponseError if the text can't be split
+        any further.
+
+        :param text
+        Text to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+
+        :param splits_left
+        Number of times the text can still be split.
+        """
+        pieces = self.split_text(text) if splits_left > 0 else [text]
+        if len(pieces) < 2:
+            raise TruncatedResponseError(
+                "Response cut short by the output limit, and the text can't be split any further")
+        self.metrics.count("lint.truncation_splits")
+        linted = await asyncio.gather(*[
+            self._lint_text(piece, linting_prompt, None, splits_left - 1)
+            for piece in pieces
+        ])
+        return "".join(linted)
+
+
+    def get_lint_messages(self, text: str, linting_prompt: str) -> list[dict]:
+        """
+        Returns the messages to send to the OpenAI chat completion API to lint
+        a text.
+
+        :param text
+        Text to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+        """
+        return [
+            self.get_message("system", linting_prompt),
+            self.get_message("user", f"Please clean up the following text: \n\n{text}"),
+        ]
+
+
+    def cache_key(self, messages: list[dict]) -> str:
+        """
+        Returns the lint cache key for a request. Requests sent to another API
+        (base_url, eg a local model or the simulator) get their own keys, so
+        their output is never returned for requests to OpenAI's.
+
+        :param messages
+        Messages of the request.
+        """
+        # keys for OpenAI's API are unchanged, so results cached before
+        # base_url existed still apply
+        api = [self.base_url] if self.base_url else []
+        return DiskCache.key(LINTING_MODEL, *api, *[m["content"] for m in messages])
+
 
     async def batch_lint_texts(
         self,
         texts: list[str],
         linting_prompt: str,
-    ) -> list[str]:
+        on_failure: Optional[Callable[[int, Exception], None]]=None,
+        on_success: Optional[Callable[[int, str], None]]=None,
+    ) -> list[Optional[str]]:
         """
         Lints the given texts in parallel using the OpenAI chat completion API.
+        Requests are released by the scheduler as capacity frees up, in order.
+        A text that still fails after retries doesn't stop the others: its
+        place in the returned list is None and on_failure is called with its
+        index and the error.
 
         :param texts
         List of texts to lint.
 
         :param linting_prompt
         Prompt to use for linting (ie, the system message).
+
+        :param on_failure
+        Optional function called with the index and exception of each text
+        that couldn't be linted.
+
+        :param on_success
+        Optional function called with the index and linted text of each text
+        as soon as it's linted.
         """
-        res = [self.lint_text(text, linting_prompt) for text in texts]
+        res = [
+            self._lint_or_none(idx, text, linting_prompt, on_failure, on_success)
+            for idx, text in enumerate(texts)
+        ]
         return await asyncio.gather(*res)
+
+
+    async def stream_lint_texts(
+        self,
+        texts: AsyncIterable[str],
+        linting_prompt: str,
+        on_failure: Optional[Callable[[int, Exception], None]]=None,
+        on_success: Optional[Callable[[int, str], None]]=None,
+        max_pending: Optional[int]=None,
+        keep_results: bool=True,
+    ) -> list[Optional[str]]:
+        """
+        Like batch_lint_texts, but takes texts as they're produced: each text
+        is sent to the scheduler as soon as it arrives, while the producer
+        keeps working on the next one. No more than max_pending texts are taken
+        ahead of the ones being linted, so a fast producer waits for the linter
+        instead of piling texts up in memory.
+
+        :param texts
+        Async iterable of texts to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+
+        :param on_failure
+        Optional function called with the index and exception of each text
+        that couldn't be linted.
+
+        :param on_success
+        Optional function called with the index and linted text of each text
+        as soon as it's linted.
+
+        :param max_pending
+        Maximum number of texts taken but not yet linted. Defaults to twice
+        the number of concurrent requests.
+
+        :param keep_results
+        When false, linted texts are only passed to on_success and not kept
+        for the returned list (which is all None), so memory doesn't grow with
+        the number of texts.
+        """
+        pending = asyncio.Semaphore(
+            max_pending or 2 * self.scheduler.max_concurrent_requests)
+        tasks = []
+
+        async def lint(idx: int, text: str) -> Optional[str]:
+            try:
+                linted = await self._lint_or_none(
+                    idx, text, linting_prompt, on_failure, on_success)
+                return linted if keep_results else None
+            finally:
+                pending.release()
+
+        try:
+            async for text in texts:
+                await pending.acquire()
+                tasks.append(asyncio.create_task(lint(len(tasks), text)))
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+
+    async def _lint_or_none(
+        self,
+        idx: int,
+        text: str,
+        linting_prompt: str,
+        on_failure: Optional[Callable[[int, Exception], None]],
+        on_success: Optional[Callable[[int, str], None]],
+    ) -> Optional[str]:
+        """
+        Lints a text, returning None instead of raising if it can't be linted.
+
+        :param idx
+        Index of the text, passed to on_failure and on_success.
+
+        :param text
+        Text to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+
+        :param on_failure
+        Optional function called with idx and the exception if linting fails.
+
+        :param on_success
+        Optional function called with idx and the linted text.
+        """
+        try:
+            linted = await self.lint_text(text, linting_prompt)
+        except Exception as e:
+            self.metrics.count("lint.failed_chunks")
+            if on_failure:
+                on_failure(idx, e)
+            return None
+        if on_success:
+            on_success(idx, linted)
+        return linted
@@ -0,0 +1,341 @@
+"""Batch linter class for linting text using the OpenAI Batch API
+
+Sends every chunk of a document as one batch job instead of one request per
+chunk. Batches cost less and don't count against the per-minute rate limits,
+but can take up to the completion window to finish, so they suit large
+offline jobs where latency doesn't matter.
+"""
+
+import asyncio
+import json
+import tempfile
+from collections.abc import AsyncIterable
+from typing import Callable, Optional
+from .ai_linter import AILinter, TruncatedResponseError, LINTING_MODEL
+
+# endpoint every request in a batch is sent to
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# time the API has to finish a batch
+BATCH_COMPLETION_WINDOW = "24h"
+
+# maximum number of requests the API accepts in a single batch
+BATCH_MAX_REQUESTS = 50000
+
+# default seconds between checks on a running batch
+DEFAULT_BATCH_POLL_INTERVAL = 30.0
+
+# batch statuses after which a batch won't change anymore
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# name the batch input file is uploaded under
+BATCH_INPUT_FILENAME = "textaur_batch.jsonl"
+
+
+class BatchRequestError(Exception):
+    """
+    Error for a text in a batch that didn't come back linted.
+    """
+
+
+class BatchLinter(AILinter):
+    """
+    AI Linter that lints many texts at once with the OpenAI Batch API.
+    batch_lint_texts and stream_lint_texts write a request for every text that
+    isn't cached to a JSONL file, submit it as one batch, poll until the batch
+    is done and hand back the results in the order of the texts. lint_text
+    still makes a single live request.
+
+    Each request is identified by the lint cache key of its text (model,
+    prompt and text), so the results of an earlier batch can be matched to
+    the texts again when a run is resumed with its batch id.
+    """
+    def __init__(
+        self,
+        batch_id: Optional[str]=None,
+        poll_interval: float=DEFAULT_BATCH_POLL_INTERVAL,
+        log: Callable=print,
+        **kwargs,
+    ):
+        """
+        Initialize the Batch Linter. Takes the same keyword arguments as
+        AILinter, plus:
+
+        :param batch_id
+        Id of an already submitted batch to collect results from instead of
+        submitting the texts again (eg after an interrupted run). Only used by
+        the first batch linted; texts that aren't in that batch are submitted
+        in a new one.
+
+        :param poll_interval
+        Seconds to wait between checks on a running batch.
+
+        :param log
+        Function to use for logging.
+        """
+        super().__init__(**kwargs)
+        self.batch_id = batch_id
+        self.poll_interval = poll_interval
+        self.log = log
+
+
+    async def batch_lint_texts(
+        self,
+        texts: list[str],
+        linting_prompt: str,
+        on_failure: Optional[Callable[[int, Exception], None]]=None,
+        on_success: Optional[Callable[[int, str], None]]=None,
+    ) -> list[Optional[str]]:
+        """
+        Lints the given texts as one batch. A text that isn't linted doesn't
+        stop the others: its place in the returned list is None and on_failure
+        is called with its index and the error.
+
+        :param texts
+        List of texts to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+
+        :param on_failure
+        Optional function called with the index and exception of each text
+        that couldn't be linted.
+
+        :param on_success
+        Optional function called with the index and linted text of each text
+        once it's linted.
+        """
+        res: list[Optional[str]] = [None] * len(texts)
+
+        def succeed(idx: int, linted: str) -> None:
+            res[idx] = linted
+            if on_success:
+                on_success(idx, linted)
+
+        def fail(idx: int, error: Exception) -> None:
+            self.metrics.count("lint.failed_chunks")
+            if on_failure:
+                on_failure(idx, error)
+
+        # requests by id, and the indices of the texts each one lints (the
+        # same text twice is only sent once)
+        requests: dict[str, list[dict]] = {}
+        indices: dict[str, list[int]] = {}
+        for idx, text in enumerate(texts):
+            messages = self.get_lint_messages(text, linting_prompt)
+            request_id = self.cache_key(messages)
+            cached = self.cache.get(request_id) if self.cache else None
+            if cached is not None:
+                self.metrics.count("lint.cache_hits")
+                succeed(idx, cached)
+                continue
+            requests[request_id] = messages
+            indices.setdefault(request_id, []).append(idx)
+        if not requests:
+            return res
+
+        batch_id, self.batch_id = self.batch_id, None
+        resumed = batch_id is not None
+        if not resumed:
+            batch_id = await self.submit_batch(requests)
+        results = await self._collect_or_fail(batch_id, requests)
+        missing = {id: m for id, m in requests.items() if id not in results}
+        if missing and resumed:
+            # the resumed batch doesn't cover every text (eg the document or
+            # the prompt changed since), so send the rest in a new one
+            self.log(f"{len(missing)} pieces aren't in batch {batch_id}.")
+            batch_id = await self.submit_batch(missing)
+            results |= await self._collect_or_fail(batch_id, missing)
+        truncated = [request_id for request_id in indices
+                     if isinstance(results.get(request_id), TruncatedResponseError)]
+        if truncated:
+            # split those texts and lint the pieces live rather than waiting
+            # on another batch
+            self.log(f"{len(truncated)} pieces were cut short by the output limit. Linting them again in smaller pieces...")
+            recovered = await asyncio.gather(*[
+                self.lint_split_text(texts[indices[request_id][0]], linting_prompt)
+                for request_id in truncated
+            ], return_exceptions=True)
+            results |= dict(zip(truncated, recovered))
+
+        for request_id, idxs in indices.items():
+            linted = results.get(request_id)
+            if linted is None:
+                linted = BatchRequestError(f"Not linted by batch {batch_id}")
+            if isinstance(linted, Exception):
+                for idx in idxs:
+                    fail(idx, linted)
+                continue
+            if self.cache:
+                self.cache.set(request_id, linted)
+            for idx in idxs:
+                succeed(idx, linted)
+        return res
+
+
+    async def stream_lint_texts(
+        self,
+        texts: AsyncIterable[str],
+        linting_prompt: str,
+        on_failure: Optional[Callable[[int, Exception], None]]=None,
+        on_success: Optional[Callable[[int, str], None]]=None,
+        max_pending: Optional[int]=None,
+        keep_results: bool=True,
+    ) -> list[Optional[str]]:
+        """
+        Takes every text from the iterable and lints them as one batch (see
+        batch_lint_texts). Takes the same arguments as
+        AILinter.stream_lint_texts; max_pending is ignored since nothing is
+        sent until every text has been produced.
+
+        :param texts
+        Async iterable of texts to lint.
+
+        :param linting_prompt
+        Prompt to use for linting (ie, the system message).
+
+        :param on_failure
+        Optional function called with the index and exception of each text
+        that couldn't be linted.
+
+        :param on_success
+        Optional function called with the index and linted text of each text
+        once it's linted.
+
+        :param max_pending
+        Ignored.
+
+        :param keep_results
+        When false, the returned list is all None.
+        """
+        res = await self.batch_lint_texts(
+            [text async for text in texts],
+            linting_prompt,
+            on_failure=on_failure,
+            on_success=on_success,
+        )
+        return res if keep_results else [None] * len(res)
+
+
+    async def submit_batch(self, requests: dict[str, list[dict]]) -> str:
+        """
+        Writes the requests to a JSONL file, uploads it and submits it as a
+        batch. Returns the id of the batch.
+
+        :param requests
+        Dict of request id to the messages of the request.
+        """
+        if len(requests) > BATCH_MAX_REQUESTS:
+            raise ValueError(f"A batch can have at most {BATCH_MAX_REQUESTS} requests, got {len(requests)}")
+        with tempfile.TemporaryFile() as f:
+            for request_id, messages in requests.items():
+                line = {
+                    "custom_id": request_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {"model": LINTING_MODEL, "messages": messages},
+                }
+                f.write(f"{json.dumps(line)}\n".encode("utf-8"))
+            f.seek(0)
+            upload = await self.client.files.create(
+                file=(BATCH_INPUT_FILENAME, f),
+                purpose="batch",
+            )
+        batch = await self.client.batches.create(
+            input_file_id=upload.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        self.log(f"Submitted {len(requests)} pieces as batch {batch.id}. If this run is interrupted, rerun with --batch-id {batch.id} to collect the results.")
+        return batch.id
+
+
+    async def collect_batch(self, batch_id: str) -> dict[str, str | Exception]:
+        """
+        Waits for a batch to finish and returns its results as a dict of
+        request id to linted text, or to the error for requests that failed.
+        Requests the batch never got to (eg it expired or was cancelled) are
+        left out.
+
+        :param batch_id
+        Id of the batch.
+        """
+        status = None
+        with self.metrics.time("lint.batch_wait"):
+            while True:
+                batch = await self.client.batches.retrieve(batch_id)
+                if batch.status != status:
+                    status = batch.status
+                    counts = batch.request_counts
+                    done = f" ({counts.completed + counts.failed}/{counts.total})" if counts else ""
+                    self.log(f"Batch {batch_id}: {status}{done}")
+                if status in BATCH_FINAL_STATUSES:
+                    break
+                await asyncio.sleep(self.poll_interval)
+
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if line.strip():
+                    request_id, linted = self._parse_result(json.loads(line))
+                    results[request_id] = linted
+        if status == "failed" and not results:
+            errors = batch.errors.data if batch.errors and batch.errors.data else []
+            message = "; ".join(e.message for e in errors if e.message)
+            raise BatchRequestError(f"Batch {batch_id} failed: {message or 'no reason given'}")
+        return results
+
+
+    async def _collect_or_fail(
+        self,
+        batch_id: str,
+        requests: dict[str, list[dict]],
+    ) -> dict[str, str | Exception]:
+        """
+        Like collect_batch, but when the whole batch failed returns the error
+        as the result of every request instead of raising it.
+
+        :param batch_id
+        Id of the batch.
+
+        :param requests
+        Dict of request id to the messages of the requests in the batch.
+        """
+        try:
+            return await self.collect_batch(batch_id)
+        except BatchRequestError as e:
+            return {request_id: e for request_id in requests}
+
+
+    def _parse_result(self, entry: dict) -> tuple[str, str | Exception]:
+        """
+        Returns the request id and the linted text (or the error) of a line of
+        a batch output or error file.
+
+        :param entry
+        Parsed line of the file.
+        """
+        response = entry.get("response") or {}
+        body = response.get("body") or {}
+        status_code = response.get("status_code")
+        if body.get("usage") and self.metrics.enabled:
+            self.metrics.count("lint.requests")
+            import openai
+            try:
+                self._count_usage(openai.types.CompletionUsage.model_validate(body["usage"]))
+            except ValueError:
+                pass
+        if status_code == 200 and body.get("choices"):
+            if body["choices"][0].get("finish_reason") == "length":
+                self.metrics.count("lint.truncated")
+                return entry["custom_id"], TruncatedResponseError(
+                    "Response cut short by the output limit")
+            content = body["choices"][0].get("message", {}).get("content")
+            if content is not None:
+                return entry["custom_id"], self.remove_backticks(content)
+        error = entry.get("error") or body.get("error") or {}
+        message = error.get("message") or f"Request failed with status {status_code}"
+        return entry["custom_id"], BatchRequestError(message)
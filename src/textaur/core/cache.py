@@ -0,0 +1,186 @@
+"""
+On-disk cache for textaur.
+
+Values are stored one file per key under a cache directory. Keys are content
+hashes, so an entry never goes stale: if anything that went into the key
+changes, the key changes too. The cache is capped in size and evicts the least
+recently used entries first.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+# root directory for all textaur caches
+DEFAULT_CACHE_DIR = Path(
+    os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "textaur"
+
+# default maximum size of a single cache, in bytes
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# when the cache grows past its cap, evict down to this fraction of the cap so
+# eviction doesn't run again on the very next write
+EVICTION_TARGET_RATIO = 0.9
+
+
+class DiskCache:
+    """
+    Persistent content-addressed cache of strings with a size cap and least
+    recently used eviction.
+    """
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+        log: Callable = print,
+    ) -> None:
+        """
+        :param directory
+        Directory to store cache entries in. Created if it doesn't exist.
+
+        :param max_bytes
+        Maximum total size of the cache entries.
+
+        :param log
+        Function to use for logging.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.log = log
+        self._size = None
+
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """
+        Returns a cache key for the given parts. Each part is length-prefixed
+        so ("ab", "c") and ("a", "bc") get different keys.
+
+        :param parts
+        Strings that together identify the cached value.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            encoded = part.encode("utf-8")
+            digest.update(f"{len(encoded)}:".encode("ascii"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached value for a key, or None if it isn't cached. Marks
+        the entry as recently used.
+
+        :param key
+        Key returned by DiskCache.key.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)
+            return value
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+        except OSError as e:
+            self.log(f"Unable to read from cache: {e}")
+            return None
+
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Stores a value in the cache, evicting the least recently used entries
+        if the cache grows past its size cap. Failing to write to the cache
+        is logged but never raised.
+
+        :param key
+        Key returned by DiskCache.key.
+
+        :param value
+        Value to cache.
+        """
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            size = self.size()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous = path.stat().st_size if path.exists() else 0
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(value)
+            # replace atomically so concurrent readers never see half an entry
+            os.replace(tmp, path)
+            self._size = size + path.stat().st_size - previous
+        except OSError as e:
+            self.log(f"Unable to write to cache: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        if self._size > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICTION_TARGET_RATIO))
+
+
+    def size(self) -> int:
+        """
+        Returns the total size of the cache entries in bytes.
+        """
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        return self._size
+
+
+    def evict(self, target_bytes: int) -> None:
+        """
+        Deletes least recently used entries until the cache is no bigger than
+        target_bytes.
+
+        :param target_bytes
+        Size in bytes to shrink the cache to.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        size = sum(s for _, _, s in entries)
+        for path, _, entry_size in entries:
+            if size <= target_bytes:
+                break
+            try:
+                path.unlink()
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
+
+
+    def clear(self) -> None:
+        """
+        Deletes every entry in the cache.
+        """
+        self.evict(0)
+
+
+    def _entries(self) -> list[tuple[Path, float, int]]:
+        """
+        Returns the path, last use time and size of every cache entry.
+        """
+        entries = []
+        if not self.directory.is_dir():
+            return entries
+        for path in self.directory.glob("*/*"):
+            if path.name.endswith(".tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+
+    def _path(self, key: str) -> Path:
+        """
+        Returns the path of the file for a key. Entries are spread over
+        subdirectories by the first two characters of the key to keep
+        directories small.
+
+        :param key
+        Key returned by DiskCache.key.
+        """
+        return self.directory / key[:2] / key
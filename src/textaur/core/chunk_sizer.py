@@ -0,0 +1,234 @@
+"""
+Adaptive chunk sizing for textaur.
+
+Learns how big the chunks sent for linting should be, per model and mode, from
+how the requests of earlier runs went: how long they took for their size, how
+long their output was for their input, how often they failed, and where the
+model's output limit cut them short. What's learned is kept in a json file, so
+each run starts from what the runs before it learned.
+"""
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Optional
+from .metrics import percentile
+from .strutil import MAX_CHUNK_CHAR_COUNT
+
+# name of the file learned chunk sizes are kept in, in the cache directory
+CHUNK_SIZES_FILENAME = "chunk_sizes.json"
+
+# smallest and biggest chunk sizes adaptive sizing picks, in characters
+MIN_ADAPTIVE_CHUNK_CHARS = 2_000
+MAX_ADAPTIVE_CHUNK_CHARS = 40_000
+
+# the linting prompt is sent with every chunk, so chunks are kept at least this
+# share of the prompt's length, so the prompt doesn't make up most of a request
+MIN_CHUNK_SHARE_OF_PROMPT = 0.5
+
+# seconds a request should take at most, at the 95th percentile of the seconds
+# per character seen in a run
+TARGET_REQUEST_SECONDS = 120.0
+
+# share of the output limit (seen from truncated responses) a chunk's output is
+# kept under, since output length varies from chunk to chunk
+OUTPUT_LIMIT_HEADROOM = 0.7
+
+# share of failed requests above which chunks are made smaller, and the factor
+# they shrink by
+MAX_ERROR_RATE = 0.05
+ERROR_SHRINK_FACTOR = 0.75
+
+# factor chunks can grow by per run when nothing seen limits them
+MAX_GROWTH_FACTOR = 1.25
+
+# successful requests needed in a run before its latency and output ratio count
+MIN_SAMPLES = 5
+
+# weight of the latest run's target against the size learned before it
+LEARNING_RATE = 0.5
+
+# outcomes of a request
+OK = "ok"
+TRUNCATED = "truncated"
+ERROR = "error"
+
+
+class ChunkSizer:
+    """
+    Learns chunk sizes per model and mode. The linter reports every request
+    to record(); after a document is linted, learn() works out a new size
+    from what was recorded and saves it, and size() returns it for the next
+    document.
+
+        sizer = ChunkSizer(cache_dir / CHUNK_SIZES_FILENAME)
+        max_chunk_chars = sizer.size(LINTING_MODEL, "Screenplay")
+        ... lint, with AILinter(request_observer=sizer.record) ...
+        sizer.learn(LINTING_MODEL, "Screenplay", max_chunk_chars)
+    """
+    def __init__(self, path: Path, log=print) -> None:
+        """
+        :param path
+        Path of the json file to keep learned sizes in.
+
+        :param log
+        Function to use for logging.
+        """
+        self.path = Path(path)
+        self.log = log
+        self._samples = []
+
+
+    def size(self, model: str, mode: str, prompt_chars: int = 0) -> int:
+        """
+        Returns the max number of characters per chunk to use: the size
+        learned for the model and mode, or MAX_CHUNK_CHAR_COUNT when nothing
+        has been learned yet.
+
+        :param model
+        Linting model.
+
+        :param mode
+        Linting mode, eg "Screenplay".
+
+        :param prompt_chars
+        Length of the linting prompt. Chunks aren't made shorter than half of it.
+        """
+        entry = self._load().get(self._key(model, mode))
+        size = entry["max_chunk_chars"] if entry else MAX_CHUNK_CHAR_COUNT
+        return max(size, self._min_size(prompt_chars))
+
+
+    def record(self, input_chars: int, output_chars: int, seconds: float, outcome: str) -> None:
+        """
+        Records how a request went.
+
+        :param input_chars
+        Length of the text sent.
+
+        :param output_chars
+        Length of the output received (so far, when cut short).
+
+        :param seconds
+        Seconds the request took, not counting time waiting for a slot.
+
+        :param outcome
+        OK, TRUNCATED (cut short by the output limit) or ERROR.
+        """
+        self._samples.append((input_chars, output_chars, seconds, outcome))
+
+
+    def learn(self, model: str, mode: str, max_chunk_chars: int, prompt_chars: int = 0) -> Optional[int]:
+        """
+        Works out a new chunk size for the model and mode from the requests
+        recorded since the last call, saves it and returns it. Returns None
+        (and keeps the old size) when no requests were recorded, eg when every
+        chunk came from the cache.
+
+        :param model
+        Linting model.
+
+        :param mode
+        Linting mode, eg "Screenplay".
+
+        :param max_chunk_chars
+        Max number of characters per chunk the requests were made with.
+
+        :param prompt_chars
+        Length of the linting prompt. Chunks aren't made shorter than half of it.
+        """
+        samples, self._samples = self._samples, []
+        if not samples:
+            return None
+        target = self._target(samples, max_chunk_chars)
+        sizes = self._load()
+        key = self._key(model, mode)
+        entry = sizes.get(key, {"max_chunk_chars": max_chunk_chars, "runs": 0, "requests": 0})
+        size = (1 - LEARNING_RATE) * entry["max_chunk_chars"] + LEARNING_RATE * target
+        size = round(min(MAX_ADAPTIVE_CHUNK_CHARS, max(self._min_size(prompt_chars), size)))
+        sizes[key] = {
+            "max_chunk_chars": size,
+            "runs": entry["runs"] + 1,
+            "requests": entry["requests"] + len(samples),
+            "updated": time.time(),
+        }
+        self._save(sizes)
+        return size
+
+
+    @staticmethod
+    def _target(samples: list[tuple[int, int, float, str]], max_chunk_chars: int) -> float:
+        """
+        Returns the chunk size the requests of one run point to: the
+        smallest of the sizes that would keep requests under
+        TARGET_REQUEST_SECONDS and output under the output limit, shrunk when
+        too many requests failed, and grown when nothing limits it.
+
+        :param samples
+        Recorded requests, as (input chars, output chars, seconds, outcome).
+
+        :param max_chunk_chars
+        Max number of characters per chunk the requests were made with.
+        """
+        ok = [sample for sample in samples if sample[3] == OK and sample[0] > 0]
+        limits = [max_chunk_chars * MAX_GROWTH_FACTOR]
+        if len(ok) >= MIN_SAMPLES:
+            seconds_per_char = percentile(sorted(seconds / chars for chars, _, seconds, _ in ok), 95)
+            if seconds_per_char > 0:
+                limits.append(TARGET_REQUEST_SECONDS / seconds_per_char)
+        truncated = [sample for sample in samples if sample[3] == TRUNCATED and sample[1] > 0]
+        if truncated and ok:
+            # output that was cut short stops at the limit
+            output_limit = min(output for _, output, _, _ in truncated)
+            output_ratio = statistics.median(output / chars for chars, output, _, _ in ok)
+            if output_ratio > 0:
+                limits.append(OUTPUT_LIMIT_HEADROOM * output_limit / output_ratio)
+        target = min(limits)
+        errors = sum(1 for sample in samples if sample[3] == ERROR)
+        if errors / len(samples) > MAX_ERROR_RATE:
+            target = min(target, max_chunk_chars) * ERROR_SHRINK_FACTOR
+        return target
+
+
+    @staticmethod
+    def _min_size(prompt_chars: int) -> int:
+        return min(MAX_ADAPTIVE_CHUNK_CHARS,
+                   max(MIN_ADAPTIVE_CHUNK_CHARS, round(MIN_CHUNK_SHARE_OF_PROMPT * prompt_chars)))
+
+
+    @staticmethod
+    def _key(model: str, mode: str) -> str:
+        return f"{model}/{mode}"
+
+
+    def _load(self) -> dict:
+        """
+        Returns the learned sizes, or an empty dict if there are none or the
+        file can't be read.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                sizes = json.load(f)
+            return sizes if isinstance(sizes, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+
+    def _save(self, sizes: dict) -> None:
+        """
+        Writes the learned sizes, replacing the file atomically so a run killed
+        mid-write doesn't lose them.
+
+        :param sizes
+        Learned sizes to write.
+        """
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(sizes, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.log(f"Unable to save learned chunk sizes to {self.path}: {e}")
+            tmp.unlink(missing_ok=True)
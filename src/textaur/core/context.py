@@ -41,6 +41,10 @@ mode_to_prompt_path_map = {
 # defaults
 DEFAULT_LINTED_SUFFIX = "_linted.txt"
 DEFAULT_EXTRACTED_SUFFIX = "_extracted_text.txt"
+DEFAULT_FAILED_CHUNKS_SUFFIX = "_failed_chunks.json"
+DEFAULT_JOURNAL_SUFFIX = "_journal.jsonl"
+DEFAULT_STATS_SUFFIX = "_stats.json"
+DEFAULT_PROFILE_SUFFIX = "_profile"
 DEFAULT_MODE = Mode.TEXT
 
 class Context:
@@ -57,7 +61,9 @@ class Context:
                  custom_prompt_path,
                  progress_fn,
                  log,
-                 confirm):
+                 confirm,
+                 resume=False,
+                 auto_ocr=False):
         self.log = log
         self.confirm = confirm
         self.progress_fn = progress_fn
@@ -71,7 +77,9 @@ class Context:
             DEFAULT_EXTRACTED_SUFFIX,
         )
         self.use_ocr = bool(use_ocr)
+        self.auto_ocr = bool(auto_ocr) and not self.use_ocr
         self.no_lint = bool(no_lint)
+        self.resume = bool(resume)
         self.mode = mode_string_to_enum_map.get(mode, DEFAULT_MODE)
         self.prompt_text = self._get_prompt_text(
             provided_mode=mode_string_to_enum_map[mode] if mode else None,
@@ -148,6 +156,54 @@ class Context:
             return file.read().strip()
 
 
+    @property
+    def failed_chunks_file(self) -> Optional[Path]:
+        """
+        Path of the manifest listing the chunks that couldn't be linted. Saved
+        next to the output file.
+        """
+        if not self.output_file:
+            return None
+        return self.output_file.with_name(
+            f"{self.output_file.stem}{DEFAULT_FAILED_CHUNKS_SUFFIX}")
+
+
+    @property
+    def journal_file(self) -> Optional[Path]:
+        """
+        Path of the journal of linted chunks used to resume an interrupted
+        run. Saved next to the output file.
+        """
+        if not self.output_file:
+            return None
+        return self.output_file.with_name(
+            f"{self.output_file.stem}{DEFAULT_JOURNAL_SUFFIX}")
+
+
+    @property
+    def stats_file(self) -> Optional[Path]:
+        """
+        Path of the json file run stats are written to (with --stats). Saved
+        next to the output file.
+        """
+        if not self.output_file:
+            return None
+        return self.output_file.with_name(
+            f"{self.output_file.stem}{DEFAULT_STATS_SUFFIX}")
+
+
+    @property
+    def profile_dir(self) -> Optional[Path]:
+        """
+        Directory profiles of the run are written to (with --profile). Saved
+        next to the output file.
+        """
+        if not self.output_file:
+            return None
+        return self.output_file.with_name(
+            f"{self.output_file.stem}{DEFAULT_PROFILE_SUFFIX}")
+
+
     def is_valid_context(self) -> bool:
         """
         Returns true if the context is valid.
@@ -0,0 +1,149 @@
+"""
+Checkpoint journal of linted chunks, so an interrupted run can be resumed.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+
+class ChunkJournal:
+    """
+    Append-only journal of linted chunks. Each line is a json object with the
+    chunk index, the hash of the chunk text that was linted, and the linted
+    text. Every entry is flushed to disk as soon as it's recorded.
+
+    Header lines record what the chunks were linted with (model, API and a hash
+    of the prompt), so a resumed run can tell whether the journal still
+    applies, and the chunk size the document was split with (with adaptive
+    chunk sizing, it can change between runs), so a resumed run splits the
+    document the same way.
+    """
+    def __init__(self, path: Path) -> None:
+        """
+        :param path
+        Path of the journal file.
+        """
+        self.path = Path(path)
+        self._file = None
+
+
+    def load(self) -> dict[int, tuple[str, str]]:
+        """
+        Returns the recorded chunks as a dict of index to (hash, linted text).
+        A partially written last line (from a run that was killed mid-write) is
+        ignored.
+        """
+        entries = {}
+        if not self.path.is_file():
+            return entries
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[int(entry["index"])] = (entry["hash"], entry["text"])
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return entries
+
+
+    def open(self) -> None:
+        """
+        Opens the journal for appending.
+        """
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+
+
+    def record(self, index: int, chunk_hash: str, text: str) -> None:
+        """
+        Appends a linted chunk to the journal and flushes it to disk.
+
+        :param index
+        Index of the chunk in the document.
+
+        :param chunk_hash
+        Hash of the chunk text that was linted.
+
+        :param text
+        Linted text of the chunk.
+        """
+        self.open()
+        entry = {"index": index, "hash": chunk_hash, "text": text}
+        self._file.write(f"{json.dumps(entry)}\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+    def record_header(self, **fields) -> None:
+        """
+        Appends a header line (anything that isn't a chunk, eg the model and
+        prompt the chunks were linted with) to the journal and flushes it to
+        disk.
+
+        :param fields
+        Fields of the header, json-serializable.
+        """
+        self.open()
+        self._file.write(f"{json.dumps(fields)}\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+    def load_header(self) -> dict:
+        """
+        Returns the fields of every header line in the journal, merged in
+        order (later lines win).
+        """
+        header = {}
+        if not self.path.is_file():
+            return header
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and "index" not in entry:
+                    header.update(entry)
+        return header
+
+
+    def record_chunk_size(self, max_chunk_chars: int) -> None:
+        """
+        Records the max number of characters per chunk the document was split
+        with.
+
+        :param max_chunk_chars
+        Max number of characters per chunk.
+        """
+        self.record_header(max_chunk_chars=max_chunk_chars)
+
+
+    def load_chunk_size(self) -> Optional[int]:
+        """
+        Returns the last chunk size recorded in the journal, or None if there
+        is none.
+        """
+        try:
+            return int(self.load_header()["max_chunk_chars"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+
+    def close(self) -> None:
+        """
+        Flushes and closes the journal.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def remove(self) -> None:
+        """
+        Closes and deletes the journal.
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
+
@@ -0,0 +1,160 @@
+"""
+Run metrics for textaur.
+
+Textifier, Strutil, AILinter and Pipeline report counts (pages, chunks,
+retries, tokens) and timings (stages, queue wait, request latency) into a
+Metrics object. The default NullMetrics drops everything, so reporting costs
+next to nothing unless metrics are asked for.
+"""
+import json
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+# percentiles included in the summary of each timing
+SUMMARY_PERCENTILES = [50, 95, 99]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """
+    Returns the pct-th percentile of sorted values (nearest rank).
+
+    :param values
+    Sorted values to take the percentile of.
+
+    :param pct
+    Percentile, from 0 to 100.
+    """
+    rank = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class Metrics:
+    """
+    Collects counts and timings. Safe to report into from several threads
+    (text extraction runs in a worker thread while chunks are linted).
+    """
+    # false for metrics that drop everything, so callers can skip work that's
+    # only needed to report
+    enabled = True
+
+    def __init__(self) -> None:
+        self.counts = Counter()
+        self.timings = defaultdict(list)
+        self._lock = threading.Lock()
+
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Adds to a count.
+
+        :param name
+        Name of the count, eg "lint.retries".
+
+        :param value
+        Amount to add.
+        """
+        with self._lock:
+            self.counts[name] += value
+
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Records a timing.
+
+        :param name
+        Name of the timing, eg "lint.request_latency".
+
+        :param seconds
+        Duration in seconds.
+        """
+        with self._lock:
+            self.timings[name].append(seconds)
+
+
+    @contextmanager
+    def time(self, name: str):
+        """
+        Records how long the block takes as a timing.
+
+        :param name
+        Name of the timing.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+
+    def summary(self) -> dict:
+        """
+        Returns the counts, and the number, total, mean, max and percentiles
+        of each timing, as a json-serializable dict.
+        """
+        with self._lock:
+            counts = dict(sorted(self.counts.items()))
+            timings = {name: sorted(values) for name, values in sorted(self.timings.items())}
+        res = {"counts": counts, "timings": {}}
+        for name, values in timings.items():
+            if not values:
+                continue
+            stats = {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "max": values[-1],
+            }
+            for pct in SUMMARY_PERCENTILES:
+                stats[f"p{pct}"] = percentile(values, pct)
+            res["timings"][name] = stats
+        return res
+
+
+    def report(self) -> list[str]:
+        """
+        Returns the summary as lines of text for printing.
+        """
+        summary = self.summary()
+        lines = []
+        for name, stats in summary["timings"].items():
+            pcts = "  ".join(f"p{pct} {stats[f'p{pct}']:.3f}s" for pct in SUMMARY_PERCENTILES)
+            lines.append(f"{name:<28}{stats['total']:>10.2f}s total  {stats['count']:>6}x  {pcts}")
+        for name, value in summary["counts"].items():
+            lines.append(f"{name:<28}{value:>10}")
+        return lines
+
+
+    def save(self, path: Path) -> None:
+        """
+        Writes the summary to a json file.
+
+        :param path
+        Path of the json file.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics that drop everything reported into them.
+    """
+    enabled = False
+
+    # reused for every timed block, so timing costs no allocation
+    _null_context = nullcontext()
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+
+    def observe(self, name: str, seconds: float) -> None:
+        pass
+
+
+    def time(self, name: str):
+        return self._null_context
@@ -1,10 +1,97 @@
 """
 Pipeline class to run linting process on input text.
 """
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from collections.abc import AsyncGenerator, AsyncIterable, AsyncIterator, Awaitable, Callable
+from contextlib import aclosing, contextmanager
+from enum import Enum
+from pathlib import Path
+from typing import Optional
 from .context import Context, Mode
-from .textifier import Textifier, FileType, File
-from .ai_linter import AILinter
-from .strutil import Strutil
+from .textifier import (
+    Textifier,
+    FileType,
+    File,
+    DEFAULT_OCR_WORKERS,
+    DEFAULT_OCR_WINDOW,
+    DEFAULT_EXTRACT_WORKERS,
+)
+from .ai_linter import (
+    AILinter,
+    LINTING_MODEL,
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_STALL_TIMEOUT,
+)
+from .batch_linter import BatchLinter, DEFAULT_BATCH_POLL_INTERVAL
+from .strutil import Strutil, MAX_CHUNK_CHAR_COUNT
+from .chunk_sizer import ChunkSizer, CHUNK_SIZES_FILENAME
+from .cache import DiskCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES
+from .journal import ChunkJournal
+from .writer import OrderedChunkWriter
+from .tokenizer import Tokenizer
+from .metrics import Metrics, NullMetrics
+
+# subdirectory of the cache directory for cached lint results
+LINT_CACHE_SUBDIR = "lint"
+
+# subdirectory of the cache directory for cached extracted pages
+PAGE_CACHE_SUBDIR = "pages"
+
+# maximum number of extracted chunks waiting to be linted in streaming mode
+STREAM_QUEUE_SIZE = 8
+
+
+class RunStatus(str, Enum):
+    """
+    Enum for how the run on one input file ended.
+    """
+    DONE = "done"
+    PARTIAL = "partial"
+    EXTRACTED = "extracted"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+class RunSummary:
+    """
+    Outcome of running the pipeline on one input file.
+    """
+    def __init__(self, context: Context) -> None:
+        """
+        :param context
+        Context of the run.
+        """
+        self.context = context
+        self.status = RunStatus.FAILED
+        self.chunk_count = 0
+        self.failed_count = 0
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+
+
+    def describe(self) -> str:
+        """
+        Returns a one line description of the outcome.
+        """
+        match self.status:
+            case RunStatus.DONE:
+                detail = f"{self.chunk_count} pieces linted -> {self.context.output_file}"
+            case RunStatus.PARTIAL:
+                detail = f"{self.failed_count} of {self.chunk_count} pieces failed -> {self.context.output_file}"
+            case RunStatus.EXTRACTED:
+                detail = f"extracted -> {self.context.extracted_text_file}"
+            case RunStatus.SKIPPED:
+                detail = "skipped"
+            case _:
+                detail = self.error or "failed"
+        return f"{self.status.value:<10}{self.seconds:>8.1f}s  {self.context.input_file}: {detail}"
+
 
 class Pipeline:
     """
@@ -14,6 +101,28 @@ class Pipeline:
             self,
             log=print,
             progress_fn=lambda msg: print(f"\r{msg}", nl=False),
+            max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+            tokens_per_minute: Optional[int] = None,
+            max_connections: Optional[int] = None,
+            request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            use_cache: bool = True,
+            cache_dir: Optional[Path] = None,
+            ocr_workers: int = DEFAULT_OCR_WORKERS,
+            ocr_window: int = DEFAULT_OCR_WINDOW,
+            stream: bool = False,
+            extract_workers: int = DEFAULT_EXTRACT_WORKERS,
+            cache_max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+            max_chunk_tokens: Optional[int] = None,
+            batch_api: bool = False,
+            batch_id: Optional[str] = None,
+            batch_poll_interval: float = DEFAULT_BATCH_POLL_INTERVAL,
+            base_url: Optional[str] = None,
+            metrics: Optional[Metrics] = None,
+            profile: bool = False,
+            stream_responses: bool = False,
+            stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+            adaptive_chunks: bool = False,
         ) -> None:
         """
         Initializes the pipeline.
@@ -23,18 +132,186 @@ class Pipeline:
 
         :param progress_fn
         Function to use for progress updates.
+
+        :param max_concurrent_requests
+        Maximum number of linting requests in flight at the same time.
+
+        :param tokens_per_minute
+        Maximum number of tokens to send to the linting model per minute. No
+        limit when None.
+
+        :param max_connections
+        Maximum number of pooled connections to the linting API. Defaults to
+        max_concurrent_requests.
+
+        :param request_timeout
+        Seconds to wait for a single linting request before giving up on it.
+
+        :param max_retries
+        Number of times to retry a chunk after a rate limit, server error or
+        timeout before giving up on it.
+
+        :param use_cache
+        When true, reuse lint results for chunks already linted with the same
+        model and prompt instead of sending them to the model again, and reuse
+        pages already extracted from the same file with the same settings.
+
+        :param cache_dir
+        Directory to keep cached results in. Defaults to the user cache
+        directory.
+
+        :param ocr_workers
+        Number of processes to spread OCR across.
+
+        :param ocr_window
+        Maximum number of rendered pages to hold in memory at once during OCR.
+
+        :param stream
+        When true, PDF pages are chunked and sent for linting as soon as
+        they're extracted instead of after the whole document is extracted.
+
+        :param extract_workers
+        Number of processes to spread direct (non-OCR) PDF text extraction
+        across.
+
+        :param cache_max_bytes
+        Maximum size of each cache (lint results and extracted pages). Least
+        recently used entries are evicted past it.
+
+        :param max_chunk_tokens
+        Target max number of tokens per chunk sent for linting, counted with
+        the linting model's tokenizer. Chunks are measured in characters when
+        None.
+
+        :param batch_api
+        When true, each document's chunks are linted as one job with the
+        OpenAI Batch API instead of live requests. Slower to finish, but
+        cheaper and not subject to the per-minute rate limits.
+
+        :param batch_id
+        Id of an already submitted batch to collect the results of (eg after
+        an interrupted run) instead of submitting the chunks again. Implies
+        batch_api.
+
+        :param batch_poll_interval
+        Seconds to wait between checks on a running batch.
+
+        :param base_url
+        Base url of the OpenAI-compatible API to send linting requests to.
+        Defaults to OpenAI's.
+
+        :param metrics
+        Metrics that the pipeline and its extractor, chunker and linter report
+        stage times, request latency, retries and token usage into. Reports
+        nothing when None.
+
+        :param profile
+        When true, each stage of a run (extract, chunk, lint, write) is CPU
+        profiled and its memory traced, and the pstats files, top allocations
+        and a summary are saved to the context's profile directory, next to
+        the output. Slows the run down.
+
+        :param stream_responses
+        When true, linting responses are streamed, so time to first token is
+        reported and responses that stall partway are retried early.
+
+        :param stall_timeout
+        Seconds a streamed response can go without new output, once output
+        has started, before it's retried.
+
+        :param adaptive_chunks
+        When true, the size of the chunks sent for linting is learned per
+        model and mode from the latency, output length and failures of the
+        requests of earlier runs (kept in the cache directory), instead of
+        always being MAX_CHUNK_CHAR_COUNT characters. Ignored when
+        max_chunk_tokens is given.
         """
         self.log = log
         self.progress_fn = progress_fn
+        self.stream = stream
+        self.max_chunk_tokens = max_chunk_tokens
+        self.metrics = metrics or NullMetrics()
+        self.profile = profile
+        self._profilers = {}
+        self.cache_dir = Path(cache_dir) if cache_dir else DEFAULT_CACHE_DIR
+        lint_cache, page_cache = None, None
+        if use_cache:
+            lint_cache = DiskCache(self.cache_dir / LINT_CACHE_SUBDIR,
+                                   max_bytes=cache_max_bytes, log=self.log)
+            page_cache = DiskCache(self.cache_dir / PAGE_CACHE_SUBDIR,
+                                   max_bytes=cache_max_bytes, log=self.log)
         self.textifier = Textifier(
             log=self.log,
             progress_fn=self.progress_fn,
+            ocr_workers=ocr_workers,
+            ocr_window=ocr_window,
+            extract_workers=extract_workers,
+            cache=page_cache,
+            metrics=self.metrics,
+        )
+        tokenizer = Tokenizer(LINTING_MODEL)
+        if max_chunk_tokens is not None and not tokenizer.exact:
+            self.log(f"No tokenizer available for {LINTING_MODEL} (pip install tiktoken). Estimating tokens from character count.")
+        self.strutil = Strutil(log=self.log, tokenizer=tokenizer, metrics=self.metrics)
+        self.chunk_sizer = None
+        if adaptive_chunks and max_chunk_tokens is not None:
+            self.log("Chunks are measured in tokens; ignoring adaptive chunk sizing.")
+        elif adaptive_chunks:
+            self.chunk_sizer = ChunkSizer(self.cache_dir / CHUNK_SIZES_FILENAME, log=self.log)
+        self._chunk_sizes = {}
+        self._batch_api = batch_api or bool(batch_id)
+        self._linter_options = dict(
+            max_concurrent_requests=max_concurrent_requests,
+            tokens_per_minute=tokens_per_minute,
+            max_connections=max_connections,
+            request_timeout=request_timeout,
+            max_retries=max_retries,
+            cache=lint_cache,
+            tokenizer=tokenizer,
+            base_url=base_url,
+            metrics=self.metrics,
+            stream_responses=stream_responses,
+            stall_timeout=stall_timeout,
+            split_text=self.strutil.split_in_two,
+            request_observer=self.chunk_sizer.record if self.chunk_sizer else None,
         )
-        self.strutil = Strutil(log=self.log)
-        self.ai = AILinter()
+        if self._batch_api:
+            self._linter_options.update(
+                batch_id=batch_id,
+                poll_interval=batch_poll_interval,
+                log=self.log,
+            )
+        self._ai = None
 
 
-    async def run(self, context: Context) -> None:
+    @property
+    def ai(self) -> AILinter:
+        """
+        Linter the chunks are sent to. Created the first time it's needed, so
+        runs that don't lint (eg --no-lint) need no API key and never load
+        the OpenAI client.
+        """
+        if self._ai is None:
+            linter_class = BatchLinter if self._batch_api else AILinter
+            self._ai = linter_class(**self._linter_options)
+        return self._ai
+
+
+    @ai.setter
+    def ai(self, linter: AILinter) -> None:
+        self._ai = linter
+
+
+    async def _close_linter(self) -> None:
+        """
+        Releases the linter's pooled connections, if a linter was created. The
+        client is recreated if the pipeline is run again.
+        """
+        if self._ai is not None:
+            await self._ai.close()
+
+
+    async def run(self, context: Context) -> RunSummary:
         """
         Runs the linting process on the input text.
 
@@ -43,35 +320,346 @@ class Pipeline:
         options.
         """
         try:
-            file = self.textifier.extract_text(
-                file=context.input_file,
-                use_ocr=context.use_ocr
-            )
-            if (file.filetype == FileType.UNSUPPORTED or not file.filetype
-                or not (file.text or file.pages)):
-                self.log("Unable to extract text. Sorry!")
-                return
-            # Save the extracted text only if it wasn't a text file
-            if not file.filetype == FileType.TEXT:
-                extracted = "".join(file.pages) if file.pages else file.text
-                self.strutil.write_file(
-                    path=context.extracted_text_file,
-                    text=extracted,
+            return await self._run(context, RunSummary(context))
+        finally:
+            await self._close_linter()
+
+
+    async def run_batch(self, contexts: list[Context]) -> list[RunSummary]:
+        """
+        Runs the linting process on many input files, one after the other,
+        sharing one linter (and so one request and token budget) between them.
+        The next file is extracted and chunked while the current one is being
+        linted (unless profiling, so stages don't overlap). Logs a summary of
+        every file at the end.
+
+        :param contexts
+        Context objects of the input files, in the order to run them.
+        """
+        summaries = [RunSummary(context) for context in contexts]
+        extractions = {}
+
+        def start_extraction(idx: int) -> None:
+            if idx < len(contexts) and not self.profile and self._runnable(contexts[idx]) \
+               and not self._streams(contexts[idx]):
+                extractions[idx] = asyncio.ensure_future(asyncio.to_thread(
+                    self._extract_chunks, contexts[idx], summaries[idx]))
+
+        try:
+            for idx, context in enumerate(contexts):
+                self.log(f"\n[{idx + 1}/{len(contexts)}] {context.input_file}")
+                await self._run(
+                    context,
+                    summaries[idx],
+                    extraction=extractions.pop(idx, None),
+                    on_extracted=lambda idx=idx: start_extraction(idx + 1),
                 )
-                self.log(f"Saved extracted text to: {context.extracted_text_file}")
-            # if no lint, that's it
-            if context.no_lint:
-                return
-            # lint, save, declare victory
-            chunks = self._get_chunked(context, file)
+        finally:
+            for extraction in extractions.values():
+                extraction.cancel()
+            await self._close_linter()
+        self.log("\nSummary:")
+        for summary in summaries:
+            self.log(f"  {summary.describe()}")
+        return summaries
+
+
+    async def _run(
+        self,
+        context: Context,
+        summary: RunSummary,
+        extraction: Optional[Awaitable[Optional[list[str]]]] = None,
+        on_extracted: Optional[Callable[[], None]] = None,
+    ) -> RunSummary:
+        """
+        Runs the linting process on one input file and fills in its summary.
+
+        :param context
+        Context object containing input and output file paths, mode, and other 
+        options.
+
+        :param summary
+        Summary of the run to fill in.
+
+        :param extraction
+        Already started extraction of the input file (see _extract_chunks).
+        The file is extracted here when None.
+
+        :param on_extracted
+        Function called once the input file is extracted, eg to start
+        extracting the next file while this one is linted.
+        """
+        start = time.monotonic()
+        if self.profile and context.profile_dir:
+            from .profiler import StageProfiler
+            self._profilers[context] = StageProfiler(context.profile_dir)
+        try:
+            if not self._runnable(context):
+                summary.status = RunStatus.SKIPPED
+                return summary
+            if self._streams(context):
+                self.log("AI linting pieces as soon as they are extracted. This may take a while...")
+                await self._lint_and_save(context, self._stream_chunks(context), summary)
+                return summary
+            if extraction is None:
+                extraction = asyncio.to_thread(self._extract_chunks, context, summary)
+            chunks = await extraction
+            if on_extracted:
+                on_extracted()
+                on_extracted = None
+            if chunks is None:
+                return summary
             self.log(f"AI linting in a batch of {len(chunks)} pieces. This may take a while...")
-            linted_text = await self._get_linted(context, chunks)
-            self.log("AI linting complete.")
-            self.strutil.write_file(path=context.output_file, text=linted_text)
-            self.log(f"Saved linted text to: {context.output_file}")
-            self.log("Finished!")
+            await self._lint_and_save(context, self._iter_async(chunks), summary)
+        except asyncio.CancelledError:
+            if context.journal_file and context.journal_file.is_file():
+                self.log(f"\nInterrupted. Progress saved to: {context.journal_file}")
+                self.log("Rerun with --resume to pick up where you left off.")
+            raise
         except Exception as e:
             self.log(f"Encountered an unexpected error:\n{e}")
+            summary.status = RunStatus.FAILED
+            summary.error = str(e)
+        finally:
+            summary.seconds = time.monotonic() - start
+            self._chunk_sizes.pop(context, None)
+            profiler = self._profilers.pop(context, None)
+            if profiler and profiler.stages:
+                profiler.save()
+                self.log(f"Saved profile to: {profiler.directory}")
+            if on_extracted:
+                on_extracted()
+        return summary
+
+
+    @contextmanager
+    def _stage(self, context: Context, name: str, profile_name: Optional[str] = None):
+        """
+        Times the block as a stage of the run, and profiles it with --profile.
+
+        :param context
+        Context object of the run.
+
+        :param name
+        Name of the stage; timed as "stage.<name>".
+
+        :param profile_name
+        Name of the stage in the profile, when it differs from name.
+        """
+        profiler = self._profilers.get(context)
+        with self.metrics.time(f"stage.{name}"):
+            if profiler is None:
+                yield
+                return
+            with profiler.stage(profile_name or name):
+                yield
+
+
+    def _runnable(self, context: Context) -> bool:
+        """
+        Returns true if the context is valid (eg the user didn't decline to
+        overwrite its output files).
+
+        :param context
+        Context object to check.
+        """
+        return context.is_valid_context()
+
+
+    def _streams(self, context: Context) -> bool:
+        """
+        Returns true if the input file is linted as it's extracted.
+
+        :param context
+        Context object containing the input file and options.
+        """
+        return (self.stream and not context.no_lint
+                and self.textifier.filetype(context.input_file) == FileType.PDF)
+
+
+    def _extract_chunks(
+        self,
+        context: Context,
+        summary: RunSummary,
+    ) -> Optional[list[str]]:
+        """
+        Extracts the text of the input file, saves it if it's not a text file,
+        and returns it split into chunks for linting. Returns None when there's
+        nothing to lint (no text could be extracted, or --no-lint), with the
+        reason in the summary. Runs in a worker thread.
+
+        :param context
+        Context object containing input and output file paths, mode, and other 
+        options.
+
+        :param summary
+        Summary of the run to fill in.
+        """
+        with self._stage(context, "extract"):
+            file = self.textifier.extract_text(
+                file=context.input_file,
+                use_ocr=context.use_ocr,
+                auto_ocr=context.auto_ocr,
+            )
+        if (file.filetype == FileType.UNSUPPORTED or not file.filetype
+            or not (file.text or file.pages)):
+            self.log("Unable to extract text. Sorry!")
+            summary.status = RunStatus.FAILED
+            summary.error = "unable to extract text"
+            return None
+        # Save the extracted text only if it wasn't a text file
+        if not file.filetype == FileType.TEXT:
+            extracted = "".join(file.pages) if file.pages else file.text
+            self.strutil.write_file(
+                path=context.extracted_text_file,
+                text=extracted,
+            )
+            self.log(f"Saved extracted text to: {context.extracted_text_file}")
+        # if no lint, that's it
+        if context.no_lint:
+            summary.status = RunStatus.EXTRACTED
+            return None
+        with self._stage(context, "chunk"):
+            return self._get_chunked(context, file)
+
+
+    async def _lint_and_save(
+        self,
+        context: Context,
+        chunks: AsyncGenerator[str, None],
+        summary: RunSummary,
+    ) -> None:
+        """
+        Lints the chunks, saves the linted text and reports chunks that failed.
+
+        :param context
+        Context object containing input and output file paths, mode, and other 
+        options.
+
+        :param chunks
+        Async generator of text chunks to lint. It's closed as soon as linting
+        ends, so a stream stops extracting when linting fails or is cancelled.
+
+        :param summary
+        Summary of the run to fill in.
+        """
+        # lint, save, declare victory
+        hashes, failures = [], {}
+        writer = self._get_output_writer(context)
+        try:
+            # when streaming, pages are extracted and chunked while linting,
+            # so they're profiled together
+            profile_name = "stream" if self._streams(context) else None
+            with self._stage(context, "lint", profile_name):
+                async with aclosing(chunks):
+                    await self._get_linted(context, chunks, hashes, failures, writer)
+        except BaseException:
+            writer.discard()
+            raise
+        if self.chunk_sizer:
+            self._learn_chunk_size(context)
+        if not hashes:
+            writer.discard()
+            self.log("Unable to extract text. Sorry!")
+            summary.error = "unable to extract text"
+            return
+        self.log("AI linting complete.")
+        with self._stage(context, "write"):
+            writer.close()
+        self.metrics.count("chunks", len(hashes))
+        self.log(f"Saved linted text to: {context.output_file}")
+        self._save_failed_chunks(context, hashes, failures)
+        summary.chunk_count = len(hashes)
+        summary.failed_count = len(failures)
+        if failures:
+            summary.status = RunStatus.PARTIAL
+            self.log(f"{len(failures)} of {len(hashes)} pieces could not be linted and are missing from the output. See: {context.failed_chunks_file}")
+            self.log("Rerun with --resume to lint only the missing pieces.")
+            return
+        ChunkJournal(context.journal_file).remove()
+        summary.status = RunStatus.DONE
+        self.log("Finished!")
+
+
+    async def _stream_chunks(self, context: Context) -> AsyncIterator[str]:
+        """
+        Extracts the pages of a PDF in a worker thread and yields chunks for
+        linting as soon as they're complete, so extraction and linting overlap.
+        The extracted text is saved page by page along the way. The worker
+        waits when STREAM_QUEUE_SIZE chunks are waiting to be linted.
+
+        :param context
+        Context object containing the input and extracted text file paths.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+        end = object()
+
+        def put(item) -> bool:
+            # block the worker until there's room, unless the consumer stops
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stop.is_set():
+                try:
+                    future.result(timeout=0.1)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+            return False
+
+        def produce() -> None:
+            try:
+                with open(context.extracted_text_file, "w", encoding="utf-8") as f:
+                    def pages():
+                        extracted = self.textifier.iter_pages(
+                            context.input_file,
+                            use_ocr=context.use_ocr,
+                            auto_ocr=context.auto_ocr,
+                        )
+                        while True:
+                            # time only the extraction, not the waits for
+                            # the linter to take chunks
+                            with self.metrics.time("stage.extract"):
+                                page = next(extracted, None)
+                            if page is None:
+                                return
+                            f.write(page)
+                            yield page
+                    for chunk in self.strutil.iter_chunk_pages(
+                        pages(),
+                        max_chunk_chars=self._chunk_size(context),
+                        max_chunk_tokens=self.max_chunk_tokens,
+                    ):
+                        if not put(chunk):
+                            return
+            except Exception as e:
+                put(e)
+                return
+            put(end)
+
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        try:
+            while (item := await queue.get()) is not end:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            await producer
+        self.log(f"Saved extracted text to: {context.extracted_text_file}")
+
+
+    @staticmethod
+    async def _iter_async(items: list) -> AsyncIterator:
+        """
+        Yields the items of a list from an async iterator.
+
+        :param items
+        List of items to yield.
+        """
+        for item in items:
+            yield item
 
 
     def _get_chunked(self, context: Context, file: File) -> list[str]:
@@ -85,7 +673,11 @@ class Pipeline:
         File object containing the extracted text as pages or text.
         """
         if file.pages:
-            chunks = self.strutil.chunk_pages(file.pages)
+            chunks = self.strutil.chunk_pages(
+                file.pages,
+                max_chunk_chars=self._chunk_size(context),
+                max_chunk_tokens=self.max_chunk_tokens,
+            )
         elif file.text:
             # chunking files is different depending on the type of input text
             match context.mode:
@@ -93,41 +685,234 @@ class Pipeline:
                     chunk_fn = self.strutil.chunk_screenplay_text
                 case _:
                     chunk_fn = self.strutil.chunk_generic_text
-            chunks = chunk_fn(file.text)
+            chunks = chunk_fn(
+                file.text,
+                max_chunk_chars=self._chunk_size(context),
+                max_chunk_tokens=self.max_chunk_tokens,
+            )
         else:
             raise ValueError("Extracted text contains neither text nor pages.")
         return chunks
 
 
-    async def _get_linted(self, context: Context, chunks: list[str]) -> str:
+    def _chunk_size(self, context: Context) -> int:
         """
-        Lints the input text using the AI linter.
+        Returns the max number of characters per chunk to split the input file
+        into: the size learned for the model and mode with adaptive chunk
+        sizing, otherwise MAX_CHUNK_CHAR_COUNT. A resumed run uses the size
+        recorded in the journal, so the file is split the same way as in the
+        run being resumed.
+
+        :param context
+        Context object containing the mode, prompt and journal file.
+        """
+        if self.chunk_sizer is None:
+            return MAX_CHUNK_CHAR_COUNT
+        if context not in self._chunk_sizes:
+            size = None
+            journal = ChunkJournal(context.journal_file) if context.journal_file else None
+            if context.resume and journal and journal.path.is_file() \
+               and self._journal_applies(context, journal):
+                # a journal without a size is from a run without adaptive sizing
+                size = journal.load_chunk_size() or MAX_CHUNK_CHAR_COUNT
+            if size is None:
+                size = self.chunk_sizer.size(LINTING_MODEL, context.mode.value, len(context.prompt_text))
+            self.log(f"Splitting into pieces of up to {size} characters.")
+            self._chunk_sizes[context] = size
+        return self._chunk_sizes[context]
+
+
+    def _learn_chunk_size(self, context: Context) -> None:
+        """
+        Learns a new chunk size for the model and mode from the requests made
+        for the input file, for the files linted after it.
+
+        :param context
+        Context object containing the mode and prompt.
+        """
+        size = self.chunk_sizer.learn(
+            LINTING_MODEL,
+            context.mode.value,
+            self._chunk_size(context),
+            prompt_chars=len(context.prompt_text),
+        )
+        if size is not None:
+            self.log(f"Learned a piece size of {size} characters for {context.mode.value} mode.")
+
+
+    def _journal_header(self, context: Context) -> dict:
+        """
+        Returns what the chunks of the input file are linted with (model, API
+        and a hash of the prompt), recorded in its journal.
+
+        :param context
+        Context object containing the prompt.
+        """
+        return {
+            "model": LINTING_MODEL,
+            "base_url": self._linter_options["base_url"],
+            "prompt_hash": self.strutil.text_hash(context.prompt_text),
+        }
+
+
+    def _journal_applies(self, context: Context, journal: ChunkJournal) -> bool:
+        """
+        Returns true if the chunks in the journal were linted with the same
+        model, API and prompt as this run would lint them with, so they can
+        be reused when resuming.
+
+        :param context
+        Context object containing the prompt.
+
+        :param journal
+        Journal of the input file.
+        """
+        header = journal.load_header()
+        return all(header.get(name) == value
+                   for name, value in self._journal_header(context).items())
+
+
+    async def _get_linted(
+        self,
+        context: Context,
+        chunks: AsyncIterable[str],
+        hashes: list[str],
+        failures: dict[int, Exception],
+        writer: OrderedChunkWriter,
+    ) -> None:
+        """
+        Lints the input text using the AI linter, sending each chunk as soon as
+        it arrives, and passes each linted chunk to the writer as soon as it's
+        done. Chunks that can't be linted are skipped in the output and added
+        to failures.
+
+        Every linted chunk is recorded in the journal as soon as it's done. When
+        resuming, chunks already in the journal (and unchanged since) are
+        reused instead of being linted again, unless the journal was written
+        with a different model, API or prompt.
 
         :param context
         Context object containing input and output file paths, mode, and other 
         options.
 
         :param chunks
-        List of text chunks to lint.
+        Async iterable of text chunks to lint.
+
+        :param hashes
+        List to fill with the hash of every chunk, in order.
+
+        :param failures
+        Dict to fill with the index and error of every chunk that failed.
+
+        :param writer
+        Writer to write the linted chunks to, in order.
         """
-        raw_linted = await self.ai.batch_lint_texts(chunks, context.prompt_text)
-        return self._clean_up_raw_linted(
-            context=context,
-            text="\n".join(raw_linted),
-        )
+        journal = ChunkJournal(context.journal_file)
+        journaled = {}
+        if context.resume and journal.path.is_file() and not self._journal_applies(context, journal):
+            self.log("The journal was written with a different model or prompt. Linting every piece again.")
+            journal.remove()
+        elif context.resume:
+            journaled = journal.load()
+        else:
+            # start over; an old journal belongs to a different run
+            journal.remove()
+        if not journal.path.is_file():
+            journal.record_header(**self._journal_header(context))
+        if self.chunk_sizer and journal.load_chunk_size() is None:
+            journal.record_chunk_size(self._chunk_size(context))
+        # index of the chunk behind each text sent to the linter
+        pending = []
+        # chunks are written while they're linted, so writing them is timed as
+        # a part of the lint stage ("stage.lint.write"), not as a stage of its own
+
+        async def to_lint() -> AsyncIterator[str]:
+            async for chunk in chunks:
+                idx = len(hashes)
+                hashes.append(self.strutil.text_hash(chunk))
+                entry = journaled.get(idx)
+                if entry and entry[0] == hashes[idx]:
+                    with self.metrics.time("stage.lint.write"):
+                        writer.add(idx, entry[1])
+                    continue
+                pending.append(idx)
+                yield chunk
+
+        def on_success(pending_idx: int, text: str) -> None:
+            idx = pending[pending_idx]
+            with self.metrics.time("stage.lint.write"):
+                journal.record(idx, hashes[idx], text)
+                writer.add(idx, text)
 
+        def on_failure(pending_idx: int, error: Exception) -> None:
+            idx = pending[pending_idx]
+            failures[idx] = error
+            with self.metrics.time("stage.lint.write"):
+                writer.skip(idx)
+
+        try:
+            await self.ai.stream_lint_texts(
+                to_lint(),
+                context.prompt_text,
+                on_failure=on_failure,
+                on_success=on_success,
+                keep_results=False,
+            )
+        finally:
+            # flush whatever was linted, including when interrupted
+            journal.close()
+        if context.resume:
+            self.log(f"Resumed: {len(hashes) - len(pending)} of {len(hashes)} pieces were already linted.")
 
-    def _clean_up_raw_linted(self, context: Context, text: str) -> str:
+
+    def _save_failed_chunks(
+        self,
+        context: Context,
+        hashes: list[str],
+        failures: dict[int, Exception],
+    ) -> None:
         """
-        Cleans up the raw linted text.
+        Saves a json manifest of the chunks that couldn't be linted (index,
+        hash of the chunk text and error) next to the output file, or removes a
+        stale one if every chunk succeeded.
+
+        :param context
+        Context object containing the output file path.
+
+        :param hashes
+        Hashes of the text chunks that were linted.
+
+        :param failures
+        Dict of the index and error of every chunk that failed.
+        """
+        path = context.failed_chunks_file
+        if not failures:
+            path.unlink(missing_ok=True)
+            return
+        manifest = {
+            "input_file": str(context.input_file),
+            "output_file": str(context.output_file),
+            "chunk_count": len(hashes),
+            "failed_chunks": [
+                {
+                    "index": idx,
+                    "hash": hashes[idx],
+                    "error": f"{type(failures[idx]).__name__}: {failures[idx]}",
+                }
+                for idx in sorted(failures)
+            ],
+        }
+        self.strutil.write_file(path=path, text=json.dumps(manifest, indent=2))
+
+
+    def _get_output_writer(self, context: Context) -> OrderedChunkWriter:
+        """
+        Returns the writer for the linted output. Linted chunks are joined with
+        a newline and consecutive blank lines are collapsed as they're written.
 
         :param context
         Context object containing input and output file paths, mode, and other 
         options.
-
-        :param text
-        Raw linted text to clean up.
         """
         # future cleanup may vary depending on filetype
-        return self.strutil.remove_consecutive_blank_lines(text)
-
+        return OrderedChunkWriter(context.output_file, join_str="\n")
@@ -0,0 +1,187 @@
+"""
+Per-stage profiling for textaur.
+
+Wraps stages of a run (extraction, chunking, linting, writing) in a CPU
+profiler and tracemalloc, and writes the results to a directory: a pstats file
+per stage (open with python -m pstats or snakeviz), the allocations each stage
+made, and a summary of every stage.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+# number of functions listed per stage in the summary
+SUMMARY_FUNCTIONS = 20
+
+# number of allocation sites listed per stage
+TOP_ALLOCATIONS = 25
+
+# frames kept per allocation while tracing memory
+TRACEMALLOC_FRAMES = 1
+
+# name of the summary file in the profile directory
+SUMMARY_FILENAME = "summary.log"
+
+# only one CPU profiler can run at a time (since python 3.12 a profiler sees
+# every thread), so stages that overlap another profiled stage aren't profiled
+_cpu_profiler_lock = threading.Lock()
+
+# peak traced memory so far of each stage running, innermost last. tracemalloc
+# has one peak for the whole process, so a stage resets it when it starts and
+# folds its peak into the stage around it when it ends
+_peaks = []
+
+
+class StageProfiler:
+    """
+    Profiles the stages of a run. Each stage gets CPU time and a cProfile of
+    the calls made in it, its wall time, the peak memory traced while it ran,
+    and the allocation sites that grew the most during it. Stages can be
+    profiled more than once (eg once per file); the results add up.
+
+        profiler = StageProfiler(Path("my_profile"))
+        with profiler.stage("chunk"):
+            ...
+        profiler.save()
+    """
+    def __init__(self, directory: Path) -> None:
+        """
+        :param directory
+        Directory to write the profiles to. Created when the first stage ends.
+        """
+        self.directory = Path(directory)
+        self.stages = {}
+        self._profiles = {}
+
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Profiles the block as the named stage, and writes the stage's pstats
+        and allocations files when it ends.
+
+        :param name
+        Name of the stage, used in file names.
+        """
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        if _peaks:
+            _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+        _peaks.append(0)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profile = None
+        if _cpu_profiler_lock.acquire(blocking=False):
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            if profile:
+                profile.enable()
+            yield
+        finally:
+            if profile:
+                profile.disable()
+                _cpu_profiler_lock.release()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = max(_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+            after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self._record(name, wall, cpu, peak, profile is not None, before, after)
+
+
+    def save(self) -> None:
+        """
+        Writes the summary of every stage profiled so far.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / SUMMARY_FILENAME, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.summary()) + "\n")
+
+
+    def summary(self) -> list[str]:
+        """
+        Returns the summary of every stage as lines of text: wall time, CPU
+        time and peak memory, then the functions that took the most time.
+        """
+        lines = []
+        for name, stage in self.stages.items():
+            lines.append(
+                f"{name}: {stage['wall']:.2f}s wall, {stage['cpu']:.2f}s cpu, "
+                f"{stage['peak'] / (1024 * 1024):.1f}MB peak memory, {stage['runs']} run(s)")
+            profile = self._profiles.get(name)
+            if profile is None or not profile.getstats():
+                lines.append("  (not CPU profiled: overlapped another profiled stage)\n")
+                continue
+            out = io.StringIO()
+            stats = pstats.Stats(profile, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(SUMMARY_FUNCTIONS)
+            lines += [f"  {line}" for line in out.getvalue().strip().splitlines()]
+            lines.append("")
+        return lines
+
+
+    def _record(
+        self,
+        name: str,
+        wall: float,
+        cpu: float,
+        peak: int,
+        profiled: bool,
+        before: tracemalloc.Snapshot,
+        after: tracemalloc.Snapshot,
+    ) -> None:
+        """
+        Adds a run of a stage to its totals and writes its files.
+
+        :param name
+        Name of the stage.
+
+        :param wall
+        Wall time of the run in seconds.
+
+        :param cpu
+        CPU time of the run in seconds.
+
+        :param peak
+        Peak traced memory during the run in bytes.
+
+        :param profiled
+        Whether the run was CPU profiled.
+
+        :param before
+        Memory snapshot from the start of the run.
+
+        :param after
+        Memory snapshot from the end of the run.
+        """
+        stage = self.stages.setdefault(name, {"wall": 0.0, "cpu": 0.0, "peak": 0, "runs": 0})
+        stage["wall"] += wall
+        stage["cpu"] += cpu
+        stage["peak"] = max(stage["peak"], peak)
+        stage["runs"] += 1
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if profiled:
+            self._profiles[name].dump_stats(self.directory / f"{name}.pstats")
+        ignored = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, __file__),
+        ]
+        diff = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+        # start the file over on the first run of the stage, add to it after
+        mode = "w" if stage["runs"] == 1 else "a"
+        with open(self.directory / f"{name}_allocations.log", mode, encoding="utf-8") as f:
+            f.write(f"{name} run {stage['runs']}: peak {peak / (1024 * 1024):.1f}MB, "
+                    f"top {TOP_ALLOCATIONS} allocation sites by growth during the stage\n")
+            for stat in diff[:TOP_ALLOCATIONS]:
+                f.write(f"  {stat}\n")
+            f.write("\n")
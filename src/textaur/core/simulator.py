@@ -0,0 +1,584 @@
+"""
+Simulated LLM server for testing textaur offline.
+
+A local stand-in for the OpenAI chat completions endpoint, so the linter and
+the pipeline can be load tested without an API key, a network connection or
+any cost. Latency, injected errors, rate limits and the size of the output are
+all configurable. Every random choice is seeded by the request itself (and by
+how many times it's been sent), so a run gives the same results no matter what
+order concurrent requests arrive in.
+
+Point AILinter (or textaur --base-url) at LLMSimulator.base_url to use it.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from collections import Counter, deque
+from collections.abc import AsyncGenerator, AsyncIterator
+from http import HTTPStatus
+from typing import Optional
+from .tokenizer import estimate_tokens, CHARS_PER_TOKEN
+
+# distributions request latency can be drawn from
+LATENCY_DISTRIBUTIONS = ["fixed", "uniform", "exponential", "lognormal"]
+
+# default mean seconds before a response is sent
+DEFAULT_LATENCY = 0.5
+
+# default spread of the latency: sigma of the lognormal distribution, or the
+# fraction of the mean either side for the uniform one
+DEFAULT_LATENCY_SPREAD = 0.5
+
+# seconds a rate limited request is told to wait when no rate limit is set
+DEFAULT_RETRY_AFTER = 1.0
+
+# status codes injected as server errors
+SERVER_ERROR_STATUSES = [500, 502, 503]
+
+# window the simulated rate limits are counted over, in seconds
+RATE_LIMIT_WINDOW = 60.0
+
+# path of the chat completions endpoint
+CHAT_COMPLETIONS_PATH = "/v1/chat/completions"
+
+# number of tokens sent per event of a streamed response
+STREAM_CHUNK_TOKENS = 4
+
+
+class LLMSimulator:
+    """
+    Local OpenAI-compatible chat completions server. Answers each request by
+    echoing back the text to lint (the user message after its first blank
+    line), scaled by output_ratio, after a simulated delay. Can inject rate
+    limit and server errors at random, enforce requests and tokens per minute
+    limits with the same headers OpenAI sends, and cut responses short with
+    finish_reason "length". Streams the response as server-sent events when
+    the request asks for it, and can stall streams partway through.
+
+    Keeps counts of the responses it sent by status code and of the most
+    requests it had in flight at once, to check what a client did.
+    """
+    def __init__(
+        self,
+        latency: float = DEFAULT_LATENCY,
+        latency_distribution: str = "lognormal",
+        latency_spread: float = DEFAULT_LATENCY_SPREAD,
+        seconds_per_output_token: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        output_ratio: float = 1.0,
+        truncation_rate: float = 0.0,
+        max_output_tokens: Optional[int] = None,
+        reasoning_ratio: float = 0.0,
+        stall_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """
+        :param latency
+        Mean seconds to wait before responding.
+
+        :param latency_distribution
+        Distribution the latency of each request is drawn from, one of
+        LATENCY_DISTRIBUTIONS.
+
+        :param latency_spread
+        Sigma of the lognormal distribution, or the fraction of the mean the
+        uniform distribution spreads either side. Unused by the others.
+
+        :param seconds_per_output_token
+        Extra seconds to wait per output token, so long outputs take longer.
+        Streamed responses send their first token after the latency and the
+        rest at this pace.
+
+        :param rate_limit_rate
+        Chance of answering a request with a 429 rate limit error.
+
+        :param server_error_rate
+        Chance of answering a request with a 5xx server error.
+
+        :param requests_per_minute
+        Requests allowed per minute before answering with 429. No limit when
+        None.
+
+        :param tokens_per_minute
+        Tokens (input and output) allowed per minute before answering with
+        429. No limit when None.
+
+        :param output_ratio
+        Length of the output relative to the text to lint.
+
+        :param truncation_rate
+        Chance of cutting the output in half with finish_reason "length".
+
+        :param max_output_tokens
+        Output limit: longer outputs are cut off at it with finish_reason
+        "length", like a model's max output tokens. No limit when None.
+
+        :param reasoning_ratio
+        Number of reasoning tokens reported in usage, relative to the output
+        tokens.
+
+        :param stall_rate
+        Chance of a streamed response stopping halfway through its output
+        and sending nothing more.
+
+        :param seed
+        Seed for every random choice.
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution must be one of {LATENCY_DISTRIBUTIONS}")
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.latency_spread = latency_spread
+        self.seconds_per_output_token = seconds_per_output_token
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.output_ratio = output_ratio
+        self.truncation_rate = truncation_rate
+        self.max_output_tokens = max_output_tokens
+        self.reasoning_ratio = reasoning_ratio
+        self.stall_rate = stall_rate
+        self.seed = seed
+        self.responses = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.host = None
+        self.port = None
+        self._attempts = Counter()
+        self._usage = deque()
+        self._server = None
+        self._connections = set()
+
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base url to give the OpenAI client.
+        """
+        return f"http://{self.host}:{self.port}/v1"
+
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        Starts serving.
+
+        :param host
+        Address to listen on.
+
+        :param port
+        Port to listen on. Picks a free one when 0.
+        """
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+
+
+    async def close(self) -> None:
+        """
+        Stops serving and closes open connections.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        connections = list(self._connections)
+        for task in connections:
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+    async def respond(self, body: dict) -> tuple[int, dict, dict | AsyncIterator[dict]]:
+        """
+        Returns the status code, headers and json body of the response to a
+        chat completion request, after the simulated delay. The body of a
+        successful streamed response is an async iterator of the events to
+        send instead.
+
+        :param body
+        Json body of the request.
+        """
+        messages = body.get("messages") or []
+        text = messages[-1].get("content", "") if messages else ""
+        # the text to lint follows the instructions in the user message
+        _, _, text = text.partition("\n\n")
+        rng = self._rng(body)
+
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        content = self._output(text)
+        finish_reason = "stop"
+        if rng.random() < self.truncation_rate:
+            content = content[:len(content) // 2]
+            finish_reason = "length"
+        if self.max_output_tokens is not None and estimate_tokens(content) > self.max_output_tokens:
+            content = content[:self.max_output_tokens * CHARS_PER_TOKEN]
+            finish_reason = "length"
+        completion_tokens = estimate_tokens(content)
+        reasoning_tokens = int(completion_tokens * self.reasoning_ratio)
+        total_tokens = prompt_tokens + completion_tokens + reasoning_tokens
+
+        roll = rng.random()
+        headers, retry_after = self._check_rate_limits(total_tokens)
+        if retry_after is not None or roll < self.rate_limit_rate:
+            retry_after = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+            headers["retry-after-ms"] = str(int(retry_after * 1000))
+            return 429, headers, self._error("Rate limit reached", "rate_limit_exceeded")
+        # count the request against the limits as soon as it's admitted, so
+        # requests still in flight count too
+        self._usage.append((time.monotonic(), total_tokens))
+
+        stream = bool(body.get("stream"))
+        delay = self._latency(rng)
+        if not stream:
+            delay += completion_tokens * self.seconds_per_output_token
+        await asyncio.sleep(delay)
+        if roll < self.rate_limit_rate + self.server_error_rate:
+            status = rng.choice(SERVER_ERROR_STATUSES)
+            return status, headers, self._error("The server had an error", "server_error")
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens + reasoning_tokens,
+            "total_tokens": total_tokens,
+            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+        }
+        if stream:
+            stalls = rng.random() < self.stall_rate
+            return 200, headers, self._stream_events(body, content, finish_reason, usage, stalls)
+        return 200, headers, {
+            "id": f"chatcmpl-sim-{sum(self.responses.values())}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        }
+
+
+    async def _stream_events(
+        self,
+        body: dict,
+        content: str,
+        finish_reason: str,
+        usage: dict,
+        stalls: bool,
+    ) -> AsyncIterator[dict]:
+        """
+        Yields the chunks of a streamed response: the role, the content a few
+        tokens at a time, the finish reason and (when asked for) the usage.
+
+        :param body
+        Json body of the request.
+
+        :param content
+        Output to send.
+
+        :param finish_reason
+        Finish reason to send after the output.
+
+        :param usage
+        Usage to send, if the request asks for it.
+
+        :param stalls
+        When true, the stream stops halfway through the output and sends
+        nothing more until the client gives up.
+        """
+        base = {
+            "id": f"chatcmpl-sim-{sum(self.responses.values())}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+        }
+
+        def event(delta: dict, reason: Optional[str] = None) -> dict:
+            return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": reason}]}
+
+        yield event({"role": "assistant", "content": ""})
+        size = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+        pieces = [content[idx:idx + size] for idx in range(0, len(content), size)]
+        stall_at = max(1, len(pieces) // 2) if stalls else None
+        for idx, piece in enumerate(pieces):
+            if idx and self.seconds_per_output_token:
+                await asyncio.sleep(estimate_tokens(piece) * self.seconds_per_output_token)
+            yield event({"content": piece})
+            if idx + 1 == stall_at:
+                await asyncio.Event().wait()
+        yield event({}, finish_reason)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield {**base, "choices": [], "usage": usage}
+
+
+    def _rng(self, body: dict) -> random.Random:
+        """
+        Returns the random number generator for a request. Depends only on the
+        seed, the request and how many times the same request was sent before,
+        so a retry doesn't get the same roll as the attempt before it.
+
+        :param body
+        Json body of the request.
+        """
+        key = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        attempt = self._attempts[key]
+        self._attempts[key] += 1
+        return random.Random(f"{self.seed}:{key}:{attempt}")
+
+
+    def _latency(self, rng: random.Random) -> float:
+        """
+        Returns a latency drawn from the configured distribution.
+
+        :param rng
+        Random number generator of the request.
+        """
+        match self.latency_distribution:
+            case "fixed":
+                return self.latency
+            case "uniform":
+                spread = self.latency * self.latency_spread
+                return max(0.0, rng.uniform(self.latency - spread, self.latency + spread))
+            case "exponential":
+                return rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            case _:
+                if self.latency <= 0:
+                    return 0.0
+                # pick mu so the mean of the distribution is the latency
+                sigma = self.latency_spread
+                return rng.lognormvariate(math.log(self.latency) - sigma ** 2 / 2, sigma)
+
+
+    def _output(self, text: str) -> str:
+        """
+        Returns the text scaled to output_ratio of its length.
+
+        :param text
+        Text to lint.
+        """
+        length = int(len(text) * self.output_ratio)
+        if not text or length <= len(text):
+            return text[:length]
+        return (text * math.ceil(length / len(text)))[:length]
+
+
+    def _check_rate_limits(self, tokens: int) -> tuple[dict, Optional[float]]:
+        """
+        Returns the rate limit headers for a request, and the seconds it has
+        to wait if it's over a limit (None if it isn't).
+
+        :param tokens
+        Number of tokens the request would use.
+        """
+        headers = {}
+        retry_after = None
+        now = time.monotonic()
+        while self._usage and self._usage[0][0] <= now - RATE_LIMIT_WINDOW:
+            self._usage.popleft()
+        limits = [
+            ("requests", self.requests_per_minute, 1, lambda usage: 1),
+            ("tokens", self.tokens_per_minute, tokens, lambda usage: usage[1]),
+        ]
+        for name, limit, needed, used_by in limits:
+            if not limit:
+                continue
+            used = sum(used_by(usage) for usage in self._usage)
+            remaining = max(0, limit - used)
+            # seconds until enough of the window expires to fit the request
+            reset = 0.0
+            for at, amount in self._usage:
+                if used + needed <= limit:
+                    break
+                used -= used_by((at, amount))
+                reset = at + RATE_LIMIT_WINDOW - now
+            headers[f"x-ratelimit-limit-{name}"] = str(limit)
+            headers[f"x-ratelimit-remaining-{name}"] = str(remaining)
+            headers[f"x-ratelimit-reset-{name}"] = f"{reset:.3f}s"
+            if needed > remaining:
+                retry_after = max(retry_after or 0.0, reset)
+        return headers, retry_after
+
+
+    def _error(self, message: str, code: str) -> dict:
+        """
+        Returns the json body of an error response.
+
+        :param message
+        Error message.
+
+        :param code
+        Error code.
+        """
+        return {"error": {"message": message, "type": code, "code": code}}
+
+
+    async def _serve_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """
+        Serves HTTP/1.1 requests on a connection until the client closes it.
+
+        :param reader
+        Stream to read requests from.
+
+        :param writer
+        Stream to write responses to.
+        """
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, response_headers, payload = await self._handle(method, path, body)
+                self.responses[status] += 1
+                if isinstance(payload, dict):
+                    content = json.dumps(payload).encode("utf-8")
+                    head = [
+                        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                        "content-type: application/json",
+                        f"content-length: {len(content)}",
+                        *[f"{name}: {value}" for name, value in response_headers.items()],
+                    ]
+                    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + content)
+                    await writer.drain()
+                else:
+                    await self._write_event_stream(writer, status, response_headers, payload)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # the server is closing; end the connection quietly
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+
+    async def _write_event_stream(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        headers: dict,
+        events: AsyncGenerator[dict, None],
+    ) -> None:
+        """
+        Writes a streamed response as server-sent events, in chunked transfer
+        encoding, sending each event as soon as it's ready.
+
+        :param writer
+        Stream to write the response to.
+
+        :param status
+        Status code of the response.
+
+        :param headers
+        Extra headers of the response.
+
+        :param events
+        Json events to send.
+        """
+        head = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            "content-type: text/event-stream",
+            "transfer-encoding: chunked",
+            *[f"{name}: {value}" for name, value in headers.items()],
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+        async def send(data: str) -> None:
+            encoded = data.encode("utf-8")
+            writer.write(f"{len(encoded):x}\r\n".encode("latin-1") + encoded + b"\r\n")
+            await writer.drain()
+
+        try:
+            async for event in events:
+                await send(f"data: {json.dumps(event)}\n\n")
+        finally:
+            # finish the events now, even if the client went away
+            await events.aclose()
+        await send("data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+    async def _handle(
+        self,
+        method: str,
+        path: str,
+        body: bytes,
+    ) -> tuple[int, dict, dict | AsyncIterator[dict]]:
+        """
+        Returns the status code, headers and json body (or events, for a
+        streamed response) of the response to a request.
+
+        :param method
+        HTTP method of the request.
+
+        :param path
+        Path of the request.
+
+        :param body
+        Raw body of the request.
+        """
+        if method != "POST" or path.split("?")[0] != CHAT_COMPLETIONS_PATH:
+            return 404, {}, self._error(f"No such endpoint: {method} {path}", "not_found")
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, {}, self._error("Invalid json", "invalid_request_error")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        streaming = False
+        try:
+            status, headers, payload = await self.respond(request)
+            if isinstance(payload, dict):
+                return status, headers, payload
+            streaming = True
+            return status, headers, self._count_in_flight(payload)
+        finally:
+            if not streaming:
+                self.in_flight -= 1
+
+
+    async def _count_in_flight(self, events: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """
+        Yields the events of a streamed response, and counts the request as
+        in flight until the last one is sent (or the client goes away).
+
+        :param events
+        Events of the response.
+        """
+        try:
+            async for event in events:
+                yield event
+        finally:
+            self.in_flight -= 1
@@ -1,10 +1,17 @@
 """
 String utilities for textaur.
 """
+import hashlib
 import re
-from typing import Callable
-from collections.abc import Iterable
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import chain, compress, product
+from typing import Callable, Optional
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from .tokenizer import Tokenizer
+from .metrics import Metrics, NullMetrics
 
 # arbitrary default number of maximum characters to lint at one time
 # 10_000 is about 10 pages of screenplay, or less of scanned book text
@@ -44,24 +51,308 @@ SCENE_TRANSITION_KEYWORDS=[
     "DISSOLVE TO",
 ]
 
-# Fountain scene headings are a "." followed by any alphanumeric character
-RE_FOUNTAIN_SCENE_HEADING = re.compile(r"^\.[a-zA-Z0-9]")
+# The patterns below each match one line of a given kind, from the start of
+# the line. Whitespace is matched with [^\S\n] instead of \s so a match never
+# runs onto the next line, which lets them run over a whole document at once.
+# Runs of whitespace are matched possessively (*+) so a line that doesn't
+# match fails without backtracking through its indentation.
 
-# A line that is just a 1-4 digit number with or without a trailing period looks
-# like a page number
-RE_PAGE_NUMBER = re.compile(r"^\s*(\d{1,4})\.?\s*$")
 
-# A line that is just 1-10 lower case roman numerals with or without a trailing
-# period looks like a page number
-RE_ROMAN_NUMERAL_PAGE_NUMBER = re.compile(r"^\s*[ivxlc]{1,10}\.?\s*$")
+def _keywords_pattern(keywords: list[str]) -> str:
+    """
+    Returns a case insensitive pattern that matches any of a list of keywords.
+    The first character is checked on its own before trying every keyword,
+    which makes lines that can't match fail much faster.
+
+    :param keywords
+    Keywords to match.
+    """
+    first_chars = "".join(sorted({re.escape(k[0]) for k in keywords}))
+    alternatives = "|".join(re.escape(k) for k in keywords)
+    return f"(?i:(?=[{first_chars}])(?:{alternatives}))"
+
+
+# A line that starts with a scene heading keyword (in any case) is a scene
+# heading. So is a fountain scene heading: a "." followed by any alphanumeric
+# character (ie ".ext" or ".some scene" but not "...some scene")
+SCENE_HEADING_PATTERN = (
+    r"[^\S\n]*+(?:"
+    + _keywords_pattern(SCENE_HEADING_KEYWORDS)
+    + r"|\.(?i:[a-z0-9]))"
+)
+
+# A line that starts with a scene transition keyword (in any case) is a scene
+# transition. So is any line ending in " TO:", as in fountain
+SCENE_TRANSITION_PATTERN = (
+    r"[^\S\n]*+"
+    + _keywords_pattern(SCENE_TRANSITION_KEYWORDS)
+    + r"|[^\n]*\ (?i:TO:)[^\S\n]*+$"
+)
+
+# A line that is just a 1-4 digit number or 1-10 lower case roman numerals, with
+# or without a trailing period, looks like a page number
+PAGE_NUMBER_PATTERN = r"[^\S\n]*+(?:\d{1,4}|[ivxlc]{1,10})\.?[^\S\n]*+$"
+
+# A line that is empty or just one non-alphanumeric character is emptyish
+EMPTYISH_PATTERN = r"[^\S\n]*+(?:[^\w\s]|_)?[^\S\n]*+$"
+
+# flags for the kinds of line in a LineIndex. a line can be more than one kind.
+LINE_SCENE_HEADING = 1
+LINE_TRANSITION = 2
+LINE_PAGE_NUMBER = 4
+LINE_EMPTYISH = 8
+
+LINE_KIND_PATTERNS = {
+    LINE_SCENE_HEADING: SCENE_HEADING_PATTERN,
+    LINE_TRANSITION: SCENE_TRANSITION_PATTERN,
+    LINE_PAGE_NUMBER: PAGE_NUMBER_PATTERN,
+    LINE_EMPTYISH: EMPTYISH_PATTERN,
+}
+
+RE_SCENE_HEADING = re.compile(SCENE_HEADING_PATTERN, re.MULTILINE)
+RE_SCENE_TRANSITION = re.compile(SCENE_TRANSITION_PATTERN, re.MULTILINE)
+RE_PAGE_NUMBER = re.compile(PAGE_NUMBER_PATTERN, re.MULTILINE)
+RE_EMPTYISH = re.compile(EMPTYISH_PATTERN, re.MULTILINE)
+
+# every kind of line
+ALL_LINE_KINDS = LINE_SCENE_HEADING | LINE_TRANSITION | LINE_PAGE_NUMBER | LINE_EMPTYISH
+
+# kinds of line split_in_two splits before, best first
+SPLIT_LINE_KINDS = (LINE_SCENE_HEADING, LINE_TRANSITION, LINE_PAGE_NUMBER, LINE_EMPTYISH)
+
+# how far from the middle of a text split_in_two looks for a place to split,
+# as a fraction of the text's length either side
+SPLIT_WINDOW = 0.25
+
+
+@lru_cache
+def _line_kinds_matcher(kinds: int) -> tuple[re.Pattern, re.Pattern, dict]:
+    """
+    Returns one compiled pattern that matches a line that is any of the given
+    kinds from its start, the same pattern for lines after a newline, and the
+    flags of a line by the groups of a match.
+
+    Each kind is checked with a lookahead into an empty group named after its
+    flag, so one match says every kind the line is without consuming any of
+    it. A line that is none of the kinds fails on the conditionals at the end.
+    Searching from the newline before each line is much faster than trying ^
+    at every position in the text.
+
+    :param kinds
+    LINE_* flags of the kinds of line to match, or'd together.
+    """
+    patterns = {f: p for f, p in LINE_KIND_PATTERNS.items() if f & kinds}
+    pattern = (
+        "".join(f"(?:(?={p})(?P<kind{f}>))?" for f, p in patterns.items())
+        + "".join(f"(?(kind{f})|" for f in patterns) + "(?!)" + ")" * len(patterns)
+    )
+    # each group is "" if the line is that kind, None if it isn't
+    flags = {
+        groups: sum(f for f, group in zip(patterns, groups) if group is not None)
+        for groups in product(("", None), repeat=len(patterns))
+    }
+    return (
+        re.compile(pattern, re.MULTILINE),
+        re.compile("\n" + pattern, re.MULTILINE),
+        flags,
+    )
+
+
+class LineIndex:
+    """
+    Index of the lines of a text that are a scene heading, transition, page
+    number or emptyish: the offset each of those lines starts at, and a flag
+    byte saying which kinds it is. Built in one pass over the text with one
+    combined pattern, so the text can be split by any kind of line any number
+    of times without splitting it into lines or checking a line twice.
+
+    Ranges of lines are half-open ranges of offsets, start:end, where start is
+    the offset a line starts at and end is the offset the line after the last
+    one starts at (len(text) + 1 after the last line). The text of a range is
+    text[start:end - 1], without the newline at its end.
+    """
+    def __init__(self, text: str, kinds: int = ALL_LINE_KINDS) -> None:
+        """
+        :param text
+        Text to index.
+
+        :param kinds
+        LINE_* flags of the kinds of line to index, or'd together. Indexing
+        only the kinds that will be split by is faster.
+        """
+        self.text = text
+        self.kinds = kinds
+        self.end = len(text) + 1
+        self.offsets = array("q")
+        self.flags = bytearray()
+        self._lines_of_kind = {}
+
+        re_first, re_rest, flags_by_groups = _line_kinds_matcher(kinds)
+        first = re_first.match(text)
+        rest = re_rest.finditer(text)
+        for m in chain([first] if first else [], rest):
+            # the match only consumes the newline before the line, if any
+            self.offsets.append(m.end())
+            self.flags.append(flags_by_groups[m.groups()])
+
+
+    def lines_of_kind(self, kind: int) -> array:
+        """
+        Returns the start offsets of the lines of a kind, in order.
+
+        :param kind
+        LINE_* flag of the lines to find. Must be one of the indexed kinds.
+        """
+        if not kind & self.kinds:
+            raise ValueError(f"Line kind {kind} is not indexed")
+        if kind not in self._lines_of_kind:
+            self._lines_of_kind[kind] = array("q", compress(
+                self.offsets,
+                (flags & kind for flags in self.flags),
+            ))
+        return self._lines_of_kind[kind]
+
+
+    def split(self, start: int, end: int, kind: int) -> list[tuple[int, int]]:
+        """
+        Splits a range of lines before every line of a kind, and returns the
+        ranges. The first line of the range never starts a new range.
+
+        :param start
+        Offset of the first line of the range.
+
+        :param end
+        Offset of the line after the range.
+
+        :param kind
+        LINE_* flag of the lines to split before.
+        """
+        lines = self.lines_of_kind(kind)
+        cuts = lines[bisect_right(lines, start):bisect_left(lines, end)]
+        bounds = [start, *cuts, end]
+        return list(zip(bounds, bounds[1:]))
+
+
+    def slice(self, start: int, end: int) -> str:
+        """
+        Returns the text of a range of lines.
+
+        :param start
+        Offset of the first line of the range.
+
+        :param end
+        Offset of the line after the range.
+        """
+        return self.text[start:end - 1]
+
+
+    @staticmethod
+    def char_count(start: int, end: int) -> int:
+        """
+        Returns the length of the text of a range of lines without slicing it.
+
+        :param start
+        Offset of the first line of the range.
+
+        :param end
+        Offset of the line after the range.
+        """
+        return end - 1 - start
+
+
+class BlankLineCollapser:
+    """
+    Incremental version of Strutil.remove_consecutive_blank_lines. Text is fed
+    in pieces, split anywhere (even mid-line), and each call returns the part
+    of the result that's certain so far. The concatenation of everything
+    returned by feed and finish is exactly
+    remove_consecutive_blank_lines(<all the pieces joined together>).
+
+    A blank line is only kept if the line after it isn't blank, so a blank
+    line is held back until the next line shows up, and the last line is held
+    back until finish since there's no telling where it ends.
+    """
+    def __init__(self) -> None:
+        # unfinished last line
+        self._partial = ""
+        # last blank line of the current run of blank lines, if any
+        self._blank = None
+        # whether any line has been returned yet (every line after the first
+        # is preceded by a newline)
+        self._started = False
+
+
+    def feed(self, text: str) -> str:
+        """
+        Takes the next piece of text and returns the collapsed text that's
+        ready to be written.
+
+        :param text
+        Next piece of text.
+        """
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        return self._collapse(lines)
+
+
+    def finish(self) -> str:
+        """
+        Returns the rest of the collapsed text once there's no more input.
+        """
+        res = self._collapse([self._partial])
+        self._partial = ""
+        return res
+
+
+    def _collapse(self, lines: list[str]) -> str:
+        """
+        Returns the kept lines out of a list of complete lines, each preceded
+        by a newline unless it's the first line of the whole result.
+
+        :param lines
+        Complete lines, in order.
+        """
+        out = []
+        for line in lines:
+            if line.strip() == "":
+                self._blank = line
+                continue
+            if self._blank is not None:
+                out.append(self._blank)
+                self._blank = None
+            out.append(line)
+        if not out:
+            return ""
+        res = "\n".join(out)
+        if self._started:
+            res = "\n" + res
+        self._started = True
+        return res
 
 
 class Strutil:
     """
     String utility class for handling textaur string operations.
     """
-    def __init__(self, log: Callable = print):
+    def __init__(
+        self,
+        log: Callable = print,
+        tokenizer: Optional[Tokenizer] = None,
+        metrics: Optional[Metrics] = None,
+    ):
+        """
+        :param log
+        Function to use for logging.
+
+        :param tokenizer
+        Tokenizer used to measure chunks when chunking by token count.
+
+        :param metrics
+        Metrics to report into. Reports nothing when None.
+        """
         self.log = log
+        self.tokenizer = tokenizer or Tokenizer()
+        self.metrics = metrics or NullMetrics()
 
 
     def chunk_pages(
@@ -69,6 +360,7 @@ class Strutil:
         pages: list[str],
         max_chunk_chars: int=MAX_CHUNK_CHAR_COUNT,
         join_str: str="\n\n",
+        max_chunk_tokens: Optional[int]=None,
     ) -> list[str]:
         """
         Takes a list of strings, concatenates them together, maintaining order
@@ -90,12 +382,45 @@ class Strutil:
         :param join_str
         String to use to connect chunks. Does count towards number of charcters
         in each chunk. Default is "\\n\\n"
+
+        :param max_chunk_tokens
+        Target max number of tokens in each string in returned array. When
+        given, chunks are measured in tokens and max_chunk_chars is ignored.
         """
-        return self.chunk_strs_by_char_count(
-            strs=pages,
-            max_char_count=max_chunk_chars,
+        return list(self.iter_chunk_pages(
+            pages=pages,
+            max_chunk_chars=max_chunk_chars,
             join_str=join_str,
-        )
+            max_chunk_tokens=max_chunk_tokens,
+        ))
+
+
+    def iter_chunk_pages(
+        self,
+        pages: Iterable[str],
+        max_chunk_chars: int=MAX_CHUNK_CHAR_COUNT,
+        join_str: str="\n\n",
+        max_chunk_tokens: Optional[int]=None,
+    ) -> Iterator[str]:
+        """
+        Incremental version of chunk_pages. Consumes pages one at a time (pages
+        can be a generator) and yields each chunk as soon as it's complete.
+
+        :param pages
+        Iterable of strings to chunk together.
+
+        :param max_chunk_chars
+        Target max length of each yielded string.
+
+        :param join_str
+        String to use to connect chunks. Default is "\\n\\n"
+
+        :param max_chunk_tokens
+        Target max number of tokens in each yielded string. When given, chunks
+        are measured in tokens and max_chunk_chars is ignored.
+        """
+        size_fn, max_size = self._chunk_measure(max_chunk_chars, max_chunk_tokens)
+        return self.iter_chunk_strs_by_size(pages, max_size, size_fn, join_str)
 
 
     def chunk_screenplay_text(
@@ -103,6 +428,7 @@ class Strutil:
         text: str,
         max_chunk_chars: int = MAX_CHUNK_CHAR_COUNT,
         join_str="\n\n",
+        max_chunk_tokens: Optional[int] = None,
     ) -> list[str]:
         """
         Takes screenplay text as an input string and returns a list of strings
@@ -116,30 +442,46 @@ class Strutil:
 
         :max_chunk_chars
         Target max number of characters in each string in return array.
+
+        :param join_str
+        String to use to join chunks together. "\\n\\n" by default.
+
+        :param max_chunk_tokens
+        Target max number of tokens in each string in return array. When
+        given, chunks are measured in tokens and max_chunk_chars is ignored.
         """
+        size_fn, max_size = self._chunk_measure(max_chunk_chars, max_chunk_tokens)
+        sections = self.iter_screenplay_sections(text, max_size, size_fn)
+        return list(self.iter_chunk_strs_by_size(sections, max_size, size_fn, join_str))
+
 
-        # split screenplay into scenes - this will cover most cases
-        chunks = self.split_by_scene_heading(text)
+    def iter_screenplay_sections(
+        self,
+        text: str,
+        max_size: int = MAX_CHUNK_CHAR_COUNT,
+        size_fn: Callable[[str], int] = len,
+    ) -> Iterator[str]:
+        """
+        Splits screenplay text into the sections chunk_screenplay_text packs
+        into chunks: scenes; scenes bigger than max_size split by transitions;
+        and any of those still too big split by page numbers. Anything still
+        too big after that is yielded as-is.
 
-        # if any chunk is still too long (no scene headings, like a William
-        # Goldman script or something) try to split by transitions
-        chunks = [s for s in self.flatten([
-            c if len(c) <= max_chunk_chars else self.split_by_scene_transition(c)
-            for c in chunks
-        ])]
+        :param text
+        Screenplay as a string.
 
-        # if any chunk is still too long (no headings or transitions) try to
-        # split by page number
-        chunks = [s for s in self.flatten([
-            c if len(c) <= max_chunk_chars else self.split_by_page_number(c)
-            for c in chunks
-        ])]
+        :param max_size
+        Target max size of each section.
 
-        # if any chunk is still too long at this point, give up
-        return self.chunk_strs_by_char_count(
-            strs=chunks,
-            max_char_count=max_chunk_chars,
-            join_str=join_str,
+        :param size_fn
+        Function that returns the size of a string, eg len or a token count.
+        """
+        kinds = (LINE_SCENE_HEADING, LINE_TRANSITION, LINE_PAGE_NUMBER)
+        return self._iter_sections(
+            LineIndex(text, kinds=sum(kinds)),
+            kinds,
+            max_size,
+            size_fn,
         )
 
 
@@ -148,6 +490,7 @@ class Strutil:
         text: str,
         max_chunk_chars: int = MAX_CHUNK_CHAR_COUNT,
         join_str="\n\n",
+        max_chunk_tokens: Optional[int] = None,
     ) -> list[str]:
         """
         Takes generic text as an input string and returns a list of strings
@@ -161,26 +504,158 @@ class Strutil:
 
         :max_chunk_chars
         Target max number of characters in each string in return array.
+
+        :param join_str
+        String to use to join chunks together. "\\n\\n" by default.
+
+        :param max_chunk_tokens
+        Target max number of tokens in each string in return array. When
+        given, chunks are measured in tokens and max_chunk_chars is ignored.
         """
-        # try to split by page number
-        chunks = self.split_by_page_number(text)
-
-        # if any chunks are too long after page numbers, try blank lines
-        # note that this is specifically splitting by emptyish lines, and there
-        # are edge cases where the assumptions about what an emptyish line is
-        # could be wrong... but at that point the text may require some manual
-        # clean up.
-        chunks = [s for s in self.flatten([
-            c if len(c) <= max_chunk_chars else self.split_by_emptyish_lines(c)
-            for c in chunks
-        ])]
-
-        # if any chunk is still too long at this point, give up
-        return self.chunk_strs_by_char_count(
-            strs=chunks,
-            max_char_count=max_chunk_chars,
-            join_str=join_str,
+        size_fn, max_size = self._chunk_measure(max_chunk_chars, max_chunk_tokens)
+        sections = self.iter_generic_sections(text, max_size, size_fn)
+        return list(self.iter_chunk_strs_by_size(sections, max_size, size_fn, join_str))
+
+
+    def iter_generic_sections(
+        self,
+        text: str,
+        max_size: int = MAX_CHUNK_CHAR_COUNT,
+        size_fn: Callable[[str], int] = len,
+    ) -> Iterator[str]:
+        """
+        Splits generic text into the sections chunk_generic_text packs into
+        chunks: pages (split by page number), and pages bigger than max_size
+        split by emptyish lines. Anything still too big after that is yielded
+        as-is.
+
+        Note that this is specifically splitting by emptyish lines, and there
+        are edge cases where the assumptions about what an emptyish line is
+        could be wrong... but at that point the text may require some manual
+        clean up.
+
+        :param text
+        Generic text as a string.
+
+        :param max_size
+        Target max size of each section.
+
+        :param size_fn
+        Function that returns the size of a string, eg len or a token count.
+        """
+        kinds = (LINE_PAGE_NUMBER, LINE_EMPTYISH)
+        return self._iter_sections(
+            LineIndex(text, kinds=sum(kinds)),
+            kinds,
+            max_size,
+            size_fn,
+        )
+
+
+    def _iter_sections(
+        self,
+        index: LineIndex,
+        kinds: tuple[int, ...],
+        max_size: int,
+        size_fn: Callable[[str], int],
+    ) -> Iterator[str]:
+        """
+        Splits indexed text before every line of the first kind, then splits
+        any section bigger than max_size by the next kind, and so on. Sections
+        are worked out on line ranges and only sliced out of the text once
+        they're final.
+
+        :param index
+        LineIndex of the text to split.
+
+        :param kinds
+        LINE_* flags of the lines to split by, in order.
+
+        :param max_size
+        Target max size of each section.
+
+        :param size_fn
+        Function that returns the size of a string, eg len or a token count.
+        """
+        def size(start: int, end: int) -> int:
+            if size_fn is len:
+                return index.char_count(start, end)
+            return size_fn(index.slice(start, end))
+
+        def split(start: int, end: int, level: int) -> Iterator[str]:
+            for section_start, section_end in index.split(start, end, kinds[level]):
+                yield from section(section_start, section_end, level + 1)
+
+        def section(start: int, end: int, level: int) -> Iterator[str]:
+            if level == len(kinds) or size(start, end) <= max_size:
+                yield index.slice(start, end)
+            else:
+                yield from split(start, end, level)
+
+        # always split by the first kind, even if the whole text would fit
+        yield from split(0, index.end, 0)
+
+
+    def split_in_two(self, text: str) -> list[str]:
+        """
+        Splits text in two at the best boundary near its middle: before the
+        scene heading closest to the middle, or failing that a transition, a
+        page number, an emptyish line, any line, and any space, in that order.
+        A boundary only counts if it's within SPLIT_WINDOW of the middle, so
+        neither half is tiny. Splits in the middle as a last resort. Returns
+        [text] if it's too short to split.
+
+        "a\n\nb\nc" -> ["a\n", "\nb\nc"]
+
+        :param text
+        Text to split.
+        """
+        if len(text) < 2:
+            return [text]
+        middle = len(text) // 2
+        window = max(1, int(len(text) * SPLIT_WINDOW))
+        index = LineIndex(text, kinds=sum(SPLIT_LINE_KINDS))
+        candidates = chain(
+            (index.lines_of_kind(kind) for kind in SPLIT_LINE_KINDS),
+            # only worked out if there's no better boundary
+            ([m.end() for m in re.finditer(pattern, text)] for pattern in (r"\n", r"\s+")),
         )
+        for offsets in candidates:
+            cut = self._nearest_offset(offsets, middle, window, len(text))
+            if cut is not None:
+                break
+        else:
+            cut = middle
+        return [text[:cut], text[cut:]]
+
+
+    @staticmethod
+    def _nearest_offset(
+        offsets,
+        middle: int,
+        window: int,
+        length: int,
+    ) -> Optional[int]:
+        """
+        Returns the sorted offset closest to middle that's no further than
+        window from it and leaves some text on both sides, or None.
+
+        :param offsets
+        Sorted offsets to choose from.
+
+        :param middle
+        Offset to be close to.
+
+        :param window
+        Furthest an offset can be from middle.
+
+        :param length
+        Length of the text the offsets are in.
+        """
+        idx = bisect_left(offsets, middle)
+        near = [o for o in offsets[max(0, idx - 1):idx + 1]
+                if 0 < o < length and abs(o - middle) <= window]
+        return min(near, key=lambda o: abs(o - middle)) if near else None
 
 
     def chunk_strs_by_char_count(
@@ -208,32 +683,107 @@ class Strutil:
         :param join_str
         String to use to join strings together. "\\n\\n" by default.
         """
-        res, buff, buff_chars = [], [], 0
+        return list(self.iter_chunk_strs_by_char_count(
+            strs=strs,
+            max_char_count=max_char_count,
+            join_str=join_str,
+        ))
+
+
+    def iter_chunk_strs_by_char_count(
+        self,
+        strs: Iterable[str],
+        max_char_count: int = MAX_CHUNK_CHAR_COUNT,
+        join_str: str = "\n\n",
+    ):
+        """
+        Incremental version of chunk_strs_by_char_count. Consumes strings one
+        at a time (strs can be a generator) and yields each chunk as soon as
+        it's complete, ie as soon as the next string wouldn't fit in it.
+
+        :param strs
+        Iterable of strings to chunk together.
+
+        :param max_char_count
+        Target max characters per yielded string.
+
+        :param join_str
+        String to use to join strings together. "\\n\\n" by default.
+        """
+        return self.iter_chunk_strs_by_size(strs, max_char_count, len, join_str)
+
+
+    def iter_chunk_strs_by_size(
+        self,
+        strs: Iterable[str],
+        max_size: int,
+        size_fn: Callable[[str], int],
+        join_str: str = "\n\n",
+    ) -> Iterator[str]:
+        """
+        Same as iter_chunk_strs_by_char_count, but measures strings with
+        size_fn instead of counting characters. The size of a chunk is taken to
+        be the sum of the sizes of its strings and the join strings between
+        them.
+
+        :param strs
+        Iterable of strings to chunk together.
+
+        :param max_size
+        Target max size per yielded string.
+
+        :param size_fn
+        Function that returns the size of a string, eg len or a token count.
+
+        :param join_str
+        String to use to join strings together. "\\n\\n" by default.
+        """
+        buff, buff_size = [], 0
+        join_size = size_fn(join_str) if join_str else 0
 
         for s in strs:
-            s_len = len(s)
+            s_size = size_fn(s)
 
-            # if the string itself is longer than allowed
-            if s_len > max_char_count:
+            # if the string itself is bigger than allowed
+            if s_size > max_size:
                 if buff:
-                    res.append(join_str.join(buff))
-                    buff, buff_chars = [], 0
-                self.log(f"single string length ({s_len}) exceeds max_char_count ({max_char_count})")
-                res.append(s)
+                    yield join_str.join(buff)
+                    buff, buff_size = [], 0
+                self.log(f"single string size ({s_size}) exceeds max chunk size ({max_size})")
+                self.metrics.count("chunk.oversized")
+                yield s
                 continue
 
             # if adding this string would overflow the buffer
-            if buff_chars + (len(join_str) if buff else 0) + s_len > max_char_count:
-                res.append(join_str.join(buff))
-                buff, buff_chars = [], 0
+            if buff and buff_size + join_size + s_size > max_size:
+                yield join_str.join(buff)
+                buff, buff_size = [], 0
 
+            buff_size += s_size + (join_size if buff else 0)
             buff.append(s)
-            buff_chars += s_len + (len(join_str) if buff_chars > 0 else 0)
 
         if buff:
-            res.append(join_str.join(buff))
+            yield join_str.join(buff)
 
-        return res
+
+    def _chunk_measure(
+        self,
+        max_chunk_chars: int,
+        max_chunk_tokens: Optional[int],
+    ) -> tuple[Callable[[str], int], int]:
+        """
+        Returns the function to measure chunks with and the max chunk size:
+        token counts when max_chunk_tokens is given, characters otherwise.
+
+        :param max_chunk_chars
+        Target max number of characters per chunk.
+
+        :param max_chunk_tokens
+        Target max number of tokens per chunk, or None.
+        """
+        if max_chunk_tokens is not None:
+            return self.tokenizer.count, max_chunk_tokens
+        return len, max_chunk_chars
 
 
     def split_by_line_type(self, text: str, line_matcher: Callable)->list[str]:
@@ -277,10 +827,7 @@ class Strutil:
         :param text
         The string to split.
         """
-        return self.split_by_line_type(
-            text=text,
-            line_matcher=self.line_is_scene_heading,
-        )
+        return self._split_by_kind(text, LINE_SCENE_HEADING)
 
 
     def split_by_scene_transition(self, text: str) -> list[str]:
@@ -292,10 +839,7 @@ class Strutil:
         :param text
         The string to split.
         """
-        return self.split_by_line_type(
-            text=text,
-            line_matcher=self.line_is_transition,
-        )
+        return self._split_by_kind(text, LINE_TRANSITION)
 
 
     def split_by_page_number(self, text: str) -> list[str]:
@@ -307,10 +851,7 @@ class Strutil:
         :param text
         The string to split.
         """
-        return self.split_by_line_type(
-            text=text,
-            line_matcher=self.line_is_page_number,
-        )
+        return self._split_by_kind(text, LINE_PAGE_NUMBER)
 
 
     def split_by_emptyish_lines(self, text: str) -> list[str]:
@@ -322,10 +863,22 @@ class Strutil:
         :param text
         The string to split.
         """
-        return self.split_by_line_type(
-            text=text,
-            line_matcher=self.line_is_emptyish,
-        )
+        return self._split_by_kind(text, LINE_EMPTYISH)
+
+
+    def _split_by_kind(self, text: str, kind: int) -> list[str]:
+        """
+        Same as split_by_line_type, for one of the kinds of line in a
+        LineIndex.
+
+        :param text
+        The string to split.
+
+        :param kind
+        LINE_* flag of the lines to split before.
+        """
+        index = LineIndex(text, kinds=kind)
+        return [index.slice(start, end) for start, end in index.split(0, index.end, kind)]
 
 
     def line_is_scene_heading(self, line: str) -> bool:
@@ -338,17 +891,7 @@ class Strutil:
         :param line
         String to check.
         """
-        l = line.lstrip().upper()
-        # if the line matches the keywords, it's a scene heading
-        for k in SCENE_HEADING_KEYWORDS:
-            # fountain scene headings don't have to be all caps
-            if l.startswith(k):
-                return True
-
-        # in fountain, a period immediately followed by any aphanumeric
-        # character forces a scene heading (ie ".ext" or ".some scene" but
-        # not "...some scene") assume a match is a scene heading
-        return bool(RE_FOUNTAIN_SCENE_HEADING.match(l))
+        return bool(RE_SCENE_HEADING.match(line))
 
 
     def line_is_transition(self, line: str) -> bool:
@@ -360,15 +903,7 @@ class Strutil:
         :param line
         String to check.
         """
-        l = line.strip().upper()
-        # if the line matches the keywords, it's a scene heading
-        for k in SCENE_TRANSITION_KEYWORDS:
-            # fountain scene headings don't have to be all caps
-            if l.startswith(k):
-                return True
-
-        # in fountain, anything that ends with "TO:" is a transition
-        return line.rstrip().upper().endswith(" TO:") # strip only right side
+        return bool(RE_SCENE_TRANSITION.match(line))
 
 
     def line_is_page_number(self, line: str) -> bool:
@@ -378,8 +913,7 @@ class Strutil:
         :param line
         String to check.
         """
-        l = line.strip()
-        return bool(RE_PAGE_NUMBER.match(l) or RE_ROMAN_NUMERAL_PAGE_NUMBER.match(l))
+        return bool(RE_PAGE_NUMBER.match(line))
 
 
     def line_is_emptyish(self, line: str) -> bool:
@@ -393,8 +927,7 @@ class Strutil:
         :param line
         String to check.
         """
-        l = line.strip()
-        return l == "" or (len(l) == 1 and not l.isalnum())
+        return bool(RE_EMPTYISH.match(line))
 
 
     def subarrayify(self, arr: list, subarray_length: int) -> list[str]:
@@ -467,3 +1000,13 @@ class Strutil:
         with open(path, "w", encoding="utf-8") as f:
             f.write(text)
 
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """
+        Returns the sha256 hex digest of a string.
+
+        :param text
+        Text to hash.
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
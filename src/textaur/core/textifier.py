@@ -1,16 +1,53 @@
 """
 Textifier class for extracting text from plain text or pdf input file.
+
+pdfminer, pdf2image and pytesseract are imported by the functions that use
+them, so they're only loaded when a PDF is actually extracted or OCR'd.
 """
-from pdf2image import convert_from_path
-import pytesseract
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer, LTTextLineHorizontal
 from pathlib import Path
 from enum import Enum
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from .cache import DiskCache
+from .metrics import Metrics, NullMetrics
+import hashlib
+import os
+import re
 import shutil
+import unicodedata
 
 PDF_MAGIC_HEADER = b"%PDF-"
 
+# number of processes to use for OCR by default
+DEFAULT_OCR_WORKERS = 1
+
+# number of processes to use for direct text extraction by default
+DEFAULT_EXTRACT_WORKERS = 1
+
+# number of page ranges to split a document into per extraction worker
+EXTRACT_RANGES_PER_WORKER = 4
+
+# a page whose text layer has fewer visible characters than this is assumed to
+# be a scan (or otherwise missing its text) in auto OCR mode
+MIN_TEXT_LAYER_CHARS = 25
+
+# a page whose text layer has a larger share of garbage characters than this
+# is assumed to have a broken font mapping in auto OCR mode
+MAX_TEXT_LAYER_GARBAGE_RATIO = 0.1
+
+# pdfminer renders glyphs it can't map to unicode as "(cid:123)"
+RE_PDFMINER_CID = re.compile(r"\(cid:\d+\)")
+
+# maximum number of rendered pages to hold in memory at once during OCR. A
+# rendered page at the default resolution is roughly 25MB.
+DEFAULT_OCR_WINDOW = 8
+
+# resolution to render pages at for OCR
+OCR_DPI = 200
+
+# bytes to read at a time when hashing an input file
+FILE_HASH_BLOCK_SIZE = 1024 * 1024
+
 class FileType(str, Enum):
     """
     Enum for file types.
@@ -35,15 +72,205 @@ class File:
         self.pages = pages
 
 
+def _init_ocr_worker() -> None:
+    """
+    Runs once in each OCR worker process. Tesseract uses several threads per
+    page by default, which only competes with the other workers when pages are
+    already being OCR'd in parallel, so limit it to one.
+    """
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _ocr_page_range(file: Path, start: int, stop: int) -> list[str]:
+    """
+    Renders a range of pages of a PDF and returns the text of each page using
+    tesseract. Module level so it can be sent to worker processes.
+
+    :param file
+    Path of the PDF to read.
+
+    :param start
+    Index of the first page to OCR, starting at 0.
+
+    :param stop
+    Index of the page after the last page to OCR.
+    """
+    from pdf2image import convert_from_path
+    import pytesseract
+    images = convert_from_path(
+        file,
+        dpi=OCR_DPI,
+        first_page=start + 1,
+        last_page=stop,
+    )
+    return [pytesseract.image_to_string(image) for image in images]
+
+
+def _is_garbage_char(c: str) -> bool:
+    """
+    Returns true for characters that don't belong in real text: the unicode
+    replacement character, control characters and private use characters
+    (which fonts without a unicode mapping often produce).
+
+    :param c
+    Single character.
+    """
+    return c == "\ufffd" or unicodedata.category(c) in ("Cc", "Co", "Cs")
+
+
+def _extract_page_range(file: Path, start: int, stop: int) -> list[str]:
+    """
+    Extracts and returns the text of a range of pages of a PDF with pdfminer.
+    Module level so it can be sent to worker processes.
+
+    :param file
+    Path of the PDF to read.
+
+    :param start
+    Index of the first page to extract, starting at 0.
+
+    :param stop
+    Index of the page after the last page to extract.
+    """
+    from pdfminer.high_level import extract_pages
+    return [
+        _page_layout_text(page_layout)
+        for page_layout in extract_pages(file, page_numbers=range(start, stop))
+    ]
+
+
+def _iter_page_ranges_in_pool(fn, file: Path, windows: list[tuple[int, int]],
+                              workers: int, initializer=None):
+    """
+    Runs fn(file, start, stop) for every page range in a process pool and
+    yields the page texts it returns, in page order. Ranges finish out of
+    order, so each one is waited for in turn.
+
+    :param fn
+    Module level function taking a file and a page range and returning the
+    text of each page in the range.
+
+    :param file
+    Path of the PDF to read.
+
+    :param windows
+    (start, stop) page ranges in page order.
+
+    :param workers
+    Number of processes to use.
+
+    :param initializer
+    Optional function to run once in each worker process.
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=initializer,
+    ) as pool:
+        futures = [pool.submit(fn, file, start, stop) for start, stop in windows]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            # if the caller stops early, don't process the rest
+            for future in futures:
+                future.cancel()
+
+
+def _page_windows(page_indices: list[int], size: int) -> list[tuple[int, int]]:
+    """
+    Groups page indices into (start, stop) ranges of consecutive pages, each
+    no longer than size pages.
+
+    [0, 1, 2, 3, 7, 8], 3 -> [(0, 3), (3, 4), (7, 9)]
+
+    :param page_indices
+    Sorted page indices.
+
+    :param size
+    Maximum number of pages per range.
+    """
+    windows = []
+    for idx in page_indices:
+        if windows and windows[-1][1] == idx and idx - windows[-1][0] < size:
+            windows[-1] = (windows[-1][0], idx + 1)
+        else:
+            windows.append((idx, idx + 1))
+    return windows
+
+
+def _page_layout_text(page_layout) -> str:
+    """
+    Returns the text of a page laid out by pdfminer, with lines sorted top to
+    bottom.
+
+    :param page_layout
+    pdfminer LTPage.
+    """
+    from pdfminer.layout import LTTextContainer, LTTextLineHorizontal
+    page_lines = []
+    for element in page_layout:
+        if isinstance(element, LTTextContainer):
+            for text_line in element:
+                if isinstance(text_line, LTTextLineHorizontal):
+                    # Keep y-coordinate and text
+                    page_lines.append((text_line.y0, text_line.get_text()))
+    # Sort top-to-bottom (highest y0 first)
+    page_lines.sort(reverse=True, key=lambda x: x[0])
+    return "".join([text for _, text in page_lines])
+
+
 class Textifier:
     """
     Class for extracting text from plain text or pdf input file.
     """
     supported_filetypes = [FileType.PDF, FileType.TEXT]
 
-    def __init__(self, log=print, progress_fn=None):
+    def __init__(self, log=print, progress_fn=None,
+                 ocr_workers: int=DEFAULT_OCR_WORKERS,
+                 ocr_window: int=DEFAULT_OCR_WINDOW,
+                 extract_workers: int=DEFAULT_EXTRACT_WORKERS,
+                 cache: Optional[DiskCache]=None,
+                 metrics: Optional[Metrics]=None):
+        """
+        :param log
+        Function to use for logging.
+
+        :param progress_fn
+        Optional function to use for progress updates.
+
+        :param ocr_workers
+        Number of processes to spread OCR across. Pages are OCR'd one at a time
+        in this process when 1.
+
+        :param ocr_window
+        Maximum number of rendered pages to hold in memory at once during OCR,
+        across all workers. Sets peak memory use regardless of the length of
+        the document.
+
+        :param extract_workers
+        Number of processes to spread direct (non-OCR) text extraction across.
+        Pages are extracted in this process when 1.
+
+        :param cache
+        Optional cache of extracted page text. Cached pages of the same file
+        skip rendering, OCR and pdfminer entirely.
+
+        :param metrics
+        Metrics to report into. Reports nothing when None.
+        """
+        if ocr_workers < 1 or extract_workers < 1:
+            raise ValueError("ocr_workers and extract_workers must be at least 1")
+        if ocr_window < 1:
+            raise ValueError("ocr_window must be at least 1")
         self.log = log
         self.progress_fn = progress_fn
+        self.ocr_workers = ocr_workers
+        self.ocr_window = ocr_window
+        self.extract_workers = extract_workers
+        self.cache = cache
+        self.metrics = metrics or NullMetrics()
+        self._file_hashes = {}
+        self._tesseract_version = None
 
 
     def filetype(self, file: Path) -> FileType:
@@ -73,6 +300,7 @@ class Textifier:
         self,
         file: Path,
         use_ocr: bool=False,
+        auto_ocr: bool=False,
     ) -> File:
         """
         Extracts and returns text from the input file.
@@ -83,6 +311,11 @@ class Textifier:
         :param use_ocr
         When true, use optical character recognition for PDFs instead of direct
         text extraction. False by default.
+
+        :param auto_ocr
+        When true (and use_ocr is false), extract text from PDFs directly and
+        use optical character recognition only for the pages without a usable
+        text layer. False by default.
         """
         filetype = self.filetype(file)
         text = None
@@ -100,6 +333,8 @@ class Textifier:
                     # may not be installed
                     self.courtesy_check_ocr_dependencies()
                     raise e
+            elif auto_ocr:
+                pages = self.text_from_pdf_auto(file)
             else:
                 pages = self.text_from_pdf_extraction(file)
         return File(filetype=filetype, text=text, pages=pages)
@@ -125,18 +360,127 @@ class Textifier:
         :param file
         Path of the PDF to read.
         """
-        self.log("Starting PDF conversion for OCR...")
-        pages = convert_from_path(file)
-        self.log("Conversion complete.\nStarting OCR...")
-        total = len(pages)
-        texts = []
-        for idx, page in enumerate(pages):
-            if self.progress_fn:
-                self.progress_fn(f"\rConverting page {idx + 1}/{total}")
-                if idx + 1 == total:
-                    self.progress_fn("\n")
-            texts.append(pytesseract.image_to_string(page))
-        return texts
+        return self.ocr_pages(file, list(range(self.page_count(file))))
+
+
+    def ocr_pages(self, file: Path, page_indices: list[int]) -> list[str]:
+        """
+        Returns the text of the given pages of a PDF using optical character
+        recognition, in the order of page_indices.
+
+        :param file
+        Path of the PDF to read.
+
+        :param page_indices
+        Indices of the pages to OCR, starting at 0.
+        """
+        ordered = sorted(page_indices)
+        texts = dict(zip(ordered, self.iter_ocr_pages(file, ordered)))
+        return [texts[idx] for idx in page_indices]
+
+
+    def iter_ocr_pages(self, file: Path, page_indices: list[int]):
+        """
+        Yields the text of the given pages of a PDF using optical character
+        recognition, one page at a time in page order, as soon as each page
+        (and every page before it) is done.
+
+        Pages are rendered a window at a time rather than all up front, so no
+        more than ocr_window rendered pages are in memory at once. Windows are
+        spread across ocr_workers processes when there's more than one.
+
+        :param file
+        Path of the PDF to read.
+
+        :param page_indices
+        Sorted indices of the pages to OCR, starting at 0.
+        """
+        yield from self._iter_cached_pages(
+            file=file,
+            page_indices=page_indices,
+            method=self._ocr_cache_method(),
+            extract_fn=self._iter_ocr_pages_uncached,
+        )
+
+
+    def _iter_ocr_pages_uncached(self, file: Path, page_indices: list[int]):
+        """
+        Yields the text of the given pages of a PDF using optical character
+        recognition, without checking the page cache. See iter_ocr_pages.
+
+        :param file
+        Path of the PDF to read.
+
+        :param page_indices
+        Sorted indices of the pages to OCR, starting at 0.
+        """
+        total = len(page_indices)
+        # every worker holds at least one rendered page, so no more workers
+        # than pages allowed in memory at once
+        workers = min(self.ocr_workers, total, self.ocr_window)
+        self.log("Starting OCR...")
+        if workers < 2:
+            from pdf2image import convert_from_path
+            import pytesseract
+            done = 0
+            for start, stop in _page_windows(page_indices, self.ocr_window):
+                images = convert_from_path(
+                    file,
+                    dpi=OCR_DPI,
+                    first_page=start + 1,
+                    last_page=stop,
+                )
+                for image in images:
+                    done += 1
+                    self._report_ocr_progress(done, total)
+                    self.metrics.count("extract.ocr_pages")
+                    yield pytesseract.image_to_string(image)
+                # let the window's images be freed before rendering the next
+                del images
+            return
+
+        # every worker holds one window at a time, so split the memory budget;
+        # workers * window never exceeds ocr_window
+        window = self.ocr_window // workers
+        pages = _iter_page_ranges_in_pool(
+            fn=_ocr_page_range,
+            file=file,
+            windows=_page_windows(page_indices, window),
+            workers=workers,
+            initializer=_init_ocr_worker,
+        )
+        for done, text in enumerate(pages, start=1):
+            self._report_ocr_progress(done, total)
+            self.metrics.count("extract.ocr_pages")
+            yield text
+
+
+    def page_count(self, file: Path) -> int:
+        """
+        Returns the number of pages in a PDF.
+
+        :param file
+        Path of the PDF.
+        """
+        from pdfminer.pdfpage import PDFPage
+        with open(file, "rb") as f:
+            return sum(1 for _ in PDFPage.get_pages(f))
+
+
+    def _report_ocr_progress(self, done: int, total: int) -> None:
+        """
+        Reports OCR progress if there's a progress function.
+
+        :param done
+        Number of the page being converted, or number of pages converted.
+
+        :param total
+        Total number of pages.
+        """
+        if self.progress_fn:
+            self.progress_fn(f"\rConverting page {done}/{total}")
+            if done == total:
+                self.progress_fn("\n")
 
 
     def text_from_pdf_extraction(self, file: Path) -> list[str]:
@@ -146,22 +490,249 @@ class Textifier:
         :param file
         Path of the PDF to read.
         """
-        pages = []
-        self.log("Starting extraction...")
-        for page_layout in extract_pages(file):
-            page_lines = []
-            for element in page_layout:
-                if isinstance(element, LTTextContainer):
-                    for text_line in element:
-                        if isinstance(text_line, LTTextLineHorizontal):
-                            # Keep y-coordinate and text
-                            page_lines.append((text_line.y0, text_line.get_text()))
-            # Sort top-to-bottom (highest y0 first)
-            page_lines.sort(reverse=True, key=lambda x: x[0])
-            pages.append("".join([text for _, text in page_lines]))
+        return list(self.iter_pdf_extraction(file))
+
 
+    def iter_pdf_extraction(self, file: Path):
+        """
+        Extracts text directly from pdf and yields the text of each page as
+        soon as it's extracted.
+
+        :param file
+        Path of the PDF to read.
+        """
+        self.log("Starting extraction...")
+        if self.cache is None and self.extract_workers < 2:
+            # nothing to skip and nothing to split, so no need to count pages
+            from pdfminer.high_level import extract_pages
+            pages = (_page_layout_text(layout) for layout in extract_pages(file))
+        else:
+            pages = self._iter_cached_pages(
+                file=file,
+                page_indices=list(range(self.page_count(file))),
+                method=self._extraction_cache_method(),
+                extract_fn=self._iter_extracted_pages,
+            )
+        for page in pages:
+            self.metrics.count("extract.pages")
+            yield page
         self.log("Extraction complete.")
-        return pages
+
+
+    def _iter_extracted_pages(self, file: Path, page_indices: list[int]):
+        """
+        Extracts text directly from the given pages of a pdf and yields the
+        text of each page in page order, spreading page ranges across
+        extract_workers processes when there's more than one.
+
+        :param file
+        Path of the PDF to read.
+
+        :param page_indices
+        Sorted indices of the pages to extract, starting at 0.
+        """
+        total = len(page_indices)
+        workers = min(self.extract_workers, total)
+        if workers < 2:
+            from pdfminer.high_level import extract_pages
+            for page_layout in extract_pages(file, page_numbers=set(page_indices)):
+                yield _page_layout_text(page_layout)
+            return
+        # several small ranges per worker so a slow range (dense pages)
+        # doesn't leave the other workers idle at the end
+        size = max(1, -(-total // (workers * EXTRACT_RANGES_PER_WORKER)))
+        yield from _iter_page_ranges_in_pool(
+            fn=_extract_page_range,
+            file=file,
+            windows=_page_windows(page_indices, size),
+            workers=workers,
+        )
+
+
+    def _iter_cached_pages(self, file: Path, page_indices: list[int],
+                           method: str, extract_fn):
+        """
+        Yields the text of the given pages in page order, taking each page
+        from the page cache when possible and extracting only the rest with
+        extract_fn. Newly extracted pages are added to the cache.
+
+        Pages are cached by the hash of the file's contents, the page index and
+        the extraction method and its settings, so a cached page is only used
+        for the exact same file, page and extraction.
+
+        :param file
+        Path of the PDF to read.
+
+        :param page_indices
+        Sorted indices of the pages to return, starting at 0.
+
+        :param method
+        Name and settings of the extraction method, part of the cache key.
+
+        :param extract_fn
+        Function taking a file and sorted page indices and yielding the text
+        of each of those pages in order.
+        """
+        if self.cache is None:
+            yield from extract_fn(file, page_indices)
+            return
+        file_hash = self._file_hash(file)
+        keys = {idx: DiskCache.key(file_hash, str(idx), method) for idx in page_indices}
+        cached = {}
+        for idx in page_indices:
+            text = self.cache.get(keys[idx])
+            if text is not None:
+                cached[idx] = text
+        if cached:
+            self.log(f"Reusing {len(cached)} of {len(page_indices)} pages from the extraction cache.")
+            self.metrics.count("extract.page_cache_hits", len(cached))
+        missing = [idx for idx in page_indices if idx not in cached]
+        extracted = extract_fn(file, missing) if missing else iter(())
+        for idx in page_indices:
+            if idx in cached:
+                yield cached.pop(idx)
+            else:
+                text = next(extracted)
+                self.cache.set(keys[idx], text)
+                yield text
+
+
+    def _file_hash(self, file: Path) -> str:
+        """
+        Returns the sha256 hex digest of a file's contents. Remembered for as
+        long as the file's size and modification time don't change, so a file
+        is only read once per run.
+
+        :param file
+        Path of the file to hash.
+        """
+        stat = os.stat(file)
+        key = (str(Path(file).resolve()), stat.st_size, stat.st_mtime_ns)
+        if key not in self._file_hashes:
+            digest = hashlib.sha256()
+            with open(file, "rb") as f:
+                while block := f.read(FILE_HASH_BLOCK_SIZE):
+                    digest.update(block)
+            self._file_hashes[key] = digest.hexdigest()
+        return self._file_hashes[key]
+
+
+    def _extraction_cache_method(self) -> str:
+        """
+        Returns the name and settings of direct extraction for the page cache
+        key. Includes the pdfminer version, since a different pdfminer can
+        lay out the same page differently.
+        """
+        import pdfminer
+        return f"pdfminer;version={pdfminer.__version__}"
+
+
+    def _ocr_cache_method(self) -> str:
+        """
+        Returns the name and settings of the OCR method for the page cache
+        key. Includes the tesseract version, since a different tesseract can
+        read the same page differently.
+        """
+        if self._tesseract_version is None:
+            import pytesseract
+            try:
+                self._tesseract_version = str(pytesseract.get_tesseract_version())
+            except Exception:
+                self._tesseract_version = "unknown"
+        return f"ocr;dpi={OCR_DPI};tesseract={self._tesseract_version}"
+
+
+    def text_from_pdf_auto(self, file: Path) -> list[str]:
+        """
+        Extracts and returns text directly from pdf, using optical character
+        recognition only for pages without a usable text layer.
+
+        :param file
+        Path of the PDF to read.
+        """
+        return list(self.iter_pdf_auto(file))
+
+
+    def iter_pdf_auto(self, file: Path):
+        """
+        Extracts text directly from pdf, then OCRs only the pages whose text
+        layer is missing or garbled (see text_layer_is_usable), and yields the
+        text of each page in page order. Direct extraction is fast compared to
+        OCR, so every page is extracted first and the failing pages are OCR'd
+        together to make use of every OCR worker.
+
+        :param file
+        Path of the PDF to read.
+        """
+        pages = self.text_from_pdf_extraction(file)
+        failing = [
+            idx for idx, page in enumerate(pages)
+            if not self.text_layer_is_usable(page)
+        ]
+        if not failing:
+            yield from pages
+            return
+        self.log(f"{len(failing)} of {len(pages)} pages have no usable text layer. Using OCR for those pages.")
+        try:
+            ocr_texts = self.iter_ocr_pages(file, failing)
+            failing = set(failing)
+            for idx, page in enumerate(pages):
+                yield next(ocr_texts) if idx in failing else page
+        except Exception as e:
+            self.courtesy_check_ocr_dependencies()
+            raise e
+
+
+    def text_layer_is_usable(self, text: str) -> bool:
+        """
+        Returns true if the text extracted directly from a page looks like a
+        real text layer: at least MIN_TEXT_LAYER_CHARS visible characters, and
+        no more than MAX_TEXT_LAYER_GARBAGE_RATIO of them garbage (unmapped
+        glyphs, control and private use characters).
+
+        :param text
+        Text extracted from a page.
+        """
+        text, cids = RE_PDFMINER_CID.subn("", text)
+        visible = [c for c in text if not c.isspace()]
+        if len(visible) + cids < MIN_TEXT_LAYER_CHARS:
+            return False
+        garbage = cids + sum(1 for c in visible if _is_garbage_char(c))
+        return garbage / (len(visible) + cids) <= MAX_TEXT_LAYER_GARBAGE_RATIO
+
+
+    def iter_pages(
+        self,
+        file: Path,
+        use_ocr: bool=False,
+        auto_ocr: bool=False,
+    ):
+        """
+        Yields the text of each page of a PDF as soon as it's extracted, in
+        page order.
+
+        :param file
+        Path of the PDF to read.
+
+        :param use_ocr
+        When true, use optical character recognition instead of direct text
+        extraction.
+
+        :param auto_ocr
+        When true (and use_ocr is false), use optical character recognition
+        only for pages without a usable text layer.
+        """
+        if not use_ocr:
+            if auto_ocr:
+                yield from self.iter_pdf_auto(file)
+            else:
+                yield from self.iter_pdf_extraction(file)
+            return
+        try:
+            yield from self.iter_ocr_pages(file, list(range(self.page_count(file))))
+        except Exception as e:
+            self.courtesy_check_ocr_dependencies()
+            raise e
 
 
     def courtesy_check_ocr_dependencies(self) -> None:
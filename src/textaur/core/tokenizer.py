@@ -0,0 +1,87 @@
+"""
+Token counting for textaur.
+
+Counts tokens with tiktoken when it's installed (pip install textaur[tokens])
+and its encoding for the model can be loaded. Otherwise falls back to a rough
+estimate based on the number of characters.
+"""
+from typing import Optional
+
+# rough number of characters per token, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# encoding to use for models tiktoken doesn't know about
+DEFAULT_ENCODING = "o200k_base"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Returns a rough estimate of the number of tokens in a string.
+
+    :param text
+    Text to estimate the token count of.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class Tokenizer:
+    """
+    Counts tokens the way a given model does. The encoding is loaded the
+    first time it's needed.
+    """
+    def __init__(self, model: Optional[str] = None) -> None:
+        """
+        :param model
+        Name of the model to count tokens for. Uses DEFAULT_ENCODING when None
+        or when tiktoken doesn't know the model.
+        """
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+
+
+    @property
+    def exact(self) -> bool:
+        """
+        True when tokens are counted with the model's tokenizer, False when
+        they're estimated from the number of characters.
+        """
+        return self._load() is not None
+
+
+    def count(self, text: str) -> int:
+        """
+        Returns the number of tokens in a string.
+
+        :param text
+        Text to count the tokens of.
+        """
+        encoding = self._load()
+        if encoding is None:
+            return estimate_tokens(text)
+        # special tokens in the text are counted as plain text, the same way
+        # the API treats them in message content
+        return len(encoding.encode_ordinary(text))
+
+
+    def _load(self):
+        """
+        Returns the tiktoken encoding for the model, or None if tiktoken isn't
+        installed or the encoding can't be loaded (tiktoken downloads encodings
+        on first use).
+        """
+        if self._loaded:
+            return self._encoding
+        self._loaded = True
+        try:
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model or "")
+            except KeyError:
+                self._encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+        except Exception:
+            self._encoding = None
+        return self._encoding
@@ -0,0 +1,137 @@
+"""
+Writes linted chunks to the output file in order as they're linted.
+"""
+import os
+from pathlib import Path
+from typing import Optional
+from .strutil import BlankLineCollapser
+
+# suffix of the file output is written to until it's complete
+PARTIAL_SUFFIX = ".partial"
+
+
+class OrderedChunkWriter:
+    """
+    Reassembles chunks that finish in any order into one file. A chunk is
+    written as soon as every chunk before it is done, joined to the previous
+    one with join_str, with consecutive blank lines collapsed across chunk
+    boundaries. Only chunks that finish ahead of an earlier one are held in
+    memory.
+
+    Output goes to <path>.partial, so it can be followed while a long run is
+    going, and is renamed to path once every chunk is done. A file at path is
+    never left half written.
+    """
+    def __init__(self, path: Path, join_str: str = "\n") -> None:
+        """
+        :param path
+        Path of the output file.
+
+        :param join_str
+        String to put between chunks.
+        """
+        self.path = Path(path)
+        self.partial_path = self.path.with_name(f"{self.path.name}{PARTIAL_SUFFIX}")
+        self.join_str = join_str
+        self._next = 0
+        self._done = {}
+        self._collapser = BlankLineCollapser()
+        self._file = None
+        self._wrote_chunk = False
+
+
+    @property
+    def held(self) -> int:
+        """
+        Number of chunks done but waiting on an earlier chunk.
+        """
+        return len(self._done)
+
+
+    def add(self, index: int, text: str) -> None:
+        """
+        Adds a finished chunk, writing it and any chunks held behind it if
+        every chunk before it is done.
+
+        :param index
+        Index of the chunk in the document.
+
+        :param text
+        Text of the chunk.
+        """
+        self._done[index] = text
+        self._write_ready()
+
+
+    def skip(self, index: int) -> None:
+        """
+        Marks a chunk as done without text (ie it couldn't be linted), so the
+        chunks after it don't wait for it.
+
+        :param index
+        Index of the chunk in the document.
+        """
+        self._done[index] = None
+        self._write_ready()
+
+
+    def close(self) -> None:
+        """
+        Writes the end of the output and moves the file into place.
+        """
+        self._write(self._collapser.finish())
+        if self._file is None:
+            self._open()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        os.replace(self.partial_path, self.path)
+
+
+    def discard(self) -> None:
+        """
+        Closes and deletes the partial output, leaving path untouched.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.partial_path.unlink(missing_ok=True)
+
+
+    def _write_ready(self) -> None:
+        """
+        Writes every chunk that no longer waits on an earlier one.
+        """
+        while self._next in self._done:
+            text: Optional[str] = self._done.pop(self._next)
+            self._next += 1
+            if text is None:
+                continue
+            if self._wrote_chunk:
+                text = self.join_str + text
+            self._wrote_chunk = True
+            self._write(self._collapser.feed(text))
+        if self._file is not None:
+            self._file.flush()
+
+
+    def _write(self, text: str) -> None:
+        """
+        Writes text to the partial output, opening it if needed.
+
+        :param text
+        Text to write.
+        """
+        if not text:
+            return
+        if self._file is None:
+            self._open()
+        self._file.write(text)
+
+
+    def _open(self) -> None:
+        """
+        Opens the partial output for writing.
+        """
+        self._file = open(self.partial_path, "w", encoding="utf-8")
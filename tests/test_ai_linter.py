@@ -0,0 +1,338 @@
+import os
+import sys
+import asyncio
+import httpx
+import openai
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.ai_linter import (
+    AILinter,
+    MAX_RETRY_AFTER,
+    RequestScheduler,
+    StreamStalledError,
+    is_retryable_error,
+    retry_after_seconds,
+    retry_delay,
+)
+from textaur.core.cache import DiskCache
+from textaur.core.simulator import LLMSimulator
+from unittest.mock import patch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRequestScheduler:
+
+    def test_limits_concurrent_requests(self):
+        scheduler = RequestScheduler(max_concurrent_requests=2)
+        in_flight, max_in_flight = 0, 0
+
+        async def request():
+            nonlocal in_flight, max_in_flight
+            async with scheduler.slot(tokens=1):
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        async def run():
+            await asyncio.gather(*[request() for _ in range(6)])
+
+        asyncio.run(run())
+        assert max_in_flight == 2
+
+
+    def test_releases_requests_in_order(self):
+        scheduler = RequestScheduler(max_concurrent_requests=1)
+        order = []
+
+        async def request(idx):
+            async with scheduler.slot(tokens=1):
+                order.append(idx)
+                await asyncio.sleep(0)
+
+        async def run():
+            await asyncio.gather(*[request(i) for i in range(5)])
+
+        asyncio.run(run())
+        assert order == [0, 1, 2, 3, 4]
+
+
+    def test_waits_for_token_budget(self):
+        clock = FakeClock()
+        scheduler = RequestScheduler(
+            max_concurrent_requests=10,
+            tokens_per_minute=600,
+            clock=clock,
+        )
+        real_sleep = asyncio.sleep
+        waits = []
+
+        async def fake_sleep(seconds):
+            waits.append(seconds)
+            clock.now += seconds
+            await real_sleep(0)
+
+        async def run():
+            async with scheduler.slot(tokens=600):
+                pass
+            async with scheduler.slot(tokens=60):
+                pass
+
+        with patch("textaur.core.ai_linter.asyncio.sleep", fake_sleep):
+            asyncio.run(run())
+        # the first request uses the whole budget, the second has to wait for
+        # 60 tokens to refill at 10 tokens per second
+        assert sum(waits) == 6
+
+
+    def test_settle_refunds_unused_tokens(self):
+        clock = FakeClock()
+        scheduler = RequestScheduler(tokens_per_minute=100, clock=clock)
+
+        async def run():
+            async with scheduler.slot(tokens=80):
+                pass
+
+        asyncio.run(run())
+        scheduler.settle(reserved=80, used=30)
+        assert scheduler._available_tokens == 70
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.counted = []
+
+    def count(self, text):
+        self.counted.append(text)
+        return len(text)
+
+
+class TestTokenReservation:
+
+    def lint_with_budget(self, tokens_per_minute):
+        tokenizer = CountingTokenizer()
+        simulator = LLMSimulator(latency=0)
+
+        async def run():
+            async with simulator:
+                async with AILinter(api_key="test", base_url=simulator.base_url,
+                                    tokenizer=tokenizer,
+                                    tokens_per_minute=tokens_per_minute) as linter:
+                    return await linter.batch_lint_texts(["first", "second", "third"], "prompt")
+
+        assert all(asyncio.run(run()))
+        return tokenizer.counted
+
+
+    def test_counts_no_tokens_without_a_budget(self):
+        assert self.lint_with_budget(None) == []
+
+
+    def test_counts_the_prompt_once(self):
+        counted = self.lint_with_budget(1_000_000)
+        assert counted.count("prompt") == 1
+        # and every text once
+        assert len(counted) == 4
+        texts = [text.split()[-1] for text in counted if text != "prompt"]
+        assert sorted(texts) == ["first", "second", "third"]
+
+
+class TestSharedClient:
+
+    def test_reuses_client_until_closed(self):
+        async def run():
+            linter = AILinter(api_key="test", max_concurrent_requests=4)
+            first = linter.client
+            assert linter.client is first
+            await linter.close()
+            assert linter._client is None
+            second = linter.client
+            assert second is not first
+            await linter.close()
+
+        asyncio.run(run())
+
+
+def status_error(status_code, headers=None):
+    request = httpx.Request("POST", "https://example.com")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+async def no_sleep(seconds):
+    pass
+
+
+class TestRetries:
+
+    def test_retryable_errors(self):
+        request = httpx.Request("POST", "https://example.com")
+        assert is_retryable_error(status_error(429)) == True
+        assert is_retryable_error(status_error(500)) == True
+        assert is_retryable_error(status_error(503)) == True
+        assert is_retryable_error(openai.APITimeoutError(request=request)) == True
+        assert is_retryable_error(StreamStalledError("stalled")) == True
+        assert is_retryable_error(status_error(400)) == False
+        assert is_retryable_error(status_error(401)) == False
+        assert is_retryable_error(ValueError("nope")) == False
+
+
+    def test_honors_retry_after(self):
+        assert retry_after_seconds(status_error(429, {"retry-after": "7"})) == 7
+        assert retry_after_seconds(status_error(429, {"retry-after-ms": "1500"})) == 1.5
+        assert retry_after_seconds(status_error(429)) == None
+        assert retry_delay(status_error(429, {"retry-after": "7"}), attempt=3) == 7
+        # longer than RETRY_MAX_DELAY, but the server asked for it
+        assert retry_delay(status_error(429, {"retry-after": "120"}), attempt=0) == 120
+
+
+    def test_backoff_grows_with_attempts(self):
+        for attempt in range(4):
+            delay = retry_delay(status_error(500), attempt)
+            assert 0 <= delay <= 2 ** attempt
+
+
+    def test_retries_until_success(self):
+        linter = AILinter(api_key="test", max_retries=3)
+        calls = []
+
+        async def flaky(model, messages, on_delta=None, attempt=0):
+            calls.append(model)
+            if len(calls) < 3:
+                raise status_error(429)
+            return "linted"
+
+        with (
+            patch.object(linter, "_make_single_request", flaky),
+            patch("textaur.core.ai_linter.asyncio.sleep", no_sleep),
+        ):
+            res = asyncio.run(linter.make_request("model", []))
+        assert res == "linted"
+        assert len(calls) == 3
+
+
+    def test_gives_up_after_max_retries(self):
+        linter = AILinter(api_key="test", max_retries=2)
+        calls = []
+
+        async def failing(model, messages, on_delta=None, attempt=0):
+            calls.append(model)
+            raise status_error(503)
+
+        with (
+            patch.object(linter, "_make_single_request", failing),
+            patch("textaur.core.ai_linter.asyncio.sleep", no_sleep),
+        ):
+            try:
+                asyncio.run(linter.make_request("model", []))
+                assert False
+            except openai.APIStatusError:
+                pass
+        assert len(calls) == 3
+
+
+    def test_fails_right_away_when_asked_to_wait_too_long(self):
+        linter = AILinter(api_key="test", max_retries=5)
+        calls, sleeps = [], []
+
+        async def limited(model, messages, on_delta=None, attempt=0):
+            calls.append(model)
+            raise status_error(429, {"retry-after": str(int(MAX_RETRY_AFTER) + 1)})
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+
+        with (
+            patch.object(linter, "_make_single_request", limited),
+            patch("textaur.core.ai_linter.asyncio.sleep", sleep),
+        ):
+            try:
+                asyncio.run(linter.make_request("model", []))
+                assert False
+            except openai.APIStatusError:
+                pass
+        assert len(calls) == 1
+        assert sleeps == []
+
+
+class TestLintCache:
+
+    def test_skips_request_for_cached_text(self, tmp_path):
+        linter = AILinter(api_key="test", cache=DiskCache(tmp_path))
+        calls = []
+
+        async def request(model, messages, on_delta=None):
+            calls.append(messages)
+            return "linted"
+
+        with patch.object(linter, "make_request", request):
+            first = asyncio.run(linter.lint_text("text", "prompt"))
+            second = asyncio.run(linter.lint_text("text", "prompt"))
+            asyncio.run(linter.lint_text("text", "other prompt"))
+        assert first == second == "linted"
+        assert len(calls) == 2
+
+
+    def test_linters_with_different_base_urls_dont_share_entries(self, tmp_path):
+        cache = DiskCache(tmp_path)
+        linters = [
+            AILinter(api_key="test", cache=cache),
+            AILinter(api_key="test", cache=cache, base_url="http://127.0.0.1:8000/v1"),
+            AILinter(api_key="test", cache=cache, base_url="http://127.0.0.1:9000/v1"),
+        ]
+        results = []
+        for idx, linter in enumerate(linters):
+            async def request(model, messages, on_delta=None, idx=idx):
+                return f"linted by {idx}"
+
+            with patch.object(linter, "make_request", request):
+                results.append(asyncio.run(linter.lint_text("text", "prompt")))
+        assert results == ["linted by 0", "linted by 1", "linted by 2"]
+
+
+class TestBatchLintTexts:
+
+    def test_keeps_successful_chunks_when_one_fails(self):
+        linter = AILinter(api_key="test", max_retries=0)
+        failures = {}
+
+        async def lint(text, prompt):
+            if text == "bad":
+                raise status_error(400)
+            return text.upper()
+
+        with patch.object(linter, "lint_text", lint):
+            res = asyncio.run(linter.batch_lint_texts(
+                ["a", "bad", "c"],
+                "prompt",
+                on_failure=failures.__setitem__,
+            ))
+        assert res == ["A", None, "C"]
+        assert list(failures.keys()) == [1]
+
+
+    def test_stream_lint_texts_limits_texts_taken_ahead(self):
+        linter = AILinter(api_key="test", max_concurrent_requests=2)
+        produced, linted = [], []
+
+        async def texts():
+            for i in range(6):
+                produced.append(i)
+                # never more than max_pending texts ahead of the linter
+                assert len(produced) - len(linted) <= 3
+                yield f"text {i}"
+
+        async def lint(text, prompt):
+            await asyncio.sleep(0.01)
+            linted.append(text)
+            return text.upper()
+
+        with patch.object(linter, "lint_text", lint):
+            res = asyncio.run(linter.stream_lint_texts(texts(), "prompt", max_pending=2))
+        assert res == [f"TEXT {i}" for i in range(6)]
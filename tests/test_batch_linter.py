@@ -0,0 +1,191 @@
+import os
+import sys
+import asyncio
+import json
+import httpx
+import openai
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.batch_linter import BatchLinter, BatchRequestError
+from textaur.core.cache import DiskCache
+from unittest.mock import patch
+
+
+class FakeBatchAPI:
+    """
+    Local stand-in for the files and batches endpoints. Batches are "linted"
+    by upper-casing the text, and finish after being polled a few times.
+    """
+    def __init__(self, polls=2, status="completed", fail_texts=(), truncate_texts=()):
+        self.polls = polls
+        self.status = status
+        self.fail_texts = fail_texts
+        self.truncate_texts = truncate_texts
+        self.files = {}
+        self.batches = {}
+        self.uploads = []
+
+
+    def client(self):
+        return openai.AsyncOpenAI(
+            api_key="test",
+            base_url="http://batch.test/v1",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.handle)),
+        )
+
+
+    def handle(self, request):
+        path = request.url.path.removeprefix("/v1")
+        if request.method == "POST" and path == "/files":
+            lines = [json.loads(line) for line in request.content.split(b"\n")
+                     if line.startswith(b'{"custom_id"')]
+            self.uploads.append(lines)
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = lines
+            return httpx.Response(200, json={
+                "id": file_id, "object": "file", "bytes": 0, "created_at": 0,
+                "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+            })
+        if request.method == "POST" and path == "/batches":
+            body = json.loads(request.content)
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {"input": body["input_file_id"], "polls": 0}
+            return httpx.Response(200, json=self.batch(batch_id))
+        if request.method == "GET" and path.startswith("/batches/"):
+            batch_id = path.removeprefix("/batches/")
+            self.batches[batch_id]["polls"] += 1
+            return httpx.Response(200, json=self.batch(batch_id))
+        if request.method == "GET" and path.endswith("/content"):
+            file_id = path.removeprefix("/files/").removesuffix("/content")
+            return httpx.Response(200, text="\n".join(json.dumps(l) for l in self.files[file_id]))
+        return httpx.Response(404, json={"error": {"message": "not found"}})
+
+
+    def batch(self, batch_id):
+        batch = self.batches[batch_id]
+        requests = self.files[batch["input"]]
+        done = batch["polls"] >= self.polls
+        res = {
+            "id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions",
+            "input_file_id": batch["input"], "completion_window": "24h",
+            "created_at": 0, "status": self.status if done else "in_progress",
+            "request_counts": {"total": len(requests), "completed": 0, "failed": 0},
+        }
+        if done and self.status == "completed":
+            outputs, errors = [], []
+            for request in requests:
+                text = request["body"]["messages"][1]["content"].split("\n\n", 1)[1]
+                if text in self.fail_texts:
+                    errors.append({"custom_id": request["custom_id"], "response": {
+                        "status_code": 400,
+                        "body": {"error": {"message": "bad request"}},
+                    }})
+                    continue
+                truncated = text in self.truncate_texts
+                content = text[:len(text) // 2] if truncated else text
+                outputs.append({"custom_id": request["custom_id"], "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{
+                        "message": {"content": content.upper()},
+                        "finish_reason": "length" if truncated else "stop",
+                    }]},
+                }})
+            res["output_file_id"] = f"file-{len(self.files)}"
+            self.files[res["output_file_id"]] = outputs
+            res["error_file_id"] = f"file-{len(self.files)}"
+            self.files[res["error_file_id"]] = errors
+        if done and self.status == "failed":
+            res["errors"] = {"data": [{"message": "invalid input file"}]}
+        return res
+
+
+def make_linter(api, **kwargs):
+    linter = BatchLinter(api_key="test", poll_interval=0, log=lambda msg: None, **kwargs)
+    linter._client = api.client()
+    return linter
+
+
+class TestBatchLinter:
+
+    def test_maps_results_back_in_order(self):
+        api = FakeBatchAPI(fail_texts=["bad"])
+        linter = make_linter(api)
+        failures, successes = {}, {}
+        res = asyncio.run(linter.batch_lint_texts(
+            ["a", "bad", "c", "a"],
+            "prompt",
+            on_failure=failures.__setitem__,
+            on_success=successes.__setitem__,
+        ))
+        assert res == ["A\n\n", None, "C\n\n", "A\n\n"]
+        assert list(failures.keys()) == [1]
+        assert isinstance(failures[1], BatchRequestError)
+        assert sorted(successes.keys()) == [0, 2, 3]
+        # one batch, and the repeated text is only sent once
+        assert len(api.uploads) == 1
+        assert len(api.uploads[0]) == 3
+
+
+    def test_stream_lint_texts_sends_one_batch(self):
+        api = FakeBatchAPI()
+        linter = make_linter(api)
+
+        async def texts():
+            for text in ["x", "y", "z"]:
+                yield text
+
+        res = asyncio.run(linter.stream_lint_texts(texts(), "prompt"))
+        assert res == ["X\n\n", "Y\n\n", "Z\n\n"]
+        assert len(api.uploads) == 1
+
+
+    def test_resumes_by_batch_id(self):
+        api = FakeBatchAPI()
+        first = make_linter(api)
+        requests = {
+            first.cache_key(first.get_lint_messages(text, "prompt")):
+                first.get_lint_messages(text, "prompt")
+            for text in ["a", "b"]
+        }
+        batch_id = asyncio.run(first.submit_batch(requests))
+        # a later run picks the batch up, and only sends the text the batch
+        # doesn't have
+        resumed = make_linter(api, batch_id=batch_id)
+        res = asyncio.run(resumed.batch_lint_texts(["a", "b", "new"], "prompt"))
+        assert res == ["A\n\n", "B\n\n", "NEW\n\n"]
+        assert [len(upload) for upload in api.uploads] == [2, 1]
+
+
+    def test_failed_batch_fails_every_text(self):
+        api = FakeBatchAPI(status="failed")
+        linter = make_linter(api)
+        failures = {}
+        res = asyncio.run(linter.batch_lint_texts(
+            ["a", "b"], "prompt", on_failure=failures.__setitem__))
+        assert res == [None, None]
+        assert "invalid input file" in str(failures[0])
+        assert sorted(failures.keys()) == [0, 1]
+
+
+    def test_uses_and_fills_the_lint_cache(self, tmp_path):
+        api = FakeBatchAPI()
+        cache = DiskCache(tmp_path)
+        asyncio.run(make_linter(api, cache=cache).batch_lint_texts(["a"], "prompt"))
+        res = asyncio.run(make_linter(api, cache=cache).batch_lint_texts(["a", "b"], "prompt"))
+        assert res == ["A\n\n", "B\n\n"]
+        assert [len(upload) for upload in api.uploads] == [1, 1]
+
+
+    def test_relints_truncated_results_in_pieces(self):
+        api = FakeBatchAPI(truncate_texts=["first half\n\nsecond half"])
+        linter = make_linter(api)
+        pieces = []
+
+        async def lint_piece(text, prompt, on_delta, splits_left):
+            pieces.append(text)
+            return f"{text.strip().upper()}\n\n"
+
+        with patch.object(linter, "_lint_text", lint_piece):
+            res = asyncio.run(linter.batch_lint_texts(
+                ["a", "first half\n\nsecond half"], "prompt"))
+        assert res == ["A\n\n", "FIRST HALF\n\nSECOND HALF\n\n"]
+        assert pieces == ["first half\n", "\nsecond half"]
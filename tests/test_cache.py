@@ -0,0 +1,46 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.cache import DiskCache
+
+
+class TestDiskCache:
+
+    def test_set_and_get(self, tmp_path):
+        cache = DiskCache(tmp_path)
+        key = DiskCache.key("model", "prompt", "text")
+        assert cache.get(key) == None
+        cache.set(key, "linted")
+        assert cache.get(key) == "linted"
+        # a new cache in the same directory sees the same entries
+        assert DiskCache(tmp_path).get(key) == "linted"
+
+
+    def test_key_separates_parts(self):
+        assert DiskCache.key("ab", "c") != DiskCache.key("a", "bc")
+        assert DiskCache.key("a", "b") == DiskCache.key("a", "b")
+
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = DiskCache(tmp_path, max_bytes=25)
+        keys = [DiskCache.key(str(i)) for i in range(3)]
+        for idx, key in enumerate(keys):
+            cache.set(key, "x" * 10)
+            # make sure entries have distinct last use times
+            os.utime(cache._path(key), (idx, idx))
+            if idx == 1:
+                # use the first entry so the second is the oldest
+                cache.get(keys[0])
+        assert cache.get(keys[0]) == "x" * 10
+        assert cache.get(keys[1]) == None
+        assert cache.get(keys[2]) == "x" * 10
+        assert cache.size() <= 25
+
+
+    def test_clear(self, tmp_path):
+        cache = DiskCache(tmp_path)
+        key = DiskCache.key("a")
+        cache.set(key, "value")
+        cache.clear()
+        assert cache.get(key) == None
+        assert cache.size() == 0
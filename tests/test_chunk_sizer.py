@@ -0,0 +1,114 @@
+import os
+import sys
+import asyncio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.ai_linter import AILinter
+from textaur.core.chunk_sizer import (
+    ChunkSizer,
+    MAX_ADAPTIVE_CHUNK_CHARS,
+    MIN_ADAPTIVE_CHUNK_CHARS,
+    TARGET_REQUEST_SECONDS,
+)
+from textaur.core.simulator import LLMSimulator
+from textaur.core.strutil import MAX_CHUNK_CHAR_COUNT
+
+
+def make_sizer(tmp_path):
+    return ChunkSizer(tmp_path / "chunk_sizes.json", log=lambda msg: None)
+
+
+def record_all(sizer, samples):
+    for sample in samples:
+        sizer.record(*sample)
+
+
+class TestChunkSizer:
+
+    def test_defaults_to_max_chunk_char_count(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        assert sizer.size("model", "Text") == MAX_CHUNK_CHAR_COUNT
+        assert sizer.learn("model", "Text", MAX_CHUNK_CHAR_COUNT) is None
+
+
+    def test_grows_when_nothing_limits_it(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        sizes = []
+        for _ in range(20):
+            record_all(sizer, [(10_000, 10_000, 1.0, "ok")] * 10)
+            sizes.append(sizer.learn("model", "Text", sizer.size("model", "Text")))
+        assert sizes[0] > MAX_CHUNK_CHAR_COUNT
+        assert sizes == sorted(sizes)
+        assert sizes[-1] == MAX_ADAPTIVE_CHUNK_CHARS
+
+
+    def test_shrinks_when_requests_are_slow(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        # twice the target latency for a full chunk
+        seconds = 2 * TARGET_REQUEST_SECONDS
+        for _ in range(10):
+            record_all(sizer, [(10_000, 10_000, seconds, "ok")] * 10)
+            sizer.learn("model", "Text", 10_000)
+        assert 5_000 <= sizer.size("model", "Text") < 5_100
+
+
+    def test_keeps_output_under_the_limit(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        for _ in range(10):
+            # output is twice the input, and cut short at 8,000 characters
+            record_all(sizer, [(3_000, 6_000, 1.0, "ok")] * 10 + [(10_000, 8_000, 1.0, "truncated")])
+            sizer.learn("model", "Text", 10_000)
+        assert 2_800 <= sizer.size("model", "Text") < 2_900
+
+
+    def test_shrinks_when_requests_fail(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        record_all(sizer, [(10_000, 10_000, 1.0, "ok")] * 8 + [(10_000, 0, 1.0, "error")] * 2)
+        assert sizer.learn("model", "Text", 10_000) < 10_000
+
+
+    def test_keeps_sizes_per_model_and_mode_across_instances(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        record_all(sizer, [(10_000, 10_000, 2 * TARGET_REQUEST_SECONDS, "ok")] * 10)
+        learned = sizer.learn("model", "Screenplay", 10_000)
+        sizer = make_sizer(tmp_path)
+        assert sizer.size("model", "Screenplay") == learned
+        assert sizer.size("model", "Text") == MAX_CHUNK_CHAR_COUNT
+        assert sizer.size("other", "Screenplay") == MAX_CHUNK_CHAR_COUNT
+
+
+    def test_stays_above_half_the_prompt_length(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        for _ in range(20):
+            record_all(sizer, [(1_000, 1_000, 10 * TARGET_REQUEST_SECONDS, "ok")] * 10)
+            sizer.learn("model", "Text", 10_000, prompt_chars=10_000)
+        assert sizer.size("model", "Text", prompt_chars=10_000) == 5_000
+        assert sizer.size("model", "Text", prompt_chars=12_000) == 6_000
+        record_all(sizer, [(1_000, 1_000, 10 * TARGET_REQUEST_SECONDS, "ok")] * 10)
+        sizer.learn("model", "Text", 5_000)
+        assert sizer.size("model", "Text") < 5_000
+        assert sizer.size("model", "Text") >= MIN_ADAPTIVE_CHUNK_CHARS
+
+
+    def test_ignores_unreadable_file(self, tmp_path):
+        (tmp_path / "chunk_sizes.json").write_text("{not json")
+        assert make_sizer(tmp_path).size("model", "Text") == MAX_CHUNK_CHAR_COUNT
+
+
+    def test_learns_from_linter_requests(self, tmp_path):
+        sizer = make_sizer(tmp_path)
+        simulator = LLMSimulator(latency=0, max_output_tokens=40)
+        # about 200 characters (50 tokens) each, so each is cut short once
+        texts = ["\n\n".join(f"paragraph {i} of chunk {c}" for i in range(10)) for c in range(5)]
+
+        async def run():
+            async with simulator:
+                async with AILinter(api_key="test", base_url=simulator.base_url,
+                                    request_observer=sizer.record) as linter:
+                    return await linter.batch_lint_texts(texts, "prompt")
+
+        assert all(asyncio.run(run()))
+        outcomes = [sample[3] for sample in sizer._samples]
+        assert outcomes.count("truncated") == 5
+        assert outcomes.count("ok") == 10
+        # the output limit is about 160 characters, far below the default
+        assert sizer.learn("model", "Text", MAX_CHUNK_CHAR_COUNT) < MAX_CHUNK_CHAR_COUNT
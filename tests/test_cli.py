@@ -0,0 +1,55 @@
+import os
+import sys
+import subprocess
+import click
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.cli.main import expand_input_paths
+
+
+class TestExpandInputPaths:
+
+    def test_expands_directories_and_globs(self, tmp_path):
+        (tmp_path / "docs" / "nested").mkdir(parents=True)
+        for name in ["docs/a.pdf", "docs/nested/b.txt", "docs/notes.md",
+                     "docs/a_extracted_text.txt", "docs/nested/b_linted.txt",
+                     "c.fountain", "d.txt"]:
+            (tmp_path / name).write_text("text")
+        paths = expand_input_paths((
+            str(tmp_path / "docs"),
+            str(tmp_path / "*.fountain"),
+            str(tmp_path / "docs" / "a.pdf"),
+        ))
+        assert [p.relative_to(tmp_path).as_posix() for p in paths] == [
+            "docs/a.pdf", "docs/nested/b.txt", "c.fountain"]
+
+
+    def test_rejects_missing_paths(self, tmp_path):
+        try:
+            expand_input_paths((str(tmp_path / "missing.pdf"),))
+            assert False
+        except click.BadParameter:
+            pass
+
+
+    def test_rejects_inputs_with_the_same_outputs(self, tmp_path):
+        (tmp_path / "a.pdf").write_text("text")
+        (tmp_path / "a.txt").write_text("text")
+        try:
+            expand_input_paths((str(tmp_path),))
+            assert False
+        except click.BadParameter:
+            pass
+
+
+class TestStartup:
+
+    def test_import_loads_no_heavy_dependencies(self):
+        src = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+        loaded = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, textaur.cli.main; print(' '.join(sys.modules))"],
+            env={**os.environ, "PYTHONPATH": src},
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        for module in ["openai", "httpx", "pdfminer", "pdf2image", "pytesseract"]:
+            assert module not in loaded
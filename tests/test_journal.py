@@ -0,0 +1,58 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.journal import ChunkJournal
+
+
+class TestChunkJournal:
+
+    def test_record_and_load(self, tmp_path):
+        journal = ChunkJournal(tmp_path / "journal.jsonl")
+        journal.record(1, "hash1", "linted 1")
+        journal.record(0, "hash0", "linted 0")
+        journal.close()
+        assert ChunkJournal(tmp_path / "journal.jsonl").load() == {
+            0: ("hash0", "linted 0"),
+            1: ("hash1", "linted 1"),
+        }
+
+
+    def test_ignores_partial_last_line(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ChunkJournal(path)
+        journal.record(0, "hash0", "linted 0")
+        journal.close()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"index": 1, "hash": "ha')
+        assert ChunkJournal(path).load() == {0: ("hash0", "linted 0")}
+
+
+    def test_remove(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ChunkJournal(path)
+        journal.record(0, "hash0", "linted 0")
+        journal.remove()
+        assert not path.exists()
+        assert journal.load() == {}
+
+
+    def test_records_chunk_size_alongside_chunks(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ChunkJournal(path)
+        assert journal.load_chunk_size() is None
+        journal.record_chunk_size(4000)
+        journal.record(0, "hash0", "linted 0")
+        journal.close()
+        assert ChunkJournal(path).load_chunk_size() == 4000
+        assert ChunkJournal(path).load() == {0: ("hash0", "linted 0")}
+
+
+    def test_merges_header_lines(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ChunkJournal(path)
+        assert journal.load_header() == {}
+        journal.record_header(model="model", prompt_hash="abc")
+        journal.record(0, "hash0", "linted 0")
+        journal.record_header(prompt_hash="def")
+        journal.close()
+        assert ChunkJournal(path).load_header() == {"model": "model", "prompt_hash": "def"}
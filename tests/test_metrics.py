@@ -0,0 +1,73 @@
+import os
+import sys
+import asyncio
+import json
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.ai_linter import AILinter
+from textaur.core.metrics import Metrics, NullMetrics, percentile
+from textaur.core.simulator import LLMSimulator
+from unittest.mock import patch
+
+
+async def no_sleep(seconds):
+    pass
+
+
+class TestMetrics:
+
+    def test_summarizes_counts_and_timings(self, tmp_path):
+        metrics = Metrics()
+        metrics.count("chunks", 3)
+        metrics.count("chunks")
+        for seconds in [0.1, 0.2, 0.3, 0.4]:
+            metrics.observe("lint.request_latency", seconds)
+        with metrics.time("stage.lint"):
+            pass
+        summary = metrics.summary()
+        assert summary["counts"] == {"chunks": 4}
+        latency = summary["timings"]["lint.request_latency"]
+        assert latency["count"] == 4
+        assert round(latency["total"], 6) == 1.0
+        assert latency["p50"] == 0.2
+        assert latency["p99"] == 0.4
+        assert summary["timings"]["stage.lint"]["count"] == 1
+        metrics.save(tmp_path / "stats.json")
+        assert json.loads((tmp_path / "stats.json").read_text()) == summary
+
+
+    def test_percentile_is_nearest_rank(self):
+        assert percentile([1, 2], 50) == 1
+        assert percentile([1, 2], 51) == 2
+        assert percentile([1, 2, 3, 4, 5, 6], 50) == 3
+        assert percentile([1, 2, 3, 4, 5, 6], 95) == 6
+        assert percentile([1, 2, 3, 4, 5, 6], 0) == 1
+        assert percentile([1, 2, 3, 4, 5, 6], 100) == 6
+
+
+    def test_null_metrics_drop_everything(self):
+        metrics = NullMetrics()
+        metrics.count("chunks")
+        metrics.observe("lint.request_latency", 1.0)
+        with metrics.time("stage.lint"):
+            pass
+        assert metrics.summary() == {"counts": {}, "timings": {}}
+
+
+    def test_linter_reports_requests_retries_and_tokens(self):
+        metrics = Metrics()
+
+        async def run():
+            async with LLMSimulator(latency=0, rate_limit_rate=0.3, reasoning_ratio=0.5) as simulator:
+                async with AILinter(api_key="test", base_url=simulator.base_url,
+                                    max_retries=20, metrics=metrics) as linter:
+                    await linter.batch_lint_texts([f"text {i} " * 50 for i in range(10)], "prompt")
+                return simulator.responses
+
+        with patch("textaur.core.ai_linter.asyncio.sleep", no_sleep):
+            responses = asyncio.run(run())
+        summary = metrics.summary()
+        assert summary["counts"]["lint.requests"] == 10
+        assert summary["counts"]["lint.retries"] == responses[429]
+        assert summary["counts"]["tokens.prompt"] > 0
+        assert summary["counts"]["tokens.reasoning"] > 0
+        assert summary["timings"]["lint.queue_wait"]["count"] == 10 + responses[429]
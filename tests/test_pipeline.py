@@ -0,0 +1,368 @@
+import os
+import sys
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.context import Context
+from textaur.core.ai_linter import LINTING_MODEL
+from textaur.core.journal import ChunkJournal
+from textaur.core.metrics import Metrics
+from textaur.core.pipeline import Pipeline, RunStatus
+from textaur.core.strutil import Strutil
+from textaur.core.textifier import PDF_MAGIC_HEADER, File, FileType
+from unittest.mock import patch
+
+
+def make_context(path, confirm=lambda msg: True):
+    return Context(
+        input_file=str(path),
+        output_path=None,
+        extracted_text_path=None,
+        use_ocr=None,
+        no_lint=None,
+        mode=None,
+        custom_prompt_path=None,
+        progress_fn=lambda msg: None,
+        log=lambda msg: None,
+        confirm=confirm,
+    )
+
+
+def make_pipeline(monkeypatch, **options):
+    # the linter wants a key; set it for this test only
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return Pipeline(
+        log=lambda msg: None,
+        progress_fn=lambda msg: None,
+        use_cache=False,
+        **options,
+    )
+
+
+def write_journal(context, entries, prompt_text=None, max_chunk_chars=None):
+    journal = ChunkJournal(context.journal_file)
+    journal.record_header(
+        model=LINTING_MODEL,
+        base_url=None,
+        prompt_hash=Strutil.text_hash(prompt_text or context.prompt_text),
+    )
+    if max_chunk_chars:
+        journal.record_chunk_size(max_chunk_chars)
+    for idx, (text, linted) in enumerate(entries):
+        journal.record(idx, Strutil.text_hash(text), linted)
+    journal.close()
+
+
+async def upper(self, text, prompt):
+    if "broken" in text:
+        raise ValueError("boom")
+    return text.upper()
+
+
+class TestRunBatch:
+
+    def test_lints_every_file_and_summarizes(self, tmp_path, monkeypatch):
+        inputs = []
+        for name, text in [("a", "first file"), ("b", "second\n\nbroken"), ("c", "third")]:
+            path = tmp_path / f"{name}.txt"
+            path.write_text(text)
+            inputs.append(path)
+        pipeline = make_pipeline(monkeypatch)
+        with patch("textaur.core.ai_linter.AILinter.lint_text", upper):
+            summaries = asyncio.run(pipeline.run_batch(
+                [make_context(path) for path in inputs]))
+        assert [s.status for s in summaries] == [
+            RunStatus.DONE, RunStatus.PARTIAL, RunStatus.DONE]
+        assert (tmp_path / "a_linted.txt").read_text() == "FIRST FILE"
+        assert (tmp_path / "c_linted.txt").read_text() == "THIRD"
+        assert summaries[1].failed_count == 1
+
+
+    def test_skips_declined_files_and_keeps_going(self, tmp_path, monkeypatch):
+        first, second = tmp_path / "a.txt", tmp_path / "b.txt"
+        first.write_text("first")
+        second.write_text("second")
+        (tmp_path / "a_linted.txt").write_text("keep me")
+        contexts = [
+            make_context(first, confirm=lambda msg: False),
+            make_context(second),
+        ]
+        pipeline = make_pipeline(monkeypatch)
+        with patch("textaur.core.ai_linter.AILinter.lint_text", upper):
+            summaries = asyncio.run(pipeline.run_batch(contexts))
+        assert [s.status for s in summaries] == [RunStatus.SKIPPED, RunStatus.DONE]
+        assert (tmp_path / "a_linted.txt").read_text() == "keep me"
+        assert (tmp_path / "b_linted.txt").read_text() == "SECOND"
+
+
+    def test_extracts_next_file_while_linting(self, tmp_path, monkeypatch):
+        inputs = []
+        for name in ["a", "b", "c"]:
+            path = tmp_path / f"{name}.txt"
+            path.write_text(name)
+            inputs.append(path)
+        pipeline = make_pipeline(monkeypatch)
+        events = []
+        extract_chunks = pipeline._extract_chunks
+
+        def extract(context, summary):
+            events.append(f"extract {context.input_file.stem}")
+            return extract_chunks(context, summary)
+
+        async def lint(self, text, prompt):
+            events.append(f"lint {text}")
+            await asyncio.sleep(0.05)
+            events.append(f"linted {text}")
+            return text
+
+        with (
+            patch.object(pipeline, "_extract_chunks", extract),
+            patch("textaur.core.ai_linter.AILinter.lint_text", lint),
+        ):
+            asyncio.run(pipeline.run_batch([make_context(path) for path in inputs]))
+        # each file is extracted before the one before it is done linting
+        assert events.index("extract b") < events.index("linted a")
+        assert events.index("extract c") < events.index("linted b")
+
+
+class TestRun:
+
+    def test_no_lint_creates_no_linter(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        path.write_text("text")
+        context = make_context(path)
+        context.no_lint = True
+        pipeline = make_pipeline(monkeypatch)
+        summary = asyncio.run(pipeline.run(context))
+        assert summary.status == RunStatus.EXTRACTED
+        assert pipeline._ai is None
+
+
+    def test_reports_failed_chunk_and_keeps_the_others_in_order(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        paragraphs = [f"paragraph {i:03d} " + "words " * 50 for i in range(100)]
+        paragraphs[50] += "broken"
+        path.write_text("\n\n".join(paragraphs))
+        context = make_context(path)
+        chunks = Strutil().chunk_generic_text(path.read_text())
+        failed = [idx for idx, chunk in enumerate(chunks) if "broken" in chunk]
+        assert len(chunks) > 2 and len(failed) == 1
+        pipeline = make_pipeline(monkeypatch)
+        with patch("textaur.core.ai_linter.AILinter.lint_text", upper):
+            summary = asyncio.run(pipeline.run(context))
+        assert summary.status == RunStatus.PARTIAL
+        assert (summary.chunk_count, summary.failed_count) == (len(chunks), 1)
+        manifest = json.loads(context.failed_chunks_file.read_text())
+        assert manifest["chunk_count"] == len(chunks)
+        assert [(entry["index"], entry["hash"]) for entry in manifest["failed_chunks"]] == [
+            (failed[0], Strutil.text_hash(chunks[failed[0]]))]
+        assert manifest["failed_chunks"][0]["error"] == "ValueError: boom"
+        output = context.output_file.read_text()
+        linted = [line.split()[1] for line in output.splitlines() if line.startswith("PARAGRAPH")]
+        missing = [paragraph.split()[1] for paragraph in chunks[failed[0]].split("\n\n")]
+        assert "050" in missing
+        assert linted == [f"{i:03d}" for i in range(100) if f"{i:03d}" not in missing]
+
+
+    def test_stats_time_writing_chunks_within_linting(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        path.write_text("\n\n".join(f"paragraph {i} " * 20 for i in range(100)))
+        metrics = Metrics()
+        pipeline = make_pipeline(monkeypatch, metrics=metrics)
+        with patch("textaur.core.ai_linter.AILinter.lint_text", upper):
+            summary = asyncio.run(pipeline.run(make_context(path)))
+        timings = metrics.summary()["timings"]
+        assert timings["stage.lint.write"]["count"] == summary.chunk_count > 1
+        assert timings["stage.write"]["count"] == 1
+        stages = sum(timings[f"stage.{name}"]["total"] for name in ["extract", "chunk", "lint", "write"])
+        assert stages <= summary.seconds
+
+
+class TestResume:
+
+    def run_resumed(self, monkeypatch, context):
+        context.resume = True
+        pipeline = make_pipeline(monkeypatch)
+        with patch("textaur.core.ai_linter.AILinter.lint_text", upper):
+            return asyncio.run(pipeline.run(context))
+
+
+    def test_reuses_journaled_chunks(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        path.write_text("first file")
+        context = make_context(path)
+        write_journal(context, [("first file", "from the journal")])
+        assert self.run_resumed(monkeypatch, context).status == RunStatus.DONE
+        assert context.output_file.read_text() == "from the journal"
+
+
+    def test_relints_chunks_journaled_with_another_prompt(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        path.write_text("first file")
+        context = make_context(path)
+        write_journal(context, [("first file", "from the journal")], prompt_text="old prompt")
+        assert self.run_resumed(monkeypatch, context).status == RunStatus.DONE
+        assert context.output_file.read_text() == "FIRST FILE"
+
+
+class TestAdaptiveChunks:
+
+    def run_adaptive(self, tmp_path, monkeypatch, context, learned=None):
+        if learned:
+            (tmp_path / "chunk_sizes.json").write_text(json.dumps(
+                {f"{LINTING_MODEL}/Text": {"max_chunk_chars": learned, "runs": 1, "requests": 10}}))
+        pipeline = make_pipeline(monkeypatch, cache_dir=tmp_path, adaptive_chunks=True)
+        chunks = []
+
+        async def lint(self, text, prompt):
+            chunks.append(text)
+            return text
+
+        with patch("textaur.core.ai_linter.AILinter.lint_text", lint):
+            summary = asyncio.run(pipeline.run(context))
+        return summary, chunks
+
+
+    def test_splits_at_learned_size(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        path.write_text("\n\n".join(f"paragraph {i} " * 20 for i in range(100)))
+        context = make_context(path)
+        summary, chunks = self.run_adaptive(tmp_path, monkeypatch, context, learned=7000)
+        assert summary.status == RunStatus.DONE
+        assert len(chunks) > 1
+        assert max(len(chunk) for chunk in chunks) <= 7000
+
+
+    def test_resume_splits_at_journaled_size(self, tmp_path, monkeypatch):
+        path = tmp_path / "a.txt"
+        path.write_text("\n\n".join(f"paragraph {i} " * 20 for i in range(100)))
+        context = make_context(path)
+        write_journal(context, [], max_chunk_chars=5000)
+        context.resume = True
+        _, chunks = self.run_adaptive(tmp_path, monkeypatch, context, learned=7000)
+        assert max(len(chunk) for chunk in chunks) <= 5000 < 7000
+
+
+def write_pdf(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(PDF_MAGIC_HEADER + b" not really a pdf")
+    return path
+
+
+def make_pages(count):
+    return [f"page {i:03d}\n\n" + f"line of page {i:03d}\n" * 80 for i in range(count)]
+
+
+class TestStream:
+
+    def test_stream_output_matches_batch_run(self, tmp_path, monkeypatch):
+        pages = make_pages(40)
+
+        def slow_pages(self, file, use_ocr=False, auto_ocr=False):
+            for page in pages:
+                time.sleep(0.002)
+                yield page
+
+        async def shuffled_upper(self, text, prompt):
+            # finish out of order
+            await asyncio.sleep(random.uniform(0, 0.01))
+            return text.upper()
+
+        outputs = {}
+        for stream in [True, False]:
+            run_dir = tmp_path / f"stream_{stream}"
+            run_dir.mkdir()
+            context = make_context(write_pdf(run_dir))
+            pipeline = make_pipeline(monkeypatch, stream=stream)
+            with (
+                patch("textaur.core.textifier.Textifier.iter_pages", slow_pages),
+                patch("textaur.core.textifier.Textifier.extract_text",
+                      lambda self, file, **kwargs: File(FileType.PDF, pages=pages)),
+                patch("textaur.core.ai_linter.AILinter.lint_text", shuffled_upper),
+            ):
+                summary = asyncio.run(pipeline.run(context))
+            assert summary.status == RunStatus.DONE
+            assert summary.chunk_count > 1
+            outputs[stream] = context.output_file.read_text()
+            assert context.extracted_text_file.read_text() == "".join(pages)
+        assert outputs[True] == outputs[False]
+        headings = [line for line in outputs[True].splitlines() if line.startswith("PAGE ")]
+        assert headings == [f"PAGE {i:03d}" for i in range(40)]
+
+
+    def run_endless_stream(self, tmp_path, monkeypatch, stream_lint_texts, stop=None):
+        """
+        Streams a PDF with endless pages through the given stream_lint_texts,
+        calling stop(task) once the first chunks have been taken. Returns
+        whether page extraction had been closed by the time the run ended,
+        and the run's summary or exception.
+        """
+        closed = threading.Event()
+        taken = asyncio.Event()
+
+        def endless_pages(self, file, use_ocr=False, auto_ocr=False):
+            try:
+                for page in itertools.cycle(make_pages(10)):
+                    yield page
+            finally:
+                closed.set()
+
+        async def lint(self, texts, prompt, *args, **kwargs):
+            return await stream_lint_texts(texts, taken)
+
+        async def run():
+            pipeline = make_pipeline(monkeypatch, stream=True)
+            task = asyncio.ensure_future(pipeline.run(make_context(write_pdf(tmp_path))))
+            if stop:
+                await taken.wait()
+                stop(task)
+            try:
+                result = await task
+            except BaseException as e:
+                result = e
+            return closed.is_set(), result
+
+        results = []
+
+        def run_in_thread():
+            with (
+                patch("textaur.core.textifier.Textifier.iter_pages", endless_pages),
+                patch("textaur.core.ai_linter.AILinter.stream_lint_texts", lint),
+            ):
+                results.append(asyncio.run(run()))
+
+        # a worker stuck on put() would keep the run from ever returning
+        thread = threading.Thread(target=run_in_thread, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+        return results[0]
+
+
+    def test_lint_failure_stops_extraction(self, tmp_path, monkeypatch):
+        async def failing(texts, taken):
+            async for _ in texts:
+                taken.set()
+                raise RuntimeError("lint side broke")
+
+        closed, summary = self.run_endless_stream(tmp_path, monkeypatch, failing)
+        assert summary.status == RunStatus.FAILED
+        assert summary.error == "lint side broke"
+        assert closed
+
+
+    def test_cancelling_stops_extraction(self, tmp_path, monkeypatch):
+        async def stuck(texts, taken):
+            # take a chunk, then stop taking them so the queue fills up
+            async for _ in texts:
+                taken.set()
+                await asyncio.Event().wait()
+
+        closed, error = self.run_endless_stream(
+            tmp_path, monkeypatch, stuck, stop=lambda task: task.cancel())
+        assert isinstance(error, asyncio.CancelledError)
+        assert closed
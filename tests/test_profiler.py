@@ -0,0 +1,71 @@
+import os
+import sys
+import asyncio
+import pstats
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.pipeline import RunStatus
+from textaur.core.profiler import StageProfiler, SUMMARY_FILENAME
+from unittest.mock import patch
+from test_pipeline import make_context, make_pipeline, upper
+
+
+class TestStageProfiler:
+
+    def test_writes_pstats_allocations_and_summary(self, tmp_path):
+        profiler = StageProfiler(tmp_path / "profile")
+        for _ in range(2):
+            with profiler.stage("chunk"):
+                blocks = [bytearray(1024) for _ in range(1000)]
+        del blocks
+        profiler.save()
+        assert profiler.stages["chunk"]["runs"] == 2
+        assert profiler.stages["chunk"]["peak"] >= 1024 * 1000
+        stats = pstats.Stats(str(tmp_path / "profile" / "chunk.pstats"))
+        assert stats.total_calls > 0
+        allocations = (tmp_path / "profile" / "chunk_allocations.log").read_text()
+        assert "chunk run 1" in allocations and "chunk run 2" in allocations
+        assert "test_profiler.py" in allocations
+        summary = (tmp_path / "profile" / SUMMARY_FILENAME).read_text()
+        assert summary.startswith("chunk: ")
+        assert "2 run(s)" in summary
+
+
+    def test_nested_stage_is_not_cpu_profiled(self, tmp_path):
+        profiler = StageProfiler(tmp_path)
+        with profiler.stage("lint"):
+            with profiler.stage("write"):
+                pass
+        assert (tmp_path / "lint.pstats").is_file()
+        assert not (tmp_path / "write.pstats").exists()
+        assert (tmp_path / "write_allocations.log").is_file()
+
+
+    def test_nested_stage_keeps_the_outer_peak(self, tmp_path):
+        profiler = StageProfiler(tmp_path)
+        with profiler.stage("lint"):
+            blocks = [bytearray(1024) for _ in range(4000)]
+            del blocks
+            with profiler.stage("write"):
+                blocks = [bytearray(1024) for _ in range(1000)]
+                del blocks
+        lint, write = profiler.stages["lint"]["peak"], profiler.stages["write"]["peak"]
+        assert 1024 * 1000 <= write < 1024 * 2000
+        assert lint >= 1024 * 4000
+        assert "not CPU profiled" in "\n".join(profiler.summary())
+
+
+class TestPipelineProfile:
+
+    def test_profiles_each_stage_next_to_the_output(self, tmp_path, monkeypatch):
+        path = tmp_path / "script.txt"
+        path.write_text("some text\n\nto lint")
+        context = make_context(path)
+        pipeline = make_pipeline(monkeypatch, profile=True)
+        with patch("textaur.core.ai_linter.AILinter.lint_text", upper):
+            summary = asyncio.run(pipeline.run(context))
+        assert summary.status == RunStatus.DONE
+        assert context.profile_dir == tmp_path / "script_linted_profile"
+        for stage in ["extract", "chunk", "lint", "write"]:
+            assert (context.profile_dir / f"{stage}.pstats").is_file()
+            assert (context.profile_dir / f"{stage}_allocations.log").is_file()
+        assert (context.profile_dir / SUMMARY_FILENAME).is_file()
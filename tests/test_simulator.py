@@ -0,0 +1,147 @@
+import os
+import sys
+import asyncio
+import httpx
+import openai
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.ai_linter import AILinter
+from textaur.core.metrics import Metrics
+from textaur.core.simulator import LLMSimulator
+from unittest.mock import patch
+
+
+async def no_sleep(seconds):
+    pass
+
+
+def lint_all(simulator, texts, **linter_options):
+    async def run():
+        async with simulator:
+            async with AILinter(api_key="test", base_url=simulator.base_url,
+                                **linter_options) as linter:
+                return await linter.batch_lint_texts(texts, "prompt")
+
+    return asyncio.run(run())
+
+
+class TestLLMSimulator:
+
+    def test_echoes_text_through_the_linter(self):
+        simulator = LLMSimulator(latency=0)
+        res = lint_all(simulator, ["first text", "second text"])
+        assert res == ["first text\n\n", "second text\n\n"]
+        assert simulator.responses == {200: 2}
+
+
+    def test_scales_output(self):
+        simulator = LLMSimulator(latency=0, output_ratio=2)
+        assert lint_all(simulator, ["abc"]) == ["abcabc\n\n"]
+
+
+    def test_linter_retries_injected_errors(self):
+        simulator = LLMSimulator(latency=0, rate_limit_rate=0.3, server_error_rate=0.2)
+        with patch("textaur.core.ai_linter.asyncio.sleep", no_sleep):
+            res = lint_all(simulator, [f"text {i}" for i in range(30)], max_retries=20)
+        assert res == [f"text {i}\n\n" for i in range(30)]
+        assert simulator.responses[200] == 30
+        assert sum(simulator.responses.values()) > 30
+
+
+    def test_same_seed_gives_same_responses(self):
+        counts = []
+        for _ in range(2):
+            simulator = LLMSimulator(latency=0, rate_limit_rate=0.3, server_error_rate=0.2, seed=7)
+            with patch("textaur.core.ai_linter.asyncio.sleep", no_sleep):
+                lint_all(simulator, [f"text {i}" for i in range(20)], max_retries=20)
+            counts.append(simulator.responses)
+        assert counts[0] == counts[1]
+
+
+    def test_limits_concurrency_seen_by_server(self):
+        simulator = LLMSimulator(latency=0.02, latency_distribution="fixed")
+        lint_all(simulator, [f"text {i}" for i in range(12)], max_concurrent_requests=3)
+        assert simulator.max_in_flight == 3
+
+
+    def test_enforces_requests_per_minute_with_headers(self):
+        async def run():
+            async with LLMSimulator(latency=0, requests_per_minute=1) as simulator:
+                async with httpx.AsyncClient(base_url=simulator.base_url) as client:
+                    body = {"model": "m", "messages": [{"role": "user", "content": "x\n\ny"}]}
+                    first = await client.post("/chat/completions", json=body)
+                    second = await client.post("/chat/completions", json=body)
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first.status_code == 200
+        assert first.headers["x-ratelimit-limit-requests"] == "1"
+        assert second.status_code == 429
+        assert second.headers["x-ratelimit-remaining-requests"] == "0"
+        assert 0 < int(second.headers["retry-after-ms"]) <= 60_000
+
+
+    def test_counts_requests_in_flight_against_limits(self):
+        async def run():
+            async with LLMSimulator(latency=0.2, latency_distribution="fixed",
+                                    requests_per_minute=5) as simulator:
+                async with httpx.AsyncClient(base_url=simulator.base_url) as client:
+                    body = {"model": "m", "messages": [{"role": "user", "content": "x\n\ny"}]}
+                    return await asyncio.gather(*[
+                        client.post("/chat/completions", json=body) for _ in range(20)])
+
+        statuses = [response.status_code for response in asyncio.run(run())]
+        assert statuses.count(200) == 5
+        assert statuses.count(429) == 15
+
+
+class TestStreamedResponses:
+
+    def test_streams_output_as_it_is_generated(self):
+        metrics = Metrics()
+        deltas = []
+
+        async def run():
+            async with LLMSimulator(latency=0) as simulator:
+                async with AILinter(api_key="test", base_url=simulator.base_url,
+                                    stream_responses=True, metrics=metrics) as linter:
+                    return await linter.lint_text(
+                        "text to lint " * 20, "prompt",
+                        on_delta=lambda delta, attempt: deltas.append((delta, attempt)))
+
+        res = asyncio.run(run())
+        assert res == ("text to lint " * 20).strip() + "\n\n"
+        assert len(deltas) > 1
+        assert "".join(delta for delta, _ in deltas) == "text to lint " * 20
+        assert {attempt for _, attempt in deltas} == {0}
+        summary = metrics.summary()
+        assert summary["timings"]["lint.time_to_first_token"]["count"] == 1
+        assert summary["counts"]["tokens.completion"] > 0
+
+
+    def test_retries_stalled_streams(self):
+        metrics = Metrics()
+        simulator = LLMSimulator(latency=0, stall_rate=0.5)
+        texts = [f"text {i} " * 20 for i in range(10)]
+        with patch("textaur.core.ai_linter.asyncio.sleep", no_sleep):
+            res = lint_all(simulator, texts, max_retries=20, stream_responses=True,
+                           stall_timeout=0.1, metrics=metrics)
+        assert res == [text.strip() + "\n\n" for text in texts]
+        assert metrics.counts["lint.stalls"] > 0
+        assert metrics.counts["lint.retries"] == metrics.counts["lint.stalls"]
+
+
+    def test_relints_truncated_responses_in_pieces(self):
+        metrics = Metrics()
+        simulator = LLMSimulator(latency=0, max_output_tokens=40)
+        # about 200 characters (50 tokens) each, so each has to be split once
+        texts = ["\n\n".join(f"paragraph {i} of chunk {c}" for i in range(10)) for c in range(5)]
+        res = lint_all(simulator, texts, stream_responses=True, metrics=metrics)
+        assert [r.split() for r in res] == [t.split() for t in texts]
+        assert metrics.counts["lint.truncated"] == 5
+        assert metrics.counts["lint.truncation_splits"] == 5
+        assert metrics.counts["lint.requests"] == 15
+
+
+    def test_fails_text_that_cannot_be_split(self):
+        simulator = LLMSimulator(latency=0, truncation_rate=1)
+        assert lint_all(simulator, ["abcdefgh"]) == [None]
@@ -1,7 +1,16 @@
 import os
+import random
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
-from textaur.core.strutil import Strutil
+from textaur.core.strutil import (
+    Strutil,
+    BlankLineCollapser,
+    LineIndex,
+    LINE_SCENE_HEADING,
+    LINE_TRANSITION,
+    LINE_PAGE_NUMBER,
+    LINE_EMPTYISH,
+)
 
 class TestChunkStrsByCharCount:
     """
@@ -53,6 +62,14 @@ class TestChunkStrsByCharCount:
         assert chunks == ["abz", "cdef"]
 
 
+    def test_counts_join_str_after_leading_empty_string(self):
+        # joining "" and "ab" adds a join_str too, so "cd" doesn't fit
+        strs = ["", "ab", "cd"]
+        chunks = self.strutil.chunk_strs_by_char_count(strs, max_char_count=6)
+        assert chunks == ["\n\nab", "cd"]
+        assert all(len(chunk) <= 6 for chunk in chunks)
+
+
 class TestChunkScreenplayText:
     strutil = Strutil()
     scene_heading_input = f"""INT. LOCATION - DAY
@@ -117,6 +134,33 @@ Something exciting."""
         assert res == self.mixed_output
 
 
+    def test_matches_split_by_line_type_passes(self):
+        """
+        The single pass chunker should give the same chunks as splitting by
+        scene heading, then transition, then page number with split_by_*.
+        """
+        def reference(text, max_chars):
+            chunks = self.strutil.split_by_scene_heading(text)
+            chunks = list(self.strutil.flatten([
+                c if len(c) <= max_chars else self.strutil.split_by_scene_transition(c)
+                for c in chunks
+            ]))
+            chunks = list(self.strutil.flatten([
+                c if len(c) <= max_chars else self.strutil.split_by_page_number(c)
+                for c in chunks
+            ]))
+            return self.strutil.chunk_strs_by_char_count(chunks, max_chars)
+
+        lines = ["INT. HOUSE - DAY", ".ext park", "CUT TO:", "FADE IN:", "12.",
+                 "iv", "", "  ", "LARRY", "Oh no.", "A long line of action.",
+                 "SMASH CUT TO:"]
+        rng = random.Random(0)
+        for _ in range(500):
+            text = "\n".join(rng.choice(lines) for _ in range(rng.randint(0, 40)))
+            max_chars = rng.randint(1, 200)
+            assert self.strutil.chunk_screenplay_text(text, max_chars) == reference(text, max_chars)
+
+
 class TestChunkGenericText:
     strutil = Strutil()
     page_numbered_input = f"""End of some previous page.
@@ -153,6 +197,129 @@ Instead of a page break, an empty line."""
         assert res == self.mixed_output
 
 
+class WordTokenizer:
+    """
+    Counts every whitespace separated word as one token.
+    """
+    def count(self, text):
+        return len(text.split())
+
+
+class TestChunkByTokens:
+    strutil = Strutil(tokenizer=WordTokenizer())
+
+    def test_chunk_pages_by_tokens(self):
+        pages = ["one two", "three four five", "six", "seven eight nine ten"]
+        res = self.strutil.chunk_pages(pages, max_chunk_tokens=6)
+        # join_str has no words, so it costs no tokens
+        assert res == ["one two\n\nthree four five\n\nsix", "seven eight nine ten"]
+
+
+    def test_ignores_char_count_when_measuring_tokens(self):
+        pages = ["a" * 50, "b" * 50]
+        res = self.strutil.chunk_pages(pages, max_chunk_chars=10, max_chunk_tokens=2)
+        assert res == ["a" * 50 + "\n\n" + "b" * 50]
+
+
+    def test_chunk_screenplay_text_by_tokens(self):
+        res = self.strutil.chunk_screenplay_text(
+            TestChunkScreenplayText.scene_heading_input,
+            max_chunk_tokens=3,
+        )
+        assert res == TestChunkScreenplayText.scene_heading_output
+
+
+    def test_chunk_generic_text_by_tokens(self):
+        res = self.strutil.chunk_generic_text(
+            TestChunkGenericText.page_numbered_input,
+            max_chunk_tokens=100,
+        )
+        assert res == ["\n\n".join(TestChunkGenericText.page_numbered_output)]
+
+
+    def test_iter_chunk_pages_consumes_generator(self):
+        pages = (p for p in ["a b", "c d", "e f"])
+        res = list(self.strutil.iter_chunk_pages(pages, max_chunk_tokens=4))
+        assert res == ["a b\n\nc d", "e f"]
+
+
+class TestLineIndex:
+    text = "FADE IN:\nINT. ROOM - DAY\nHello.\n\n12.\nINT. BUS CUT TO:\n-"
+
+    def test_flags_every_kind_of_each_line(self):
+        index = LineIndex(self.text)
+        lines = [self.text[o:].split("\n")[0] for o in index.offsets]
+        assert lines == ["FADE IN:", "INT. ROOM - DAY", "", "12.", "INT. BUS CUT TO:", "-"]
+        assert list(index.flags) == [
+            LINE_TRANSITION,
+            LINE_SCENE_HEADING,
+            LINE_EMPTYISH,
+            LINE_PAGE_NUMBER,
+            LINE_SCENE_HEADING | LINE_TRANSITION,
+            LINE_EMPTYISH,
+        ]
+
+
+    def test_split_slices_original_text(self):
+        index = LineIndex(self.text)
+        ranges = index.split(0, index.end, LINE_SCENE_HEADING)
+        assert [index.slice(*r) for r in ranges] == self.strutil_split(self.text)
+        # splitting part of the text never splits before its first line
+        start, end = ranges[1]
+        assert index.split(start, end, LINE_SCENE_HEADING) == [(start, end)]
+
+
+    def test_only_indexes_requested_kinds(self):
+        index = LineIndex(self.text, kinds=LINE_PAGE_NUMBER)
+        assert list(index.flags) == [LINE_PAGE_NUMBER]
+        try:
+            index.split(0, index.end, LINE_EMPTYISH)
+            assert False
+        except ValueError:
+            pass
+
+
+    def test_empty_text(self):
+        index = LineIndex("")
+        assert index.split(0, index.end, LINE_EMPTYISH) == [(0, 1)]
+        assert index.slice(0, 1) == ""
+
+
+    @staticmethod
+    def strutil_split(text):
+        return Strutil().split_by_line_type(text, Strutil().line_is_scene_heading)
+
+
+class TestSplitInTwo:
+    strutil = Strutil()
+
+    def test_prefers_scene_headings_near_the_middle(self):
+        text = ("INT. HOUSE - DAY\n\nBob talks.\n\n"
+                "EXT. YARD - NIGHT\n\nHe walks a lot.\n\n"
+                "INT. CAR - DAY\n\nDriving and more.")
+        first, second = self.strutil.split_in_two(text)
+        assert first + second == text
+        assert second.startswith("EXT. YARD") or second.startswith("INT. CAR")
+
+
+    def test_falls_back_to_lines_then_spaces(self):
+        assert self.strutil.split_in_two("line one here\nline two here\nline three") == [
+            "line one here\n", "line two here\nline three"]
+        assert self.strutil.split_in_two("abcd efgh") == ["abcd ", "efgh"]
+        assert self.strutil.split_in_two("abcdefgh") == ["abcd", "efgh"]
+
+
+    def test_ignores_boundaries_far_from_the_middle(self):
+        text = "a\n\n" + "word " * 20
+        first, second = self.strutil.split_in_two(text)
+        assert len(first) > len(text) // 4
+        assert first + second == text
+
+
+    def test_keeps_tiny_text_whole(self):
+        assert self.strutil.split_in_two("x") == ["x"]
+
+
 class TestSplitByLineType:
     strutil = Strutil()
     input = f"""1
@@ -371,6 +538,22 @@ class TestRemoveConsecutiveBlankLines:
         assert self.strutil.remove_consecutive_blank_lines(self.input) == self.output
 
 
+class TestBlankLineCollapser:
+
+    def test_matches_remove_consecutive_blank_lines(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = "".join(rng.choice(["\n", "a", " ", "bc"]) for _ in range(rng.randint(0, 30)))
+            collapser = BlankLineCollapser()
+            res, i = "", 0
+            while i < len(text):
+                j = i + rng.randint(0, 5)
+                res += collapser.feed(text[i:j])
+                i = j
+            res += collapser.finish()
+            assert res == Strutil().remove_consecutive_blank_lines(text)
+
+
 class TestFlatten:
     strutil = Strutil()
     input = [1, [2, [3, [4, [5, [6, 7]]]]]]
@@ -1,9 +1,13 @@
 import os
 import sys
+import threading
+import time
 from pathlib import Path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 from textaur.core.textifier import Textifier, PDF_MAGIC_HEADER, FileType
+from textaur.core.cache import DiskCache
 from unittest.mock import patch, mock_open, MagicMock
+from concurrent.futures import ThreadPoolExecutor
 from pdfminer.layout import LTTextContainer, LTTextLineHorizontal
 
 mock_open_pdf = mock_open(read_data=PDF_MAGIC_HEADER)
@@ -86,7 +90,7 @@ class TestPdfTextExtractionWithoutOCR:
         fake_container = MagicMock(spec=LTTextContainer)
         fake_container.__iter__.return_value = [fake_line1, fake_line2]
 
-        with patch("textaur.core.textifier.extract_pages", return_value=[[fake_container]]):
+        with patch("pdfminer.high_level.extract_pages", return_value=[[fake_container]]):
             pages = self.textifier.text_from_pdf_extraction(file=Path("whatever"))
 
         assert isinstance(pages, list)
@@ -94,6 +98,20 @@ class TestPdfTextExtractionWithoutOCR:
         assert pages[0] == "Hello Cruel World"
 
 
+    def test_parallel_extraction_keeps_page_order(self):
+        textifier = Textifier(extract_workers=3)
+        extracted = lambda file, start, stop: [f"page {i}" for i in range(start, stop)]
+
+        with (
+            patch("textaur.core.textifier.Textifier.page_count", return_value=20),
+            patch("textaur.core.textifier._extract_page_range", extracted),
+            patch("textaur.core.textifier.ProcessPoolExecutor", ThreadPoolExecutor),
+        ):
+            pages = textifier.text_from_pdf_extraction(file=Path("whatever"))
+
+        assert pages == [f"page {i}" for i in range(20)]
+
+
 class TestPdfTextExtractionWithOCR:
     textifier = Textifier()
 
@@ -101,10 +119,137 @@ class TestPdfTextExtractionWithOCR:
         converted_pages = ["converted", "pages"]
 
         with (
-            patch("textaur.core.textifier.convert_from_path", return_value=converted_pages),
-            patch("textaur.core.textifier.pytesseract.image_to_string", lambda x: x)
+            patch("textaur.core.textifier.Textifier.page_count", return_value=2),
+            patch("pdf2image.convert_from_path", return_value=converted_pages),
+            patch("pytesseract.image_to_string", lambda x: x)
         ):
             pages = self.textifier.text_from_pdf_ocr(file=Path("whatever"))
 
         assert pages == converted_pages
 
+
+    def test_renders_pages_in_windows(self):
+        textifier = Textifier(ocr_window=3)
+        converted_pages = [f"page {i}" for i in range(7)]
+        render = MagicMock(side_effect=lambda file, first_page, last_page, **kwargs:
+                           converted_pages[first_page - 1:last_page])
+
+        with (
+            patch("textaur.core.textifier.Textifier.page_count", return_value=7),
+            patch("pdf2image.convert_from_path", render),
+            patch("pytesseract.image_to_string", lambda x: x)
+        ):
+            pages = textifier.text_from_pdf_ocr(file=Path("whatever"))
+
+        assert pages == converted_pages
+        # never more than 3 pages rendered at once
+        ranges = [(c.kwargs["first_page"], c.kwargs["last_page"]) for c in render.call_args_list]
+        assert ranges == [(1, 3), (4, 6), (7, 7)]
+
+
+    def test_parallel_ocr_keeps_page_order(self):
+        textifier = Textifier(ocr_workers=4)
+        converted_pages = [f"page {i}" for i in range(10)]
+        progress = []
+        textifier.progress_fn = progress.append
+
+        render = lambda file, first_page, last_page, **kwargs: converted_pages[first_page - 1:last_page]
+
+        with (
+            patch("textaur.core.textifier.Textifier.page_count", return_value=10),
+            patch("pdf2image.convert_from_path", render),
+            patch("textaur.core.textifier.ProcessPoolExecutor", ThreadPoolExecutor),
+            patch("pytesseract.image_to_string", lambda x: x.upper()),
+        ):
+            pages = textifier.text_from_pdf_ocr(file=Path("whatever"))
+
+        assert pages == [p.upper() for p in converted_pages]
+        assert progress[-2] == "\rConverting page 10/10"
+
+
+    def test_more_workers_than_window_keeps_window_pages_in_memory(self):
+        textifier = Textifier(ocr_workers=8, ocr_window=3)
+        converted_pages = [f"page {i}" for i in range(12)]
+        lock = threading.Lock()
+        in_memory = [0]
+        most_in_memory = [0]
+
+        def render(file, first_page, last_page, **kwargs):
+            images = converted_pages[first_page - 1:last_page]
+            with lock:
+                in_memory[0] += len(images)
+                most_in_memory[0] = max(most_in_memory[0], in_memory[0])
+            time.sleep(0.02)
+            return images
+
+        def image_to_string(image):
+            with lock:
+                in_memory[0] -= 1
+            return image
+
+        with (
+            patch("textaur.core.textifier.Textifier.page_count", return_value=12),
+            patch("pdf2image.convert_from_path", render),
+            patch("textaur.core.textifier.ProcessPoolExecutor", ThreadPoolExecutor),
+            patch("pytesseract.image_to_string", image_to_string),
+        ):
+            pages = textifier.text_from_pdf_ocr(file=Path("whatever"))
+
+        assert pages == converted_pages
+        assert 1 < most_in_memory[0] <= 3
+
+
+class TestAutoOCR:
+    textifier = Textifier(log=lambda x: x)
+    good_page = "INT. HOUSE - DAY\nDavid dives headfirst onto the small bed."
+
+    def test_usable_text_layer(self):
+        assert self.textifier.text_layer_is_usable(self.good_page) == True
+
+
+    def test_unusable_text_layers(self):
+        assert self.textifier.text_layer_is_usable("") == False
+        assert self.textifier.text_layer_is_usable("  \n 12 \n") == False
+        assert self.textifier.text_layer_is_usable("(cid:12)(cid:7)" * 20) == False
+        assert self.textifier.text_layer_is_usable("\ue000\ue001 ab" * 10) == False
+
+
+    def test_ocrs_only_failing_pages(self):
+        extracted = [self.good_page, "", self.good_page, "(cid:3)" * 30]
+        ocr = MagicMock(side_effect=lambda file, idxs: iter([f"ocr {i}" for i in idxs]))
+
+        with (
+            patch("textaur.core.textifier.Textifier.text_from_pdf_extraction", return_value=extracted),
+            patch("textaur.core.textifier.Textifier.iter_ocr_pages", ocr),
+        ):
+            pages = self.textifier.text_from_pdf_auto(file=Path("whatever"))
+
+        assert pages == [self.good_page, "ocr 1", self.good_page, "ocr 3"]
+        ocr.assert_called_once_with(Path("whatever"), [1, 3])
+
+
+class TestPageCache:
+
+    def test_skips_cached_pages(self, tmp_path):
+        pdf = tmp_path / "doc.pdf"
+        pdf.write_bytes(PDF_MAGIC_HEADER + b" contents")
+        textifier = Textifier(log=lambda x: x, cache=DiskCache(tmp_path / "cache"))
+        extracted = []
+
+        def extract(file, page_indices):
+            extracted.append(list(page_indices))
+            for idx in page_indices:
+                yield f"page {idx}"
+
+        with (
+            patch("textaur.core.textifier.Textifier.page_count", return_value=4),
+            patch("textaur.core.textifier.Textifier._iter_extracted_pages", lambda self, f, p: extract(f, p)),
+        ):
+            first = textifier.text_from_pdf_extraction(pdf)
+            second = textifier.text_from_pdf_extraction(pdf)
+            # a different file doesn't reuse the cached pages
+            pdf.write_bytes(PDF_MAGIC_HEADER + b" other contents")
+            third = textifier.text_from_pdf_extraction(pdf)
+
+        assert first == second == third == [f"page {i}" for i in range(4)]
+        assert extracted == [[0, 1, 2, 3], [0, 1, 2, 3]]
@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.tokenizer import Tokenizer, estimate_tokens
+from unittest.mock import patch
+
+
+class FakeEncoding:
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+class FakeTiktoken:
+    def __init__(self, known_models=()):
+        self.known_models = known_models
+        self.loaded = []
+
+    def encoding_for_model(self, model):
+        if model not in self.known_models:
+            raise KeyError(model)
+        self.loaded.append(model)
+        return FakeEncoding()
+
+    def get_encoding(self, name):
+        self.loaded.append(name)
+        return FakeEncoding()
+
+
+class TestTokenizer:
+
+    def test_counts_with_model_encoding(self):
+        tiktoken = FakeTiktoken(known_models=["some-model"])
+        with patch.dict(sys.modules, {"tiktoken": tiktoken}):
+            tokenizer = Tokenizer("some-model")
+            assert tokenizer.count("three little words") == 3
+            assert tokenizer.exact == True
+        assert tiktoken.loaded == ["some-model"]
+
+
+    def test_uses_default_encoding_for_unknown_model(self):
+        tiktoken = FakeTiktoken()
+        with patch.dict(sys.modules, {"tiktoken": tiktoken}):
+            assert Tokenizer("new-model").count("a b") == 2
+        assert tiktoken.loaded == ["o200k_base"]
+
+
+    def test_estimates_without_tiktoken(self):
+        with patch.dict(sys.modules, {"tiktoken": None}):
+            tokenizer = Tokenizer("some-model")
+            assert tokenizer.count("x" * 40) == estimate_tokens("x" * 40)
+            assert tokenizer.exact == False
+
+
+    def test_estimates_when_encoding_fails_to_load(self):
+        tiktoken = FakeTiktoken(known_models=["some-model"])
+        def offline(model):
+            raise ConnectionError("no network")
+        tiktoken.encoding_for_model = offline
+        with patch.dict(sys.modules, {"tiktoken": tiktoken}):
+            tokenizer = Tokenizer("some-model")
+            assert tokenizer.count("x" * 40) == estimate_tokens("x" * 40)
@@ -0,0 +1,56 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+from textaur.core.strutil import Strutil
+from textaur.core.writer import OrderedChunkWriter
+
+
+class TestOrderedChunkWriter:
+
+    def test_writes_chunks_in_order_as_they_become_ready(self, tmp_path):
+        path = tmp_path / "out.txt"
+        writer = OrderedChunkWriter(path)
+        writer.add(1, "b")
+        # chunk 1 has to wait for chunk 0
+        assert writer.held == 1
+        assert not writer.partial_path.exists()
+        writer.add(0, "a")
+        assert writer.held == 0
+        # everything but the unfinished last line is visible already
+        assert writer.partial_path.read_text() == "a"
+        assert not path.exists()
+        writer.add(2, "c")
+        writer.close()
+        assert path.read_text() == "a\nb\nc"
+        assert not writer.partial_path.exists()
+
+
+    def test_skipped_chunks_are_left_out(self, tmp_path):
+        path = tmp_path / "out.txt"
+        writer = OrderedChunkWriter(path)
+        writer.add(2, "c")
+        writer.skip(1)
+        writer.add(0, "a")
+        writer.close()
+        assert path.read_text() == "a\nc"
+
+
+    def test_collapses_blank_lines_across_chunks(self, tmp_path):
+        path = tmp_path / "out.txt"
+        chunks = ["one\n\n", "\n\ntwo\n", "  \n", "three\n\n\n"]
+        writer = OrderedChunkWriter(path)
+        for idx in reversed(range(len(chunks))):
+            writer.add(idx, chunks[idx])
+        writer.close()
+        expected = Strutil().remove_consecutive_blank_lines("\n".join(chunks))
+        assert path.read_text() == expected
+
+
+    def test_discard_leaves_existing_output_alone(self, tmp_path):
+        path = tmp_path / "out.txt"
+        path.write_text("previous run")
+        writer = OrderedChunkWriter(path)
+        writer.add(0, "a\nb")
+        writer.discard()
+        assert path.read_text() == "previous run"
+        assert not writer.partial_path.exists()